@@ -14,7 +14,8 @@ def add_cors_headers_response_callback(event):
         'Access-Control-Allow-Methods': 'GET,POST,PUT,DELETE,OPTIONS',
         'Access-Control-Allow-Headers': 'Content-Type,Authorization,X-Requested-With,Accept,Origin',
         'Access-Control-Allow-Credentials': 'true',
-        'Access-Control-Max-Age': '86400'  # 24 hours
+        'Access-Control-Max-Age': '86400',  # 24 hours
+        'Access-Control-Expose-Headers': 'ETag,Last-Modified,X-Next-Cursor'
     })
     # Jika ini adalah respons preflight, pastikan status code adalah 200
     if event.request.method == 'OPTIONS':
@@ -53,6 +54,15 @@ def main(global_config, **settings):
         
         config.include('pyramid_jinja2')
         config.include('.models')
+        config.include('.security')
+        config.include('.tasks')
+        config.include('.catalog')
+        config.include('.search')
+        config.include('.availability')
+        config.include('.pricing')
+        config.include('.stats')
+        config.include('.notifications')
+        config.include('.conditional')
         config.include('.routes')
         
         # Add CORS support - simplify the approach
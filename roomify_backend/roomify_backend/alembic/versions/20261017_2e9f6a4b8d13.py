@@ -0,0 +1,32 @@
+"""add keyset pagination indexes
+
+Revision ID: 2e9f6a4b8d13
+Revises: 8c4d1f0e7b52
+Create Date: 2026-10-17 11:26:54.330871
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '2e9f6a4b8d13'
+down_revision = '8c4d1f0e7b52'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_bookings_created_at_id', 'bookings', ['created_at', 'id'], unique=False)
+    op.create_index('ix_bookings_user_id_created_at_id', 'bookings', ['user_id', 'created_at', 'id'], unique=False)
+    op.create_index('ix_users_created_at_id', 'users', ['created_at', 'id'], unique=False)
+    op.create_index('ix_rooms_created_at_id', 'rooms', ['created_at', 'id'], unique=False)
+    op.create_index('ix_notifications_user_id_created_at_id', 'notifications', ['user_id', 'created_at', 'id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_notifications_user_id_created_at_id', table_name='notifications')
+    op.drop_index('ix_rooms_created_at_id', table_name='rooms')
+    op.drop_index('ix_users_created_at_id', table_name='users')
+    op.drop_index('ix_bookings_user_id_created_at_id', table_name='bookings')
+    op.drop_index('ix_bookings_created_at_id', table_name='bookings')
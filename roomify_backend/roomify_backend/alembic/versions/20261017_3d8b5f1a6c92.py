@@ -0,0 +1,52 @@
+"""add rate rules and room rates
+
+Revision ID: 3d8b5f1a6c92
+Revises: c6d2a8e4f075
+Create Date: 2026-10-17 15:12:47.204613
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3d8b5f1a6c92'
+down_revision = 'c6d2a8e4f075'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('rate_rules',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('room_id', sa.Integer(), nullable=True),
+    sa.Column('name', sa.String(length=100), nullable=False),
+    sa.Column('start_date', sa.Date(), nullable=True),
+    sa.Column('end_date', sa.Date(), nullable=True),
+    sa.Column('weekdays', sa.String(length=20), nullable=True),
+    sa.Column('price', sa.Float(), nullable=True),
+    sa.Column('multiplier', sa.Float(), nullable=True),
+    sa.Column('priority', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['room_id'], ['rooms.id'], name=op.f('fk_rate_rules_room_id_rooms')),
+    sa.PrimaryKeyConstraint('id', name=op.f('pk_rate_rules'))
+    )
+    op.create_index(op.f('ix_rate_rules_room_id'), 'rate_rules', ['room_id'], unique=False)
+    op.create_table('room_rates',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('room_id', sa.Integer(), nullable=False),
+    sa.Column('date', sa.Date(), nullable=False),
+    sa.Column('price', sa.Float(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['room_id'], ['rooms.id'], name=op.f('fk_room_rates_room_id_rooms')),
+    sa.PrimaryKeyConstraint('id', name=op.f('pk_room_rates'))
+    )
+    op.create_index('ix_room_rates_room_id_date', 'room_rates', ['room_id', 'date'], unique=True)
+
+
+def downgrade():
+    op.drop_index('ix_room_rates_room_id_date', table_name='room_rates')
+    op.drop_table('room_rates')
+    op.drop_index(op.f('ix_rate_rules_room_id'), table_name='rate_rules')
+    op.drop_table('rate_rules')
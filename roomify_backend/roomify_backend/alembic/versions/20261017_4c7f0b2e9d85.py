@@ -0,0 +1,28 @@
+"""add rooms.external_id and room import indexes
+
+Revision ID: 4c7f0b2e9d85
+Revises: e5a1c9d3b742
+Create Date: 2026-10-17 18:05:37.642958
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4c7f0b2e9d85'
+down_revision = 'e5a1c9d3b742'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('rooms', sa.Column('external_id', sa.String(length=64), nullable=True))
+    op.create_index('ix_rooms_external_id', 'rooms', ['external_id'], unique=True)
+    op.create_index('ix_rooms_name', 'rooms', ['name'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_rooms_name', table_name='rooms')
+    op.drop_index('ix_rooms_external_id', table_name='rooms')
+    op.drop_column('rooms', 'external_id')
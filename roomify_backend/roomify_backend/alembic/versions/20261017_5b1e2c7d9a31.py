@@ -0,0 +1,31 @@
+"""add revoked_tokens table
+
+Revision ID: 5b1e2c7d9a31
+Revises: 061dabad9c0a
+Create Date: 2026-10-17 09:12:40.118204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5b1e2c7d9a31'
+down_revision = '061dabad9c0a'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('revoked_tokens',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('jti', sa.String(length=32), nullable=False),
+    sa.Column('expires_at', sa.DateTime(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id', name=op.f('pk_revoked_tokens')),
+    sa.UniqueConstraint('jti', name=op.f('uq_revoked_tokens_jti'))
+    )
+
+
+def downgrade():
+    op.drop_table('revoked_tokens')
@@ -0,0 +1,33 @@
+"""cascade room deletes to rate rules and overrides
+
+Revision ID: 6e2a4d8c1b57
+Revises: f3b9d2a6c418
+Create Date: 2026-10-17 20:31:05.274119
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '6e2a4d8c1b57'
+down_revision = 'f3b9d2a6c418'
+branch_labels = None
+depends_on = None
+
+
+def _replace_fk(table, ondelete):
+    name = 'fk_%s_room_id_rooms' % table
+    with op.batch_alter_table(table) as batch_op:
+        batch_op.drop_constraint(name, type_='foreignkey')
+        batch_op.create_foreign_key(name, 'rooms', ['room_id'], ['id'], ondelete=ondelete)
+
+
+def upgrade():
+    _replace_fk('rate_rules', 'CASCADE')
+    _replace_fk('room_rates', 'CASCADE')
+
+
+def downgrade():
+    _replace_fk('rate_rules', None)
+    _replace_fk('room_rates', None)
@@ -0,0 +1,28 @@
+"""add room search indexes
+
+Revision ID: 7a3c5e9f1d24
+Revises: 2e9f6a4b8d13
+Create Date: 2026-10-17 12:08:37.640152
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7a3c5e9f1d24'
+down_revision = '2e9f6a4b8d13'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_rooms_is_available_room_type_price_per_night', 'rooms', ['is_available', 'room_type', 'price_per_night'], unique=False)
+    op.create_index('ix_rooms_is_available_price_per_night', 'rooms', ['is_available', 'price_per_night'], unique=False)
+    op.create_index('ix_rooms_is_available_capacity_price_per_night', 'rooms', ['is_available', 'capacity', 'price_per_night'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_rooms_is_available_capacity_price_per_night', table_name='rooms')
+    op.drop_index('ix_rooms_is_available_price_per_night', table_name='rooms')
+    op.drop_index('ix_rooms_is_available_room_type_price_per_night', table_name='rooms')
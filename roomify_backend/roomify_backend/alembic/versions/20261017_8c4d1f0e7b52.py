@@ -0,0 +1,26 @@
+"""index token expiry columns
+
+Revision ID: 8c4d1f0e7b52
+Revises: 5b1e2c7d9a31
+Create Date: 2026-10-17 10:03:11.502936
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8c4d1f0e7b52'
+down_revision = '5b1e2c7d9a31'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index(op.f('ix_tokens_expires_at'), 'tokens', ['expires_at'], unique=False)
+    op.create_index(op.f('ix_revoked_tokens_expires_at'), 'revoked_tokens', ['expires_at'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_revoked_tokens_expires_at'), table_name='revoked_tokens')
+    op.drop_index(op.f('ix_tokens_expires_at'), table_name='tokens')
@@ -0,0 +1,30 @@
+"""drop rooms.booking_count in favour of room_stats.bookings
+
+Revision ID: 9b7e3f5a2c60
+Revises: 6e2a4d8c1b57
+Create Date: 2026-10-17 21:02:44.613920
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9b7e3f5a2c60'
+down_revision = '6e2a4d8c1b57'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('rooms') as batch_op:
+        batch_op.drop_column('booking_count')
+
+
+def downgrade():
+    op.add_column('rooms', sa.Column('booking_count', sa.Integer(), server_default='0', nullable=False))
+    op.execute("""
+        UPDATE rooms SET booking_count = (
+            SELECT COUNT(*) FROM bookings WHERE bookings.room_id = rooms.id
+        )
+    """)
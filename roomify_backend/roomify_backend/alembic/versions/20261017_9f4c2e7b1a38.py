@@ -0,0 +1,55 @@
+"""add dashboard stats tables
+
+Revision ID: 9f4c2e7b1a38
+Revises: 3d8b5f1a6c92
+Create Date: 2026-10-17 16:03:29.518840
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9f4c2e7b1a38'
+down_revision = '3d8b5f1a6c92'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('dashboard_stats',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('total_users', sa.Integer(), nullable=False),
+    sa.Column('total_rooms', sa.Integer(), nullable=False),
+    sa.Column('total_bookings', sa.Integer(), nullable=False),
+    sa.Column('total_revenue', sa.Float(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id', name=op.f('pk_dashboard_stats'))
+    )
+    op.create_table('room_stats',
+    sa.Column('room_id', sa.Integer(), nullable=False),
+    sa.Column('bookings', sa.Integer(), nullable=False),
+    sa.Column('revenue', sa.Float(), nullable=False),
+    sa.ForeignKeyConstraint(['room_id'], ['rooms.id'], name=op.f('fk_room_stats_room_id_rooms'), ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('room_id', name=op.f('pk_room_stats'))
+    )
+    # Start from the current data; the application keeps it up to date
+    op.execute("""
+        INSERT INTO dashboard_stats (id, total_users, total_rooms, total_bookings, total_revenue)
+        SELECT 1,
+               (SELECT COUNT(*) FROM users),
+               (SELECT COUNT(*) FROM rooms),
+               (SELECT COUNT(*) FROM bookings),
+               (SELECT COALESCE(SUM(total_price), 0) FROM bookings)
+    """)
+    op.execute("""
+        INSERT INTO room_stats (room_id, bookings, revenue)
+        SELECT rooms.id, COUNT(bookings.id), COALESCE(SUM(bookings.total_price), 0)
+        FROM rooms LEFT OUTER JOIN bookings ON bookings.room_id = rooms.id
+        GROUP BY rooms.id
+    """)
+
+
+def downgrade():
+    op.drop_table('room_stats')
+    op.drop_table('dashboard_stats')
@@ -0,0 +1,32 @@
+"""add users.unread_notifications
+
+Revision ID: a8d3f6c1e274
+Revises: 4c7f0b2e9d85
+Create Date: 2026-10-17 19:02:37.518204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a8d3f6c1e274'
+down_revision = '4c7f0b2e9d85'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('users', sa.Column('unread_notifications', sa.Integer(), server_default='0', nullable=False))
+    op.create_index('ix_notifications_user_id_is_read', 'notifications', ['user_id', 'is_read'], unique=False)
+    op.execute("""
+        UPDATE users SET unread_notifications = (
+            SELECT COUNT(*) FROM notifications
+            WHERE notifications.user_id = users.id AND notifications.is_read = false
+        )
+    """)
+
+
+def downgrade():
+    op.drop_index('ix_notifications_user_id_is_read', table_name='notifications')
+    op.drop_column('users', 'unread_notifications')
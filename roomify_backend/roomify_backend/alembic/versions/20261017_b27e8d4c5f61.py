@@ -0,0 +1,33 @@
+"""add booking rollups
+
+Revision ID: b27e8d4c5f61
+Revises: 9f4c2e7b1a38
+Create Date: 2026-10-17 16:48:12.730165
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b27e8d4c5f61'
+down_revision = '9f4c2e7b1a38'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Filled by the backfill_roomify_backend_rollups console script
+    op.create_table('booking_rollups',
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('room_id', sa.Integer(), nullable=False),
+    sa.Column('status', sa.String(length=20), nullable=False),
+    sa.Column('bookings', sa.Integer(), nullable=False),
+    sa.Column('nights', sa.Integer(), nullable=False),
+    sa.Column('revenue', sa.Float(), nullable=False),
+    sa.PrimaryKeyConstraint('day', 'room_id', 'status', name=op.f('pk_booking_rollups'))
+    )
+
+
+def downgrade():
+    op.drop_table('booking_rollups')
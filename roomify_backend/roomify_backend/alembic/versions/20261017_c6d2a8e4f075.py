@@ -0,0 +1,24 @@
+"""add booking date-range index
+
+Revision ID: c6d2a8e4f075
+Revises: 7a3c5e9f1d24
+Create Date: 2026-10-17 13:41:05.912388
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c6d2a8e4f075'
+down_revision = '7a3c5e9f1d24'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_bookings_room_id_check_in_date_check_out_date', 'bookings', ['room_id', 'check_in_date', 'check_out_date'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_bookings_room_id_check_in_date_check_out_date', table_name='bookings')
@@ -0,0 +1,36 @@
+"""make notifications.is_read not null
+
+Revision ID: d4f8a2b6e913
+Revises: 9b7e3f5a2c60
+Create Date: 2026-10-17 21:20:17.385042
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd4f8a2b6e913'
+down_revision = '9b7e3f5a2c60'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute("UPDATE notifications SET is_read = false WHERE is_read IS NULL")
+    with op.batch_alter_table('notifications') as batch_op:
+        batch_op.alter_column('is_read', existing_type=sa.Boolean(), nullable=False,
+                              server_default=sa.false())
+    # Former NULL rows are unread now
+    op.execute("""
+        UPDATE users SET unread_notifications = (
+            SELECT COUNT(*) FROM notifications
+            WHERE notifications.user_id = users.id AND notifications.is_read = false
+        )
+    """)
+
+
+def downgrade():
+    with op.batch_alter_table('notifications') as batch_op:
+        batch_op.alter_column('is_read', existing_type=sa.Boolean(), nullable=True,
+                              server_default=None)
@@ -0,0 +1,29 @@
+"""add rooms.booking_count
+
+Revision ID: e5a1c9d3b742
+Revises: b27e8d4c5f61
+Create Date: 2026-10-17 17:21:54.086417
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5a1c9d3b742'
+down_revision = 'b27e8d4c5f61'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('rooms', sa.Column('booking_count', sa.Integer(), server_default='0', nullable=False))
+    op.execute("""
+        UPDATE rooms SET booking_count = (
+            SELECT COUNT(*) FROM bookings WHERE bookings.room_id = rooms.id
+        )
+    """)
+
+
+def downgrade():
+    op.drop_column('rooms', 'booking_count')
@@ -0,0 +1,38 @@
+"""add outbox
+
+Revision ID: f3b9d2a6c418
+Revises: a8d3f6c1e274
+Create Date: 2026-10-17 19:48:12.903556
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f3b9d2a6c418'
+down_revision = 'a8d3f6c1e274'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('outbox',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('event', sa.String(length=50), nullable=False),
+    sa.Column('channel', sa.String(length=20), nullable=False),
+    sa.Column('payload', sa.Text(), nullable=False),
+    sa.Column('status', sa.String(length=20), nullable=False),
+    sa.Column('attempts', sa.Integer(), nullable=False),
+    sa.Column('available_at', sa.DateTime(), nullable=False),
+    sa.Column('last_error', sa.Text(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('processed_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id', name=op.f('pk_outbox'))
+    )
+    op.create_index('ix_outbox_status_available_at_id', 'outbox', ['status', 'available_at', 'id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_outbox_status_available_at_id', table_name='outbox')
+    op.drop_table('outbox')
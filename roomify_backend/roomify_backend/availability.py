@@ -0,0 +1,232 @@
+"""Date-range availability of rooms.
+
+Stays are half-open intervals ``[check_in, check_out)``: a booking that
+checks out on a day does not block a new check-in on that same day.
+Cancelled bookings never block a room.
+
+``OccupancyCalendar`` answers month views from per-room day bitmaps that
+are built on first request and dropped whenever a booking of the room
+commits (a new booking or a status change).
+"""
+from collections import OrderedDict
+import calendar
+from datetime import datetime, timedelta
+import threading
+import weakref
+
+from sqlalchemy import and_, exists, inspect
+
+from . import models
+from .cache import on_commit
+
+
+def parse_date(value):
+    if not isinstance(value, str):
+        return value
+    return datetime.strptime(value, '%Y-%m-%d').date()
+
+
+def parse_stay(check_in, check_out):
+    """Return ``(check_in, check_out)`` as dates; raise ValueError unless
+    both are YYYY-MM-DD and check-out is after check-in."""
+    if not check_in or not check_out:
+        raise ValueError('check_in and check_out are required')
+    check_in, check_out = parse_date(check_in), parse_date(check_out)
+    if check_out <= check_in:
+        raise ValueError('check_out must be after check_in')
+    return check_in, check_out
+
+
+def overlapping(check_in, check_out):
+    """SQL condition matching non-cancelled bookings that overlap the stay.
+
+    Served by the ``(room_id, check_in_date, check_out_date)`` index.
+    """
+    Booking = models.Booking
+    return and_(
+        Booking.status != 'cancelled',
+        Booking.check_in_date < check_out,
+        Booking.check_out_date > check_in,
+    )
+
+
+def is_free(check_in, check_out):
+    """SQL condition true for rooms with no booking overlapping the stay."""
+    return ~exists().where(and_(
+        models.Booking.room_id == models.Room.id,
+        overlapping(check_in, check_out),
+    ))
+
+
+def free_rooms(dbsession, check_in, check_out):
+    """Return the available rooms with no booking in ``[check_in, check_out)``,
+    in a single query."""
+    return dbsession.query(models.Room).filter(
+        models.Room.is_available == True,
+        is_free(check_in, check_out)
+    ).order_by(models.Room.price_per_night, models.Room.id).all()
+
+
+def find_conflict(dbsession, room_id, check_in, check_out):
+    """Return a booking of ``room_id`` overlapping the stay, or None."""
+    return dbsession.query(models.Booking).filter(
+        models.Booking.room_id == room_id,
+        overlapping(check_in, check_out)
+    ).first()
+
+
+class RoomLocks(object):
+    """One in-process lock per room, created on demand.
+
+    Locks are only referenced by their holders and waiters, so rooms
+    nobody is booking cost nothing.
+    """
+
+    def __init__(self):
+        self._locks = weakref.WeakValueDictionary()
+        self._guard = threading.Lock()
+
+    def get(self, room_id):
+        with self._guard:
+            lock = self._locks.get(room_id)
+            if lock is None:
+                lock = self._locks[room_id] = threading.Lock()
+            return lock
+
+
+def lock_room(request, room_id, timeout=10):
+    """Serialize booking writes for one room until the request's
+    transaction has finished.
+
+    Takes the room's in-process lock, released by a finished callback
+    after ``pyramid_tm`` commits or aborts, then the database row lock
+    (``SELECT ... FOR UPDATE``, a no-op on SQLite, which already
+    serializes writers).  Bookings for other rooms are never blocked.
+    Returns the locked ``Room``, or None if the lock could not be taken
+    within ``timeout`` seconds.
+    """
+    lock = request.registry['room_locks'].get(room_id)
+    if not lock.acquire(timeout=timeout):
+        return None
+    request.add_finished_callback(lambda request: lock.release())
+    return request.dbsession.query(models.Room).filter(
+        models.Room.id == room_id
+    ).with_for_update().populate_existing().first()
+
+
+def parse_month(value):
+    """Return the first day of a ``YYYY-MM`` month; raise ValueError."""
+    return datetime.strptime(value, '%Y-%m').date()
+
+
+def month_days(first):
+    return calendar.monthrange(first.year, first.month)[1]
+
+
+def occupancy_runs(bits, days):
+    """Run-length encode a day bitmap as ``[first_day, length]`` pairs of
+    booked days (1-based)."""
+    runs = []
+    day = 0
+    while day < days:
+        if bits >> day & 1:
+            start = day
+            while day < days and bits >> day & 1:
+                day += 1
+            runs.append([start + 1, day - start])
+        else:
+            day += 1
+    return runs
+
+
+class OccupancyCalendar(object):
+    """Per-room, per-month occupancy bitmaps.
+
+    Bit ``n`` of a month's bitmap is set when the night starting on day
+    ``n + 1`` is taken by a non-cancelled booking.  At most ``max_rooms``
+    rooms are kept, least recently used first out.
+    """
+
+    def __init__(self, max_rooms=1024):
+        self.max_rooms = max_rooms
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._rooms = OrderedDict()
+        self._version = 0
+        self._lock = threading.Lock()
+
+    def invalidate(self, room_ids):
+        """Drop the months of ``room_ids``; all of them when ``room_ids``
+        contains None (a booking moved between rooms)."""
+        with self._lock:
+            self._version += 1
+            if None in room_ids:
+                self._rooms.clear()
+            else:
+                for room_id in room_ids:
+                    self._rooms.pop(room_id, None)
+
+    def month(self, dbsession, room_id, first):
+        """Return the occupancy bitmap of ``room_id`` for the month that
+        starts on ``first``."""
+        with self._lock:
+            months = self._rooms.get(room_id)
+            if months is not None and first in months:
+                self._rooms.move_to_end(room_id)
+                self.hits += 1
+                return months[first]
+            self.misses += 1
+            version = self._version
+
+        end = first + timedelta(days=month_days(first))
+        bits = 0
+        for check_in, check_out in dbsession.query(
+            models.Booking.check_in_date, models.Booking.check_out_date
+        ).filter(
+            models.Booking.room_id == room_id,
+            overlapping(first, end)
+        ):
+            check_in, check_out = max(check_in, first), min(check_out, end)
+            bits |= ((1 << (check_out - check_in).days) - 1) << (check_in - first).days
+
+        with self._lock:
+            # Do not cache what a concurrent commit may have made stale
+            if version == self._version:
+                self._rooms.setdefault(room_id, {})[first] = bits
+                self._rooms.move_to_end(room_id)
+                while len(self._rooms) > self.max_rooms:
+                    self._rooms.popitem(last=False)
+                    self.evictions += 1
+        return bits
+
+    def stats(self):
+        return {
+            'rooms': len(self._rooms),
+            'max_rooms': self.max_rooms,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
+
+
+def _booking_room_id(booking):
+    # A booking moved to another room also frees the room it left
+    if inspect(booking).attrs.room_id.history.deleted:
+        return None
+    return booking.room_id
+
+
+def includeme(config):
+    """
+    Set up the per-room booking locks and the occupancy calendar.
+
+    Activate this setup using ``config.include('roomify_backend.availability')``.
+
+    """
+    config.registry['room_locks'] = RoomLocks()
+    occupancy = OccupancyCalendar()
+    on_commit(config.registry['dbsession_factory'], models.Booking, occupancy.invalidate,
+              key=_booking_room_id)
+    config.registry['occupancy'] = occupancy
+    config.registry.setdefault('caches', {})['occupancy'] = occupancy
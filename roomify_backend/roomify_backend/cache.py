@@ -0,0 +1,149 @@
+"""In-process caches shared by the views.
+
+Every cache keeps its own hit/miss counters so the effect can be watched
+from ``/api/admin/cache-stats``.
+"""
+from collections import OrderedDict
+from itertools import chain
+import threading
+import time
+import weakref
+
+from sqlalchemy import event
+
+
+class TTLCache(object):
+    """Bounded LRU cache whose entries also expire after a TTL.
+
+    ``set`` accepts an optional absolute ``expires`` (a ``time.time()``
+    value) so an entry never outlives the object it describes.
+    """
+
+    def __init__(self, max_size=1024, ttl=60, clock=time.time):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            value, expires = entry
+            if expires <= self.clock():
+                del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, expires=None):
+        deadline = self.clock() + self.ttl
+        if expires is not None:
+            deadline = min(deadline, expires)
+        with self._lock:
+            self._data[key] = (value, deadline)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def invalidate_many(self, keys):
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        return {
+            'size': len(self._data),
+            'max_size': self.max_size,
+            'ttl': self.ttl,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
+
+
+# Per session factory: {(cls, callback): key}
+_registries = weakref.WeakKeyDictionary()
+
+_PENDING = 'on_commit.pending'
+_TOUCHED = 'on_commit.touched'
+
+
+def _callbacks(session_factory):
+    callbacks = _registries.get(session_factory)
+    if callbacks is None:
+        callbacks = _registries[session_factory] = {}
+
+        def collect(session, flush_context):
+            for (cls, callback), key in list(callbacks.items()):
+                keys = set()
+                for obj in chain(session.new, session.dirty, session.deleted):
+                    if isinstance(obj, cls) and (obj not in session.dirty
+                                                 or session.is_modified(obj)):
+                        keys.add(key(obj))
+                if keys:
+                    session.info.setdefault(_PENDING, {}).setdefault(
+                        (cls, callback), set()).update(keys)
+
+        def fire(session):
+            pending = session.info.pop(_PENDING, {})
+            touched = session.info.pop(_TOUCHED, {})
+            if not (pending or touched):
+                return
+            for cls, callback in list(callbacks):
+                keys = pending.get((cls, callback), set()) | touched.get(cls, set())
+                if keys:
+                    callback(keys)
+
+        def discard(session):
+            session.info.pop(_PENDING, None)
+            session.info.pop(_TOUCHED, None)
+
+        event.listen(session_factory, 'after_flush', collect)
+        event.listen(session_factory, 'after_commit', fire)
+        event.listen(session_factory, 'after_rollback', discard)
+    return callbacks
+
+
+def on_commit(session_factory, cls, callback, key=lambda obj: obj.id):
+    """Call ``callback(keys)`` after every commit of a ``session_factory``
+    session that flushed inserts, updates or deletes of ``cls`` instances.
+
+    ``key`` is evaluated at flush time, while the instances are still
+    loaded, and the set of results is handed to ``callback`` once the
+    transaction commits.  Rolled back changes are discarded.  Registering
+    the same ``cls`` and ``callback`` again replaces ``key``.
+
+    Bulk and Core statements do not go through the flush; report the
+    rows they wrote with ``touched``.
+    """
+    _callbacks(session_factory)[(cls, callback)] = key
+
+
+def touched(session, cls, keys):
+    """Hand ``keys`` to every ``on_commit`` callback registered for ``cls``
+    when ``session`` commits, as if a flush had written them.  ``keys``
+    are what the callbacks' ``key`` functions would have returned."""
+    keys = set(keys)
+    if keys:
+        session.info.setdefault(_TOUCHED, {}).setdefault(cls, set()).update(keys)
@@ -0,0 +1,77 @@
+"""Pre-serialized public room catalog for ``GET /api/rooms``.
+
+Rooms only change through the admin endpoints, so the JSON body is built
+once and reused until a commit touching ``Room`` bumps the version.
+"""
+from collections import namedtuple
+import hashlib
+import json
+import threading
+
+from . import models
+from .cache import on_commit
+
+
+CatalogEntry = namedtuple('CatalogEntry', 'body etag')
+
+
+class RoomCatalog(object):
+    """Versioned cache of the serialized list of available rooms."""
+
+    def __init__(self):
+        self.version = 0
+        self.hits = 0
+        self.misses = 0
+        self._entry = None
+        self._entry_version = -1
+        self._lock = threading.Lock()
+
+    def bump(self, room_ids=None):
+        """Invalidate the cached body."""
+        with self._lock:
+            self.version += 1
+
+    def get(self, dbsession):
+        """Return the ``CatalogEntry`` (JSON body as bytes and its ETag) of
+        the room listing."""
+        entry, entry_version = self._entry, self._entry_version
+        if entry_version == self.version:
+            self.hits += 1
+            return entry
+
+        self.misses += 1
+        # Capture the version before querying: a bump racing with the build
+        # leaves the stored entry stale-marked and it is rebuilt next time.
+        version = self.version
+        rooms = dbsession.query(models.Room).filter(
+            models.Room.is_available == True
+        ).all()
+        body = json.dumps({
+            'success': True,
+            'data': [room.to_dict() for room in rooms]
+        }).encode('utf-8')
+        entry = CatalogEntry(body, hashlib.md5(body).hexdigest())
+        with self._lock:
+            if version >= self._entry_version:
+                self._entry, self._entry_version = entry, version
+        return entry
+
+    def stats(self):
+        return {
+            'version': self.version,
+            'hits': self.hits,
+            'misses': self.misses,
+        }
+
+
+def includeme(config):
+    """
+    Set up the room catalog cache.
+
+    Activate this setup using ``config.include('roomify_backend.catalog')``.
+
+    """
+    catalog = RoomCatalog()
+    on_commit(config.registry['dbsession_factory'], models.Room, catalog.bump)
+    config.registry['room_catalog'] = catalog
+    config.registry.setdefault('caches', {})['room_catalog'] = catalog
@@ -0,0 +1,92 @@
+"""ETag / Last-Modified support for read endpoints.
+
+Views that can derive validators cheaply (``max(updated_at)`` plus a row
+count, or a cached body hash) call ``not_modified`` before serializing
+anything.  Only single rows get a ``Last-Modified``: a collection's
+newest ``updated_at`` goes backwards when its newest row is hidden or
+deleted, so collections are validated by ETag alone.  Every other ``GET`` JSON response gets a body-hash ETag from
+``conditional_tween_factory`` so clients can still revalidate it.
+"""
+from datetime import timezone
+import hashlib
+
+from pyramid.httpexceptions import HTTPNotModified
+
+
+def make_etag(*parts):
+    """Build an opaque ETag from validator parts such as ids, counts and
+    timestamps."""
+    raw = '|'.join('' if part is None else str(part) for part in parts)
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+
+def _as_utc(value):
+    # Model timestamps are naive local times (``datetime.now``).
+    if value is None:
+        return None
+    if value.tzinfo is None:
+        value = value.astimezone()
+    return value.astimezone(timezone.utc).replace(microsecond=0)
+
+
+def set_validators(response, etag, last_modified=None):
+    """Attach validators to ``response``; clients must revalidate."""
+    response.etag = etag
+    if last_modified is not None:
+        response.last_modified = _as_utc(last_modified)
+    response.cache_control = 'no-cache'
+    return response
+
+
+def not_modified(request, etag, last_modified=None):
+    """Return a ``304 Not Modified`` response if the client's copy matches,
+    otherwise None.
+
+    The validators are also set on ``request.response`` so they reach the
+    client when the view goes on to render a full body.
+    """
+    set_validators(request.response, etag, last_modified)
+    if request.if_none_match:
+        fresh = etag in request.if_none_match
+    elif request.if_modified_since is not None and last_modified is not None:
+        fresh = _as_utc(last_modified) <= request.if_modified_since
+    else:
+        fresh = False
+    if not fresh:
+        return None
+    response = HTTPNotModified()
+    set_validators(response, etag, last_modified)
+    return response
+
+
+def conditional_tween_factory(handler, registry):
+    """Give buffered ``GET`` JSON responses without validators a body-hash
+    ETag and answer matching ``If-None-Match`` requests with 304."""
+
+    def conditional_tween(request):
+        response = handler(request)
+        if (request.method in ('GET', 'HEAD')
+                and response.status_int == 200
+                and response.etag is None
+                and response.content_type == 'application/json'
+                and isinstance(response.app_iter, list)):
+            response.md5_etag()
+            if 'Cache-Control' not in response.headers:
+                response.cache_control = 'no-cache'
+            if response.etag in request.if_none_match:
+                not_modified_response = HTTPNotModified()
+                set_validators(not_modified_response, response.etag)
+                return not_modified_response
+        return response
+
+    return conditional_tween
+
+
+def includeme(config):
+    """
+    Install the body-hash ETag fallback.
+
+    Activate this setup using ``config.include('roomify_backend.conditional')``.
+
+    """
+    config.add_tween('roomify_backend.conditional.conditional_tween_factory')
@@ -11,7 +11,12 @@ from .room import Room  # flake8: noqa
 from .booking import Booking  # flake8: noqa
 from .review import Review  # flake8: noqa
 from .token import Token  # flake8: noqa
+from .revoked_token import RevokedToken  # flake8: noqa
 from .notification import Notification  # flake8: noqa
+from .rate import RateRule, RoomRate  # flake8: noqa
+from .stats import DashboardStats, RoomStats  # flake8: noqa
+from .booking_rollup import BookingRollup  # flake8: noqa
+from .outbox import OutboxMessage  # flake8: noqa
 
 # run configure_mappers after defining all of the models to ensure
 # all relationships can be setup
@@ -1,5 +1,6 @@
 from sqlalchemy import (
     Column,
+    Index,
     Integer,
     Text,
     String,
@@ -8,7 +9,7 @@ from sqlalchemy import (
     DateTime,
     ForeignKey,
 )
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import column_property, joinedload, relationship
 from datetime import datetime
 
 from .meta import Base
@@ -20,12 +21,16 @@ class Booking(Base):
     
     id = Column(Integer, primary_key=True)
     user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
-    room_id = Column(Integer, ForeignKey('rooms.id'), nullable=False)
-    check_in_date = Column(Date, nullable=False)
-    check_out_date = Column(Date, nullable=False)
+    # active_history keeps the old value of changed columns available to
+    # the flush listeners of roomify_backend.stats
+    room_id = column_property(Column(Integer, ForeignKey('rooms.id'), nullable=False),
+                              active_history=True)
+    check_in_date = column_property(Column(Date, nullable=False), active_history=True)
+    check_out_date = column_property(Column(Date, nullable=False), active_history=True)
     guests = Column(Integer, nullable=False, default=1)
-    total_price = Column(Float, nullable=False)
-    status = Column(String(20), nullable=False, default='pending')  # pending, confirmed, cancelled, completed
+    total_price = column_property(Column(Float, nullable=False), active_history=True)
+    status = column_property(Column(String(20), nullable=False, default='pending'),  # pending, confirmed, cancelled, completed
+                             active_history=True)
     special_requests = Column(Text, nullable=True)
     created_at = Column(DateTime, default=datetime.now)
     updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
@@ -35,9 +40,20 @@ class Booking(Base):
     room = relationship("Room", back_populates="bookings")
     notifications = relationship("Notification", back_populates="booking")
     
-    def to_dict(self):
-        """Convert Booking object to dictionary for JSON serialization."""
-        return {
+    @classmethod
+    def eager_options(cls):
+        """Query options loading everything ``to_dict`` serializes, in the
+        same query, so listing N bookings costs one query instead of 2N+1."""
+        return (joinedload(cls.user), joinedload(cls.room))
+    
+    def to_dict(self, details=False):
+        """Convert Booking object to dictionary for JSON serialization.
+        
+        With ``details``, also add the ``user_name``, ``room_name`` and
+        ``room_image`` shortcuts used by the booking lists.  Both include
+        the related user and room: query with ``eager_options()``.
+        """
+        data = {
             'id': self.id,
             'user_id': self.user_id,
             'room_id': self.room_id,
@@ -55,3 +71,19 @@ class Booking(Base):
                 'email': self.user.email
             } if self.user else None
         }
+        if details:
+            if self.user:
+                data['user_name'] = self.user.full_name or self.user.username
+            if self.room:
+                data['room_name'] = self.room.name
+                data['room_image'] = self.room.image_url
+        return data
+
+
+# Keyset pagination order, see roomify_backend.pagination
+Index('ix_bookings_created_at_id', Booking.created_at, Booking.id)
+Index('ix_bookings_user_id_created_at_id', Booking.user_id, Booking.created_at, Booking.id)
+
+# Date-range overlap lookups, see roomify_backend.availability
+Index('ix_bookings_room_id_check_in_date_check_out_date',
+      Booking.room_id, Booking.check_in_date, Booking.check_out_date)
@@ -0,0 +1,33 @@
+from sqlalchemy import (
+    Column,
+    Integer,
+    String,
+    Float,
+    Date,
+)
+
+from .meta import Base
+
+
+class BookingRollup(Base):
+    """Bookings made on one day, per room and status, see
+    roomify_backend.stats."""
+    __tablename__ = 'booking_rollups'
+    
+    day = Column(Date, primary_key=True)  # date the booking was created
+    room_id = Column(Integer, primary_key=True)
+    status = Column(String(20), primary_key=True)
+    bookings = Column(Integer, nullable=False, default=0)
+    nights = Column(Integer, nullable=False, default=0)
+    revenue = Column(Float, nullable=False, default=0.0)
+    
+    def to_dict(self):
+        """Convert BookingRollup object to dictionary for JSON serialization."""
+        return {
+            'day': self.day.isoformat(),
+            'room_id': self.room_id,
+            'status': self.status,
+            'bookings': self.bookings,
+            'nights': self.nights,
+            'revenue': self.revenue,
+        }
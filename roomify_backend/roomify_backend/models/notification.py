@@ -1,12 +1,14 @@
 from sqlalchemy import (
     Column,
+    Index,
     Integer,
     Text,
     Boolean,
     ForeignKey,
     DateTime,
+    false,
 )
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import column_property, relationship
 import datetime
 
 from .meta import Base
@@ -17,11 +19,15 @@ class Notification(Base):
     __tablename__ = 'notifications'
     
     id = Column(Integer, primary_key=True)
-    user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
+    # active_history keeps the old value of changed columns available to
+    # the unread counter in roomify_backend.stats
+    user_id = column_property(Column(Integer, ForeignKey('users.id'), nullable=False),
+                              active_history=True)
     booking_id = Column(Integer, ForeignKey('bookings.id'), nullable=True)
     title = Column(Text, nullable=False)
     message = Column(Text, nullable=False)
-    is_read = Column(Boolean, default=False)
+    is_read = column_property(Column(Boolean, nullable=False, default=False, server_default=false()),
+                              active_history=True)
     created_at = Column(DateTime, default=datetime.datetime.utcnow)
     
     # Relationships
@@ -38,3 +44,10 @@ class Notification(Base):
             'is_read': self.is_read,
             'created_at': self.created_at.isoformat() if self.created_at else None
         }
+
+
+# Keyset pagination order, see roomify_backend.pagination
+Index('ix_notifications_user_id_created_at_id', Notification.user_id, Notification.created_at, Notification.id)
+
+# Unread counts and mark-all-read
+Index('ix_notifications_user_id_is_read', Notification.user_id, Notification.is_read)
@@ -0,0 +1,52 @@
+from sqlalchemy import (
+    Column,
+    Index,
+    Integer,
+    String,
+    Text,
+    DateTime,
+)
+from datetime import datetime
+import json
+
+from .meta import Base
+
+
+class OutboxMessage(Base):
+    """Delivery of one event on one channel, written in the transaction
+    that caused it and sent by the worker in roomify_backend.outbox."""
+    __tablename__ = 'outbox'
+    
+    id = Column(Integer, primary_key=True)
+    event = Column(String(50), nullable=False)  # e.g. 'booking.completed'
+    channel = Column(String(20), nullable=False)  # key of the worker's channels
+    payload = Column(Text, nullable=False)  # JSON
+    status = Column(String(20), nullable=False, default='pending')  # pending, processing, done, failed
+    attempts = Column(Integer, nullable=False, default=0)
+    available_at = Column(DateTime, nullable=False, default=datetime.now)  # not retried before
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.now)
+    processed_at = Column(DateTime, nullable=True)
+    
+    @property
+    def data(self):
+        return json.loads(self.payload)
+    
+    def to_dict(self):
+        """Convert OutboxMessage object to dictionary for JSON serialization."""
+        return {
+            'id': self.id,
+            'event': self.event,
+            'channel': self.channel,
+            'payload': self.data,
+            'status': self.status,
+            'attempts': self.attempts,
+            'available_at': self.available_at.isoformat() if self.available_at else None,
+            'last_error': self.last_error,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'processed_at': self.processed_at.isoformat() if self.processed_at else None,
+        }
+
+
+# The worker's claim query: pending (or abandoned processing) messages that are due, oldest first
+Index('ix_outbox_status_available_at_id', OutboxMessage.status, OutboxMessage.available_at, OutboxMessage.id)
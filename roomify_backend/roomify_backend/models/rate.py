@@ -0,0 +1,90 @@
+from sqlalchemy import (
+    Column,
+    Index,
+    Integer,
+    String,
+    Float,
+    Date,
+    DateTime,
+    ForeignKey,
+)
+from sqlalchemy.orm import relationship
+from datetime import datetime
+
+from .meta import Base
+
+
+class RateRule(Base):
+    """Rule-based nightly rate, e.g. weekend or seasonal pricing.
+
+    A rule applies to one room, or to every room when ``room_id`` is NULL,
+    on the nights in ``[start_date, end_date)`` (open-ended when NULL) whose
+    weekday is listed in ``weekdays`` (Monday=0; every day when empty).
+    It either sets a fixed ``price`` or scales the room's base price by
+    ``multiplier``.  The highest ``priority`` wins; room rules beat global
+    ones at equal priority.
+    """
+    __tablename__ = 'rate_rules'
+    
+    id = Column(Integer, primary_key=True)
+    room_id = Column(Integer, ForeignKey('rooms.id', ondelete='CASCADE'), nullable=True, index=True)
+    name = Column(String(100), nullable=False)
+    start_date = Column(Date, nullable=True)
+    end_date = Column(Date, nullable=True)
+    weekdays = Column(String(20), nullable=True)  # e.g. "4,5" for Fri and Sat nights
+    price = Column(Float, nullable=True)
+    multiplier = Column(Float, nullable=True)
+    priority = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime, default=datetime.now)
+    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
+    
+    # Relationships
+    room = relationship('Room')
+    
+    @property
+    def weekday_set(self):
+        if not self.weekdays:
+            return None
+        return {int(day) for day in self.weekdays.split(',') if day.strip()}
+    
+    def rate_for(self, base_price):
+        if self.price is not None:
+            return self.price
+        return base_price * (self.multiplier if self.multiplier is not None else 1.0)
+    
+    def to_dict(self):
+        """Convert RateRule object to dictionary for JSON serialization."""
+        return {
+            'id': self.id,
+            'room_id': self.room_id,
+            'name': self.name,
+            'start_date': self.start_date.isoformat() if self.start_date else None,
+            'end_date': self.end_date.isoformat() if self.end_date else None,
+            'weekdays': sorted(self.weekday_set) if self.weekdays else [],
+            'price': self.price,
+            'multiplier': self.multiplier,
+            'priority': self.priority,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None,
+        }
+
+
+class RoomRate(Base):
+    """Explicit nightly price of one room on one date; beats every rule."""
+    __tablename__ = 'room_rates'
+    
+    id = Column(Integer, primary_key=True)
+    room_id = Column(Integer, ForeignKey('rooms.id', ondelete='CASCADE'), nullable=False)
+    date = Column(Date, nullable=False)
+    price = Column(Float, nullable=False)
+    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
+    
+    def to_dict(self):
+        """Convert RoomRate object to dictionary for JSON serialization."""
+        return {
+            'room_id': self.room_id,
+            'date': self.date.isoformat(),
+            'price': self.price,
+        }
+
+
+Index('ix_room_rates_room_id_date', RoomRate.room_id, RoomRate.date, unique=True)
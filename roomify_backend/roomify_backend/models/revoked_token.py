@@ -0,0 +1,19 @@
+from sqlalchemy import (
+    Column,
+    Integer,
+    String,
+    DateTime,
+)
+from datetime import datetime
+
+from .meta import Base
+
+
+class RevokedToken(Base):
+    """Revoked signed access tokens, kept only until they would expire."""
+    __tablename__ = 'revoked_tokens'
+    
+    id = Column(Integer, primary_key=True)
+    jti = Column(String(32), unique=True, nullable=False)
+    expires_at = Column(DateTime, nullable=False, index=True)
+    created_at = Column(DateTime, default=datetime.now)
@@ -1,5 +1,6 @@
 from sqlalchemy import (
     Column,
+    Index,
     Integer,
     Text,
     String,
@@ -8,7 +9,7 @@ from sqlalchemy import (
     DateTime,
     ForeignKey,
 )
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import query_expression, relationship
 from datetime import datetime
 
 from .meta import Base
@@ -19,6 +20,7 @@ class Room(Base):
     __tablename__ = 'rooms'
     
     id = Column(Integer, primary_key=True)
+    external_id = Column(String(64), nullable=True)  # id in the property's own system, see roomify_backend.room_import
     name = Column(String(100), nullable=False)
     description = Column(Text, nullable=False)
     price_per_night = Column(Float, nullable=False)
@@ -27,6 +29,7 @@ class Room(Base):
     is_available = Column(Boolean, default=True)
     image_url = Column(String(255), nullable=True)
     amenities = Column(Text, nullable=True)  # Stored as JSON string
+    booking_count = query_expression()  # room_stats.bookings, loaded by get_all_rooms_admin
     created_at = Column(DateTime, default=datetime.now)
     updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
     
@@ -41,6 +44,7 @@ class Room(Base):
         """Convert Room object to dictionary for JSON serialization."""
         return {
             'id': self.id,
+            'external_id': self.external_id,
             'name': self.name,
             'description': self.description,
             'price_per_night': self.price_per_night,
@@ -52,3 +56,18 @@ class Room(Base):
             'created_at': self.created_at.isoformat() if self.created_at else None,
             'updated_at': self.updated_at.isoformat() if self.updated_at else None
         }
+
+
+# Keyset pagination order, see roomify_backend.pagination
+Index('ix_rooms_created_at_id', Room.created_at, Room.id)
+
+# Upsert keys of the bulk import, see roomify_backend.room_import
+Index('ix_rooms_external_id', Room.external_id, unique=True)
+Index('ix_rooms_name', Room.name)
+
+# Room search filters, see roomify_backend.search
+Index('ix_rooms_is_available_room_type_price_per_night',
+      Room.is_available, Room.room_type, Room.price_per_night)
+Index('ix_rooms_is_available_price_per_night', Room.is_available, Room.price_per_night)
+Index('ix_rooms_is_available_capacity_price_per_night',
+      Room.is_available, Room.capacity, Room.price_per_night)
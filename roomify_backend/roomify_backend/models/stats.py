@@ -0,0 +1,32 @@
+from sqlalchemy import (
+    Column,
+    Integer,
+    Float,
+    DateTime,
+    ForeignKey,
+)
+from datetime import datetime
+
+from .meta import Base
+
+
+class DashboardStats(Base):
+    """Dashboard totals: a base row plus delta shards that are summed on
+    read, see roomify_backend.stats."""
+    __tablename__ = 'dashboard_stats'
+    
+    id = Column(Integer, primary_key=True)  # 1 is the base row, the rest are shards
+    total_users = Column(Integer, nullable=False, default=0)
+    total_rooms = Column(Integer, nullable=False, default=0)
+    total_bookings = Column(Integer, nullable=False, default=0)
+    total_revenue = Column(Float, nullable=False, default=0.0)
+    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
+
+
+class RoomStats(Base):
+    """Booking count and revenue of one room, see roomify_backend.stats."""
+    __tablename__ = 'room_stats'
+    
+    room_id = Column(Integer, ForeignKey('rooms.id', ondelete='CASCADE'), primary_key=True)
+    bookings = Column(Integer, nullable=False, default=0)
+    revenue = Column(Float, nullable=False, default=0.0)
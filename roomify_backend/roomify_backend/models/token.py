@@ -20,7 +20,7 @@ class Token(Base):
     user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
     token = Column(String(100), unique=True, nullable=False)
     is_admin = Column(Boolean, default=False)
-    expires_at = Column(DateTime, nullable=False)
+    expires_at = Column(DateTime, nullable=False, index=True)
     created_at = Column(DateTime, default=datetime.now)
     
     # Relationships
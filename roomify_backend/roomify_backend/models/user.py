@@ -1,5 +1,6 @@
 from sqlalchemy import (
     Column,
+    Index,
     Integer,
     Text,
     String,
@@ -24,6 +25,7 @@ class User(Base):
     full_name = Column(String(100), nullable=True)
     phone_number = Column(String(20), nullable=True)
     is_admin = Column(Boolean, default=False)
+    unread_notifications = Column(Integer, nullable=False, default=0, server_default='0')  # maintained by roomify_backend.stats
     created_at = Column(DateTime, default=datetime.now)
     updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
     
@@ -42,3 +44,7 @@ class User(Base):
             'is_admin': self.is_admin,
             'created_at': self.created_at.isoformat() if self.created_at else None,
         }
+
+
+# Keyset pagination order, see roomify_backend.pagination
+Index('ix_users_created_at_id', User.created_at, User.id)
@@ -0,0 +1,272 @@
+"""Server-sent events for user notifications.
+
+``GET /api/user/notifications/stream`` keeps a ``text/event-stream``
+response open and pushes every ``Notification`` committed for the user as
+an ``event: notification`` frame whose ``id`` is the notification id.
+
+Committed notifications are announced to an in-process
+``NotificationHub`` keyed by user id (see ``cache.on_commit``).  A
+connected client sleeps on its ``Subscription`` and only reads the
+database when it connects and when the hub wakes it, so an idle stream
+costs a keepalive comment every ``notifications.stream.heartbeat``
+seconds and no queries.  Browsers reconnect on their own after
+``notifications.stream.max_duration`` seconds or a dropped connection
+and send ``Last-Event-ID``; the stream then replays what was missed.
+
+Each open stream holds a server thread, so at most
+``notifications.stream.max_streams`` are open per process; further
+clients get a 503 with ``Retry-After``.  Keep waitress' ``threads``
+comfortably above that limit so ordinary API requests always find a
+free thread.  The hub only hears commits made by this process.
+Notifications written by another worker or a console script reach a
+client when it next reconnects.
+"""
+from collections import defaultdict
+import json
+import logging
+import threading
+import time
+
+from sqlalchemy import func, or_
+
+from . import models
+from .cache import on_commit
+
+log = logging.getLogger(__name__)
+
+RETRY_MS = 3000
+
+
+class Subscription(object):
+    """One client's view of the hub: ids of committed notifications not
+    yet collected with ``wait``."""
+
+    def __init__(self, hub, user_id):
+        self.hub = hub
+        self.user_id = user_id
+        self._ids = set()
+        self._cond = threading.Condition()
+
+    def notify(self, ids):
+        with self._cond:
+            self._ids.update(ids)
+            self._cond.notify()
+
+    def wait(self, timeout):
+        """Block until notifications arrive or ``timeout`` elapses; return
+        their ids (empty on timeout)."""
+        with self._cond:
+            if not self._ids:
+                self._cond.wait(timeout)
+            ids, self._ids = self._ids, set()
+            return ids
+
+    def close(self):
+        self.hub.unsubscribe(self)
+
+
+class NotificationHub(object):
+    """In-process publish/subscribe of committed notifications by user.
+
+    ``heartbeat`` and ``max_duration`` (seconds) are the defaults of the
+    streams reading from it; ``max_streams`` bounds how many are open.
+    """
+
+    def __init__(self, heartbeat=15, max_duration=300, max_streams=8):
+        self.heartbeat = heartbeat
+        self.max_duration = max_duration
+        self.max_streams = max_streams
+        self._subscribers = defaultdict(set)
+        self._lock = threading.Lock()
+        self.streams = 0
+        self.rejected = 0
+        self.published = 0
+        self.delivered = 0
+
+    def open_stream(self):
+        """Reserve a stream slot; False when ``max_streams`` are open."""
+        with self._lock:
+            if self.streams >= self.max_streams:
+                self.rejected += 1
+                return False
+            self.streams += 1
+            return True
+
+    def close_stream(self):
+        with self._lock:
+            self.streams -= 1
+
+    def subscribe(self, user_id):
+        subscription = Subscription(self, user_id)
+        with self._lock:
+            self._subscribers[user_id].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.user_id)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.user_id]
+
+    def publish(self, keys):
+        """Wake the subscribers of every ``(user_id, notification_id)`` in
+        ``keys``."""
+        by_user = defaultdict(set)
+        for user_id, notification_id in keys:
+            by_user[user_id].add(notification_id)
+        with self._lock:
+            targets = [(subscription, by_user[user_id])
+                       for user_id in by_user
+                       for subscription in self._subscribers.get(user_id, ())]
+            self.published += len(keys)
+            self.delivered += len(targets)
+        for subscription, ids in targets:
+            subscription.notify(ids)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'streams': self.streams,
+                'max_streams': self.max_streams,
+                'rejected': self.rejected,
+                'users': len(self._subscribers),
+                'subscribers': sum(len(s) for s in self._subscribers.values()),
+                'published': self.published,
+                'delivered': self.delivered,
+            }
+
+
+def parse_last_event_id(request):
+    """The ``Last-Event-ID`` header (or ``?last_event_id=``) as an int,
+    None when absent; raises ValueError when malformed."""
+    value = request.headers.get('Last-Event-ID') or request.params.get('last_event_id')
+    if not value:
+        return None
+    last_id = int(value)
+    if last_id < 0:
+        raise ValueError('Last-Event-ID must not be negative')
+    return last_id
+
+
+def sse_frame(notification):
+    return ('id: %d\nevent: notification\ndata: %s\n\n' % (
+        notification.id, json.dumps(notification.to_dict()))).encode('utf-8')
+
+
+class EventStream(object):
+    """WSGI ``app_iter`` of one stream holding a slot of ``hub``.
+
+    The slot is given back by ``close``, which the server calls whether or
+    not the body was ever iterated.
+    """
+
+    def __init__(self, hub, frames):
+        self.hub = hub
+        self.frames = frames
+        self._closed = False
+
+    def __iter__(self):
+        return iter(self.frames)
+
+    def close(self):
+        if not self._closed:
+            self._closed = True
+            try:
+                self.frames.close()
+            finally:
+                self.hub.close_stream()
+
+
+def _fetch(session_factory, user_id, after_id, ids=()):
+    """The user's notifications after ``after_id`` or in ``ids``."""
+    Notification = models.Notification
+    condition = Notification.id > after_id
+    if ids:
+        condition = or_(condition, Notification.id.in_(ids))
+    session = session_factory()
+    try:
+        return session.query(Notification).filter(
+            Notification.user_id == user_id,
+            condition
+        ).order_by(Notification.id).all()
+    finally:
+        session.close()
+
+
+def _latest_id(session_factory, user_id):
+    session = session_factory()
+    try:
+        return session.query(func.max(models.Notification.id)).filter(
+            models.Notification.user_id == user_id
+        ).scalar() or 0
+    finally:
+        session.close()
+
+
+def iter_events(session_factory, hub, user_id, last_id=None, heartbeat=None,
+                max_duration=None, clock=time.monotonic):
+    """Yield the SSE frames for ``user_id``'s notifications.
+
+    With ``last_id`` the notifications after it are replayed first;
+    without it the stream starts with the next notification committed.
+    The hub subscription lives as long as the stream: it is taken on the
+    first frame and dropped when the stream ends or the client goes
+    away.
+    """
+    heartbeat = hub.heartbeat if heartbeat is None else heartbeat
+    max_duration = hub.max_duration if max_duration is None else max_duration
+    yield ('retry: %d\n\n' % RETRY_MS).encode('utf-8')
+    if last_id is None:
+        last_id = _latest_id(session_factory, user_id)
+    # Notifications up to the baseline existed before the stream; later
+    # ones are sent once each, even when a concurrent transaction commits
+    # a lower id after a higher one has been sent
+    baseline = last_id
+    sent = set()
+    subscription = hub.subscribe(user_id)
+    try:
+        deadline = clock() + max_duration
+        # Catch up on whatever committed before the subscription
+        unseen = ()
+        pending = True
+        while True:
+            if pending:
+                for notification in _fetch(session_factory, user_id, last_id, unseen):
+                    sent.add(notification.id)
+                    last_id = max(last_id, notification.id)
+                    yield sse_frame(notification)
+            remaining = deadline - clock()
+            if remaining <= 0:
+                return
+            ids = subscription.wait(min(heartbeat, remaining))
+            if not ids:
+                yield b': keepalive\n\n'
+            # Other ids are updates (e.g. marked read) of notifications
+            # that were sent or predate the stream
+            unseen = {i for i in ids if i > baseline and i not in sent}
+            pending = bool(unseen)
+    except Exception:
+        log.exception('Notification stream failed')
+        raise
+    finally:
+        subscription.close()
+
+
+def includeme(config):
+    """
+    Set up the notification hub fed by committed ``Notification`` rows.
+
+    Activate this setup using ``config.include('roomify_backend.notifications')``.
+
+    """
+    settings = config.get_settings()
+    hub = NotificationHub(
+        heartbeat=float(settings.get('notifications.stream.heartbeat', 15)),
+        max_duration=float(settings.get('notifications.stream.max_duration', 300)),
+        max_streams=int(settings.get('notifications.stream.max_streams', 8)),
+    )
+    on_commit(config.registry['dbsession_factory'], models.Notification, hub.publish,
+              key=lambda notification: (notification.user_id, notification.id))
+    config.registry['notification_hub'] = hub
@@ -0,0 +1,200 @@
+"""Transactional outbox for notification fan-out.
+
+Views do not deliver anything themselves: ``enqueue`` adds one ``outbox``
+row per delivery channel to the request's session, so the event is
+recorded if and only if the change that caused it commits.
+
+``OutboxWorker`` drains the table in batches.  A batch is first claimed
+(marked ``processing``) in its own transaction, so concurrent workers,
+whether threads, processes or the console script, never deliver the
+same message twice.  Each claimed message is handed to the callable
+registered for its channel, ``deliver(session, message)``; a channel that raises is retried with exponential backoff
+(``backoff * 2 ** (attempts - 1)`` seconds) until ``max_attempts``, after
+which the message is left ``failed`` with its last error.  Deliveries run
+in a savepoint of the batch transaction, so the in-app channel's
+``Notification`` is inserted exactly once, together with marking the
+message done.  Channels talking to other systems should be idempotent:
+a crash after sending but before the commit sends again.
+
+The worker runs in the app as a ``PeriodicTask`` thread every
+``outbox.worker_interval`` seconds, or from the
+``process_roomify_backend_outbox`` console script.  A claim not finished
+within ``outbox.claim_timeout`` seconds (a worker died) is picked up again.
+"""
+from collections import namedtuple
+from datetime import datetime, timedelta
+import json
+import logging
+import time
+
+from sqlalchemy import update
+
+from . import models
+
+log = logging.getLogger(__name__)
+
+DEFAULT_CHANNELS = ('in_app',)
+
+
+def enqueue(dbsession, event, payload, channels=DEFAULT_CHANNELS):
+    """Record ``event`` for delivery on every channel in ``channels``, in
+    ``dbsession``'s transaction.  Returns the new messages."""
+    messages = [models.OutboxMessage(event=event, channel=channel,
+                                     payload=json.dumps(payload))
+                for channel in channels]
+    dbsession.add_all(messages)
+    return messages
+
+
+def deliver_in_app(session, message):
+    """Store the message as a ``Notification`` for its user."""
+    data = message.data
+    session.add(models.Notification(
+        user_id=data['user_id'],
+        booking_id=data.get('booking_id'),
+        title=data['title'],
+        message=data['message'],
+        is_read=False,
+    ))
+
+
+class MemorySink(object):
+    """Stand-in delivery channel keeping what it was sent in ``sent``.
+
+    The next ``fail_times`` deliveries raise ``error`` instead.
+    """
+
+    def __init__(self, fail_times=0, error='delivery failed'):
+        self.sent = []
+        self.fail_times = fail_times
+        self.error = error
+
+    def __call__(self, session, message):
+        if self.fail_times > 0:
+            self.fail_times -= 1
+            raise RuntimeError(self.error)
+        self.sent.append((message.event, message.data))
+
+
+DrainResult = namedtuple('DrainResult', 'done retried failed elapsed')
+
+
+class OutboxWorker(object):
+    """Deliver due outbox messages through ``channels`` (a mapping of
+    channel name to ``deliver(session, message)``)."""
+
+    def __init__(self, session_factory, channels, batch_size=100, max_attempts=5,
+                 backoff=30, claim_timeout=300, clock=datetime.now):
+        self.session_factory = session_factory
+        self.channels = channels
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.claim_timeout = claim_timeout
+        self.clock = clock
+
+    def _retry_delay(self, attempts):
+        return timedelta(seconds=self.backoff * 2 ** (attempts - 1))
+
+    def _claim(self, session, now):
+        """Mark up to ``batch_size`` due messages ``processing`` and return
+        their ids.
+
+        The UPDATE re-checks that each row is still due, so of two workers
+        racing for a row exactly one gets it back from RETURNING; the
+        claim is committed before anything is delivered.  A claim left by
+        a worker that died is due again after ``claim_timeout`` seconds.
+        """
+        OutboxMessage = models.OutboxMessage
+        due = (OutboxMessage.status.in_(('pending', 'processing')),
+               OutboxMessage.available_at <= now)
+        ids = [row.id for row in session.query(OutboxMessage.id).filter(
+            *due
+        ).order_by(
+            OutboxMessage.available_at, OutboxMessage.id
+        ).limit(self.batch_size).with_for_update(skip_locked=True)]
+        if not ids:
+            return []
+        claimed = session.execute(
+            update(OutboxMessage).where(
+                OutboxMessage.id.in_(ids), *due
+            ).values(
+                status='processing',
+                attempts=OutboxMessage.attempts + 1,
+                available_at=now + timedelta(seconds=self.claim_timeout),
+            ).returning(OutboxMessage.id)
+        ).scalars().all()
+        session.commit()
+        return claimed
+
+    def run_batch(self):
+        """Claim one batch and deliver it in one transaction; returns
+        ``(claimed, done, retried, failed)``."""
+        OutboxMessage = models.OutboxMessage
+        now = self.clock()
+        done = retried = failed = 0
+        session = self.session_factory()
+        try:
+            claimed = self._claim(session, now)
+            if not claimed:
+                return 0, 0, 0, 0
+            messages = session.query(OutboxMessage).filter(
+                OutboxMessage.id.in_(claimed)
+            ).order_by(OutboxMessage.available_at, OutboxMessage.id).all()
+            for message in messages:
+                try:
+                    deliver = self.channels.get(message.channel)
+                    if deliver is None:
+                        raise LookupError('No delivery channel %r' % message.channel)
+                    with session.begin_nested():
+                        deliver(session, message)
+                except Exception as e:
+                    message.last_error = '%s: %s' % (type(e).__name__, e)
+                    if message.attempts >= self.max_attempts:
+                        message.status = 'failed'
+                        message.processed_at = now
+                        failed += 1
+                        log.error('Outbox message %d (%s via %s) failed for good: %s',
+                                  message.id, message.event, message.channel, message.last_error)
+                    else:
+                        message.status = 'pending'
+                        message.available_at = now + self._retry_delay(message.attempts)
+                        retried += 1
+                else:
+                    message.status = 'done'
+                    message.processed_at = now
+                    message.last_error = None
+                    done += 1
+            session.commit()
+            return len(messages), done, retried, failed
+        finally:
+            session.close()
+
+    def drain(self):
+        """Run batches until no message is due; returns a ``DrainResult``."""
+        started = time.monotonic()
+        totals = [0, 0, 0]
+        while True:
+            claimed, done, retried, failed = self.run_batch()
+            totals[0] += done
+            totals[1] += retried
+            totals[2] += failed
+            if claimed < self.batch_size:
+                return DrainResult(totals[0], totals[1], totals[2], time.monotonic() - started)
+
+
+def worker_from_settings(settings, session_factory):
+    """Build the ``OutboxWorker`` described by the ``outbox.*`` settings."""
+    return OutboxWorker(
+        session_factory,
+        {'in_app': deliver_in_app},
+        batch_size=int(settings.get('outbox.batch_size', 100)),
+        max_attempts=int(settings.get('outbox.max_attempts', 5)),
+        backoff=float(settings.get('outbox.backoff', 30)),
+        claim_timeout=float(settings.get('outbox.claim_timeout', 300)),
+    )
+
+
+def channels_from_settings(settings):
+    """Channels every notification event is enqueued on."""
+    return tuple(settings.get('outbox.channels', ' '.join(DEFAULT_CHANNELS)).split())
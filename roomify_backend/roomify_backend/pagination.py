@@ -0,0 +1,57 @@
+"""Keyset (cursor) pagination for list endpoints.
+
+Pages are ordered newest first on ``(created_at, id)`` and the cursor
+encodes the last row of the previous page, so every page is an index
+range scan regardless of how deep the client has paged.
+"""
+import base64
+from datetime import datetime
+
+from sqlalchemy import tuple_
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 500
+
+
+def encode_cursor(created_at, row_id):
+    raw = '%s|%d' % (created_at.isoformat(), row_id)
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor):
+    """Return ``(created_at, id)`` for a cursor; raise ValueError if it is
+    malformed."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8')
+        created_at, row_id = raw.rsplit('|', 1)
+        return datetime.fromisoformat(created_at), int(row_id)
+    except (TypeError, UnicodeError, base64.binascii.Error) as e:
+        raise ValueError('Invalid cursor: %s' % e)
+
+
+def page_params(request):
+    """Return ``(limit, cursor)`` when the client asked for a page, or None
+    when neither ``limit`` nor ``cursor`` was sent (unpaginated, legacy
+    behaviour).  Raises ValueError on bad values."""
+    if 'limit' not in request.params and 'cursor' not in request.params:
+        return None
+    limit = int(request.params.get('limit', DEFAULT_LIMIT))
+    if limit < 1:
+        raise ValueError('limit must be positive')
+    cursor = request.params.get('cursor')
+    return min(limit, MAX_LIMIT), decode_cursor(cursor) if cursor else None
+
+
+def paginate(query, model, limit, cursor=None):
+    """Return ``(rows, next_cursor)`` for one page of ``query``.
+
+    ``next_cursor`` is None on the last page.
+    """
+    query = query.order_by(model.created_at.desc(), model.id.desc())
+    if cursor is not None:
+        query = query.filter(tuple_(model.created_at, model.id) < tuple_(*cursor))
+    rows = query.limit(limit + 1).all()
+    if len(rows) <= limit:
+        return rows, None
+    last = rows[limit - 1]
+    return rows[:limit], encode_cursor(last.created_at, last.id)
@@ -0,0 +1,299 @@
+"""Server-side price quotes.
+
+Nightly rates come from the rate calendar: a per-date ``RoomRate``
+override wins, then the highest-priority matching ``RateRule`` (weekend,
+seasonal, ...), then the room's ``price_per_night``.
+
+``RateCalendar`` precomputes, per room, the prefix sums of the nightly
+rates over the next ``pricing.horizon_days`` days, so the total of any
+stay inside the horizon is one subtraction.  Entries are dropped when a
+room, rule or override commits and rebuilt on the next quote; all rooms
+of a quote request are loaded and built together, so quoting N rooms x M
+stays costs a handful of round-trips.
+"""
+from array import array
+from collections import namedtuple
+from datetime import date, timedelta
+from itertools import accumulate
+import threading
+
+from sqlalchemy import inspect, or_
+
+from . import models
+from .availability import parse_date, parse_stay
+from .cache import on_commit
+
+MAX_QUOTES = 1000
+
+
+def night_rates(room, rules, overrides, start, days):
+    """Return the nightly rates of ``room`` for ``days`` nights from
+    ``start`` as an ``array('d')``.
+
+    ``rules`` may include rules of other rooms, which are ignored;
+    ``overrides`` maps dates to prices.
+    """
+    base = room.price_per_night
+    rates = array('d', [base]) * days
+    end = start + timedelta(days=days)
+    # Paint the lowest precedence first so stronger rules overwrite it
+    applicable = sorted(
+        (rule for rule in rules if rule.room_id in (None, room.id)),
+        key=lambda rule: (rule.priority or 0, rule.room_id is not None),
+    )
+    for rule in applicable:
+        first = max(start, rule.start_date) if rule.start_date else start
+        last = min(end, rule.end_date) if rule.end_date else end
+        weekdays = rule.weekday_set
+        rate = rule.rate_for(base)
+        night = first
+        while night < last:
+            if weekdays is None or night.weekday() in weekdays:
+                rates[(night - start).days] = rate
+            night += timedelta(days=1)
+    for night, price in overrides.items():
+        if start <= night < end:
+            rates[(night - start).days] = price
+    return rates
+
+
+class RoomRates(namedtuple('RoomRates', 'start base_price prefix')):
+    """Prefix sums of one room's nightly rates from ``start``."""
+    __slots__ = ()
+
+    @property
+    def end(self):
+        return self.start + timedelta(days=len(self.prefix) - 1)
+
+    def sum(self, first, last):
+        """Sum of the rates of the nights in ``[first, last)``, which must
+        lie inside the horizon."""
+        return (self.prefix[(last - self.start).days]
+                - self.prefix[(first - self.start).days])
+
+
+class RateCalendar(object):
+    """Per-room cache of precomputed nightly rates."""
+
+    def __init__(self, horizon_days=365, today=date.today):
+        self.horizon_days = horizon_days
+        self.today = today
+        self.builds = 0
+        self.hits = 0
+        self._entries = {}
+        self._version = 0
+        self._lock = threading.Lock()
+
+    def invalidate(self, room_ids=None):
+        """Drop the entries of ``room_ids``; all of them when ``room_ids``
+        is None or contains None (a rule covering every room)."""
+        with self._lock:
+            self._version += 1
+            if room_ids is None or None in room_ids:
+                self._entries = {}
+            else:
+                for room_id in room_ids:
+                    self._entries.pop(room_id, None)
+
+    def _fresh(self, room, start):
+        entry = self._entries.get(room.id)
+        if (entry is not None and entry.start == start
+                and entry.base_price == room.price_per_night):
+            return entry
+        return None
+
+    def load(self, dbsession, rooms):
+        """Return ``{room_id: RoomRates}`` for ``rooms``, building every
+        missing entry with one query for rules and one for overrides."""
+        start = self.today()
+        entries = {}
+        missing = []
+        for room in rooms:
+            entry = self._fresh(room, start)
+            if entry is None:
+                missing.append(room)
+            else:
+                entries[room.id] = entry
+        self.hits += len(entries)
+        if not missing:
+            return entries
+
+        version = self._version
+        end = start + timedelta(days=self.horizon_days)
+        rules, overrides = self._load_rates(
+            dbsession, [room.id for room in missing], start, end)
+        built = {}
+        for room in missing:
+            rates = night_rates(room, rules, overrides.get(room.id, {}),
+                                start, self.horizon_days)
+            built[room.id] = RoomRates(start, room.price_per_night,
+                                       array('d', accumulate(rates, initial=0.0)))
+        with self._lock:
+            self.builds += len(built)
+            # A commit that invalidated entries while we were reading may
+            # have made what we built stale; use it, but do not keep it.
+            if version == self._version:
+                self._entries.update(built)
+        entries.update(built)
+        return entries
+
+    def _load_rates(self, dbsession, room_ids, start, end):
+        rules = dbsession.query(models.RateRule).filter(
+            or_(models.RateRule.room_id.is_(None),
+                models.RateRule.room_id.in_(room_ids)),
+            or_(models.RateRule.start_date.is_(None),
+                models.RateRule.start_date < end),
+            or_(models.RateRule.end_date.is_(None),
+                models.RateRule.end_date > start),
+        ).all()
+        overrides = {}
+        for rate in dbsession.query(models.RoomRate).filter(
+            models.RoomRate.room_id.in_(room_ids),
+            models.RoomRate.date >= start,
+            models.RoomRate.date < end,
+        ):
+            overrides.setdefault(rate.room_id, {})[rate.date] = rate.price
+        return rules, overrides
+
+    def rates(self, dbsession, room, first, last):
+        """Nightly rates of ``room`` for ``[first, last)``, computed directly
+        (no caching); used outside the horizon and for the admin view."""
+        rules, overrides = self._load_rates(dbsession, [room.id], first, last)
+        return night_rates(room, rules, overrides.get(room.id, {}),
+                           first, (last - first).days)
+
+    def total(self, dbsession, room, check_in, check_out):
+        entry = self.load(dbsession, [room])[room.id]
+        first = max(check_in, entry.start)
+        last = min(check_out, entry.end)
+        total = entry.sum(first, last) if first < last else 0.0
+        if check_in < entry.start:
+            total += sum(self.rates(dbsession, room, check_in,
+                                    min(check_out, entry.start)))
+        if check_out > entry.end:
+            total += sum(self.rates(dbsession, room, max(check_in, entry.end),
+                                    check_out))
+        return total
+
+    def stats(self):
+        return {
+            'rooms': len(self._entries),
+            'horizon_days': self.horizon_days,
+            'hits': self.hits,
+            'builds': self.builds,
+        }
+
+
+class PricingEngine(object):
+    """Prices stays; the single source of booking totals."""
+
+    def __init__(self, calendar=None):
+        self.calendar = calendar if calendar is not None else RateCalendar()
+
+    def total(self, dbsession, room, check_in, check_out):
+        """Total price of the nights in ``[check_in, check_out)``."""
+        return round(self.calendar.total(dbsession, room, check_in, check_out), 2)
+
+    def quote(self, dbsession, room, check_in, check_out):
+        nights = (check_out - check_in).days
+        total = self.total(dbsession, room, check_in, check_out)
+        return {
+            'room_id': room.id,
+            'check_in': check_in.isoformat(),
+            'check_out': check_out.isoformat(),
+            'nights': nights,
+            'total_price': total,
+            'average_nightly_rate': round(total / nights, 2),
+        }
+
+    def quote_many(self, dbsession, room_ids, stays):
+        """Quote every room in ``room_ids`` for every ``(check_in, check_out)``
+        in ``stays``.  Unknown room ids are reported, not quoted."""
+        rooms = dbsession.query(models.Room).filter(
+            models.Room.id.in_(set(room_ids))
+        ).all()
+        rooms_by_id = {room.id: room for room in rooms}
+        self.calendar.load(dbsession, rooms)
+        quotes = [self.quote(dbsession, rooms_by_id[room_id], check_in, check_out)
+                  for room_id in room_ids if room_id in rooms_by_id
+                  for check_in, check_out in stays]
+        missing = [room_id for room_id in room_ids if room_id not in rooms_by_id]
+        return quotes, missing
+
+
+def parse_quote_request(json_body):
+    """Validate a quote request body into ``(room_ids, stays)``.
+
+    Raises ValueError with a client-facing message on bad input.
+    """
+    room_ids = json_body.get('room_ids')
+    stays = json_body.get('stays')
+    if not isinstance(room_ids, list) or not room_ids:
+        raise ValueError('room_ids must be a non-empty list')
+    if not isinstance(stays, list) or not stays:
+        raise ValueError('stays must be a non-empty list')
+    if len(room_ids) * len(stays) > MAX_QUOTES:
+        raise ValueError('at most %d room/stay combinations per request' % MAX_QUOTES)
+    room_ids = [int(room_id) for room_id in dict.fromkeys(room_ids)]
+    stays = [parse_stay(stay.get('check_in'), stay.get('check_out')) for stay in stays]
+    return room_ids, stays
+
+
+RULE_FIELDS = ('room_id', 'name', 'start_date', 'end_date', 'weekdays',
+               'price', 'multiplier', 'priority')
+
+
+def apply_rate_rule(rule, json_body):
+    """Copy the rule fields present in ``json_body`` onto ``rule``.
+
+    Raises ValueError with a client-facing message on bad input.
+    """
+    for field in RULE_FIELDS:
+        if field not in json_body:
+            continue
+        value = json_body[field]
+        if field in ('start_date', 'end_date'):
+            value = parse_date(value) if value else None
+        elif field == 'weekdays':
+            days = sorted({int(day) for day in value or []})
+            if any(day < 0 or day > 6 for day in days):
+                raise ValueError('weekdays must be between 0 (Monday) and 6 (Sunday)')
+            value = ','.join(str(day) for day in days) or None
+        elif field in ('price', 'multiplier') and value is not None:
+            value = float(value)
+            if value < 0:
+                raise ValueError('%s must not be negative' % field)
+        elif field in ('room_id', 'priority') and value is not None:
+            value = int(value)
+        setattr(rule, field, value)
+    if not rule.name:
+        raise ValueError('name is required')
+    if (rule.price is None) == (rule.multiplier is None):
+        raise ValueError('exactly one of price and multiplier is required')
+    if rule.start_date and rule.end_date and rule.end_date <= rule.start_date:
+        raise ValueError('end_date must be after start_date')
+
+
+def _rule_room_id(rule):
+    # A rule moved to another room also stales the room it left
+    if inspect(rule).attrs.room_id.history.deleted:
+        return None
+    return rule.room_id
+
+
+def includeme(config):
+    """
+    Set up the pricing engine and its rate calendar.
+
+    Activate this setup using ``config.include('roomify_backend.pricing')``.
+
+    """
+    settings = config.get_settings()
+    calendar = RateCalendar(
+        horizon_days=int(settings.get('pricing.horizon_days', 365)))
+    session_factory = config.registry['dbsession_factory']
+    on_commit(session_factory, models.Room, calendar.invalidate)
+    on_commit(session_factory, models.RoomRate, calendar.invalidate, key=lambda rate: rate.room_id)
+    on_commit(session_factory, models.RateRule, calendar.invalidate, key=_rule_room_id)
+    config.registry['pricing'] = PricingEngine(calendar)
+    config.registry.setdefault('caches', {})['rate_calendar'] = calendar
@@ -0,0 +1,232 @@
+"""Bulk room import.
+
+Rows come from CSV (with a header row) or NDJSON.  Each row is matched
+to an existing room by ``external_id`` when it has one, otherwise by
+``name``, and is inserted or updated accordingly.  A row whose
+``external_id`` is not known yet falls back to the room of the same name
+that has no ``external_id``, which then receives it.  All writes are batched
+``executemany`` statements in the caller's transaction.  Invalid rows are
+reported with their line number and skipped, so a file can be fixed and
+imported again without creating duplicates.
+
+Bulk statements bypass the flush, so the room caches (``on_commit``
+callbacks) and the dashboard stats are told about the rows explicitly.
+"""
+from collections import defaultdict, namedtuple
+import csv
+from datetime import datetime
+import io
+import json
+
+from sqlalchemy import insert, update
+
+from . import models, stats
+from .cache import touched
+
+BATCH_SIZE = 500
+MAX_ROWS = 10000
+
+FORMATS = ('csv', 'ndjson')
+
+# Defaults for new rooms, as in the create_room view
+DEFAULTS = {
+    'description': '',
+    'capacity': 2,
+    'room_type': 'standard',
+    'is_available': True,
+    'image_url': '',
+    'amenities': '',
+}
+
+TRUE = ('1', 'true', 'yes', 'y')
+FALSE = ('0', 'false', 'no', 'n')
+
+ImportResult = namedtuple('ImportResult', 'created updated errors room_ids')
+
+
+def read_rows(text, fmt):
+    """Yield ``(line, record, error)`` for every data row of ``text``.
+
+    Raises ValueError for unknown formats and files over ``MAX_ROWS`` rows.
+    """
+    if fmt not in FORMATS:
+        raise ValueError('format must be one of: %s' % ', '.join(FORMATS))
+    if fmt == 'csv':
+        reader = csv.DictReader(io.StringIO(text))
+        rows = ((reader.line_num, record, None) for record in reader)
+    else:
+        rows = _ndjson_rows(text)
+    for count, row in enumerate(rows, 1):
+        if count > MAX_ROWS:
+            raise ValueError('at most %d rows per import' % MAX_ROWS)
+        yield row
+
+
+def _ndjson_rows(text):
+    for line, raw in enumerate(text.splitlines(), 1):
+        if not raw.strip():
+            continue
+        try:
+            record = json.loads(raw)
+        except ValueError as e:
+            yield line, None, 'invalid JSON: %s' % e
+            continue
+        if not isinstance(record, dict):
+            yield line, None, 'expected a JSON object'
+            continue
+        yield line, record, None
+
+
+def _text(value, field, max_length=None):
+    value = str(value).strip()
+    if max_length and len(value) > max_length:
+        raise ValueError('%s is longer than %d characters' % (field, max_length))
+    return value
+
+
+def clean(record):
+    """Validate one row into column values; only fields present in the row
+    (and non-empty, for CSV) are returned.  Raises ValueError."""
+    values = {}
+    for field, value in record.items():
+        if field is None or value is None or value == '':
+            continue
+        field = field.strip()
+        if field == 'external_id':
+            values[field] = _text(value, field, 64)
+        elif field == 'name':
+            values[field] = _text(value, field, 100)
+        elif field == 'description':
+            values[field] = _text(value, field)
+        elif field == 'room_type':
+            values[field] = _text(value, field, 50)
+        elif field == 'image_url':
+            values[field] = _text(value, field, 255)
+        elif field == 'price_per_night':
+            try:
+                values[field] = float(value)
+            except (TypeError, ValueError):
+                raise ValueError('price_per_night must be a number')
+            if values[field] < 0:
+                raise ValueError('price_per_night must not be negative')
+        elif field == 'capacity':
+            try:
+                values[field] = int(value)
+            except (TypeError, ValueError):
+                raise ValueError('capacity must be an integer')
+            if values[field] < 1:
+                raise ValueError('capacity must be at least 1')
+        elif field == 'is_available':
+            if isinstance(value, bool):
+                values[field] = value
+            elif str(value).strip().lower() in TRUE + FALSE:
+                values[field] = str(value).strip().lower() in TRUE
+            else:
+                raise ValueError('is_available must be true or false')
+        elif field == 'amenities':
+            if isinstance(value, str):
+                values[field] = value
+            elif isinstance(value, list) and all(isinstance(item, str) for item in value):
+                values[field] = json.dumps(value)
+            else:
+                raise ValueError('amenities must be a list of names or comma-separated text')
+    if not values.get('name'):
+        raise ValueError('name is required')
+    return values
+
+
+def _existing(dbsession, column, keys, *criteria):
+    """Map each of ``keys`` to the ids of the rooms whose ``column`` has
+    that value (and that match ``criteria``), querying ``BATCH_SIZE`` keys
+    at a time."""
+    found = defaultdict(list)
+    keys = list(keys)
+    for start in range(0, len(keys), BATCH_SIZE):
+        for room_id, key in dbsession.query(models.Room.id, column).filter(
+            column.in_(keys[start:start + BATCH_SIZE]), *criteria
+        ):
+            found[key].append(room_id)
+    return found
+
+
+def import_rooms(dbsession, rows, dry_run=False):
+    """Upsert the rooms of ``rows`` (as yielded by ``read_rows``) and
+    return an ``ImportResult``; with ``dry_run`` nothing is written."""
+    errors = []
+    valid = []
+    seen = {}
+    for line, record, error in rows:
+        if error is None:
+            try:
+                values = clean(record)
+            except ValueError as e:
+                error = str(e)
+        if error is None:
+            key = ('external_id', values['external_id']) if 'external_id' in values \
+                else ('name', values['name'])
+            if key in seen:
+                error = 'duplicate %s of line %d' % (key[0], seen[key])
+            else:
+                seen[key] = line
+                valid.append((line, key, values))
+        if error is not None:
+            errors.append({'line': line, 'message': error})
+
+    by_external_id = _existing(dbsession, models.Room.external_id,
+                               [key[1] for _, key, _ in valid if key[0] == 'external_id'])
+    by_name = _existing(dbsession, models.Room.name,
+                        [key[1] for _, key, _ in valid if key[0] == 'name'])
+    # Rows whose external_id is new may describe a room imported (or
+    # created) before it had one: match those by name and set the id
+    unclaimed = _existing(dbsession, models.Room.name,
+                          [values['name'] for _, key, values in valid
+                           if key[0] == 'external_id' and key[1] not in by_external_id],
+                          models.Room.external_id.is_(None))
+
+    inserts = []
+    updates = defaultdict(list)
+    claimed = {}
+    now = datetime.now()
+    for line, (kind, key), values in valid:
+        if kind == 'name':
+            matches = by_name.get(key, [])
+            ambiguous = '%d rooms are named %r; use external_id'
+        else:
+            matches = by_external_id.get(key) or unclaimed.get(values['name'], [])
+            ambiguous = '%d rooms without external_id are named %r'
+        if len(matches) > 1:
+            errors.append({'line': line, 'message': ambiguous % (len(matches), values['name'])})
+        elif matches and matches[0] in claimed:
+            errors.append({'line': line, 'message': 'room %d is already updated by line %d'
+                           % (matches[0], claimed[matches[0]])})
+        elif matches:
+            claimed[matches[0]] = line
+            values = dict(values, id=matches[0], updated_at=now)
+            updates[tuple(sorted(values))].append(values)
+        elif 'price_per_night' not in values:
+            errors.append({'line': line, 'message': 'price_per_night is required for new rooms'})
+        else:
+            row = dict(DEFAULTS, external_id=None)
+            row.update(values)
+            inserts.append(row)
+    errors.sort(key=lambda error: error['line'])
+    updated = sum(len(batch) for batch in updates.values())
+    if dry_run:
+        return ImportResult(len(inserts), updated, errors, [])
+
+    inserted_ids = []
+    for start in range(0, len(inserts), BATCH_SIZE):
+        result = dbsession.execute(
+            insert(models.Room).returning(models.Room.id, sort_by_parameter_order=True),
+            inserts[start:start + BATCH_SIZE])
+        inserted_ids.extend(result.scalars())
+    updated_ids = []
+    for batch in updates.values():
+        for start in range(0, len(batch), BATCH_SIZE):
+            dbsession.execute(update(models.Room), batch[start:start + BATCH_SIZE])
+        updated_ids.extend(values['id'] for values in batch)
+
+    stats.rooms_inserted(dbsession, inserted_ids)
+    touched(dbsession, models.Room, inserted_ids + updated_ids)
+    return ImportResult(len(inserted_ids), len(updated_ids), errors,
+                        inserted_ids + updated_ids)
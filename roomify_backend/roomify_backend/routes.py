@@ -4,14 +4,24 @@ def includeme(config):
     
     # API Routes - Rooms
     config.add_route('api_rooms', '/api/rooms', request_method=['GET'])
+    # Must come before api_room, which would otherwise match 'availability' as an id
+    config.add_route('api_rooms_availability', '/api/rooms/availability', request_method=['GET'])
     config.add_route('api_room', '/api/rooms/{id}', request_method=['GET'])
+    config.add_route('api_room_calendar', '/api/rooms/{id}/calendar', request_method=['GET'])
     config.add_route('api_room_create', '/api/rooms', request_method=['POST'])
     
+    # API Routes - Pricing
+    config.add_route('api_quotes', '/api/quotes', request_method=['POST'])
+    config.add_route('api_admin_rate_rules', '/api/admin/rate-rules', request_method=['GET', 'POST'])
+    config.add_route('api_admin_rate_rule_detail', '/api/admin/rate-rules/{id}', request_method=['PUT', 'DELETE'])
+    config.add_route('api_admin_room_rates', '/api/admin/rooms/{id}/rates', request_method=['GET', 'PUT'])
+    
     # API Routes - Authentication
     config.add_route('api_register', '/api/register')
     config.add_route('api_login', '/api/login')
     config.add_route('api_profile', '/api/profile')
     config.add_route('api_update_profile', '/api/profile/update', request_method=['PUT'])
+    config.add_route('api_logout', '/api/logout', request_method=['POST'])
     config.add_route('api_admin_login', '/api/admin/login')
     
     # API Routes - Bookings
@@ -22,12 +32,19 @@ def includeme(config):
     # API Routes - Notifications
     config.add_route('api_user_notifications', '/api/user/notifications', request_method=['GET'])
     config.add_route('api_user_notification_read', '/api/user/notifications/{id}/read', request_method=['PUT'])
+    config.add_route('api_user_notifications_read', '/api/user/notifications/read', request_method=['PUT'])
+    config.add_route('api_user_notifications_unread', '/api/user/notifications/unread-count', request_method=['GET'])
+    config.add_route('api_user_notifications_stream', '/api/user/notifications/stream', request_method=['GET'])
     
     # API Routes - Admin
     config.add_route('api_admin_stats', '/api/admin/stats')
+    config.add_route('api_admin_stats_timeseries', '/api/admin/stats/timeseries', request_method=['GET'])
     config.add_route('api_admin_users', '/api/admin/users')
+    config.add_route('api_admin_cache_stats', '/api/admin/cache-stats', request_method=['GET'])
+    config.add_route('api_admin_export', '/api/admin/export/{kind}', request_method=['GET'])
     # Gunakan satu route untuk GET dan POST
     config.add_route('api_admin_rooms', '/api/admin/rooms', request_method=['GET', 'POST'])
+    config.add_route('api_admin_rooms_import', '/api/admin/rooms/import', request_method=['POST'])
     # Route untuk operasi pada room tertentu (update, delete)
     config.add_route('api_admin_room_detail', '/api/admin/rooms/{id}', request_method=['PUT', 'DELETE'])
     config.add_route('api_admin_booking_update', '/api/admin/bookings/{id}', request_method=['PUT'])
@@ -0,0 +1,59 @@
+import argparse
+import sys
+
+from pyramid.paster import bootstrap, setup_logging
+from sqlalchemy.exc import OperationalError
+
+from .. import stats
+from ..availability import parse_date
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(
+        description='Recompute the daily booking rollups from the bookings table.',
+    )
+    parser.add_argument(
+        'config_uri',
+        help='Configuration file, e.g., development.ini',
+    )
+    parser.add_argument(
+        '--from', dest='start', type=parse_date,
+        help='First booking creation day, YYYY-MM-DD (default: oldest booking)',
+    )
+    parser.add_argument(
+        '--to', dest='end', type=parse_date,
+        help='Day after the last one, YYYY-MM-DD (default: after the newest booking)',
+    )
+    parser.add_argument(
+        '--chunk-days', type=int, default=31,
+        help='Days recomputed per transaction (default: 31)',
+    )
+    return parser.parse_args(argv[1:])
+
+
+def main(argv=sys.argv):
+    args = parse_args(argv)
+    setup_logging(args.config_uri)
+    env = bootstrap(args.config_uri)
+
+    try:
+        session_factory = env['registry']['dbsession_factory']
+        result = stats.backfill_rollups(session_factory, start=args.start, end=args.end,
+                                        chunk_days=args.chunk_days)
+        print('Rebuilt %d rollup rows covering %d days in %.3fs' % (
+            result.rows, result.days, result.elapsed))
+    except OperationalError:
+        print('''
+Pyramid is having a problem using your SQL database.  The problem
+might be caused by one of the following things:
+
+1.  You may need to initialize your database tables with `alembic`.
+    Check your README.txt for description and try to run it.
+
+2.  Your database server may not be running.  Check that the
+    database server referred to by the "sqlalchemy.url" setting in
+    your "development.ini" file is running.
+            ''')
+        return 1
+    finally:
+        env['closer']()
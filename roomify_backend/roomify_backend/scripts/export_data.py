@@ -0,0 +1,81 @@
+import argparse
+import sys
+
+from pyramid.paster import bootstrap, setup_logging
+from sqlalchemy.exc import OperationalError
+
+from .. import export
+from ..availability import parse_date
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(
+        description='Export bookings or users as CSV or NDJSON.',
+    )
+    parser.add_argument(
+        'config_uri',
+        help='Configuration file, e.g., development.ini',
+    )
+    parser.add_argument(
+        'kind', choices=sorted(export.EXPORTS),
+        help='What to export',
+    )
+    parser.add_argument(
+        '--format', dest='fmt', choices=sorted(export.FORMATS), default='csv',
+        help='Output format (default: csv)',
+    )
+    parser.add_argument(
+        '--from', dest='start', type=parse_date,
+        help='First creation day, YYYY-MM-DD',
+    )
+    parser.add_argument(
+        '--to', dest='end', type=parse_date,
+        help='Day after the last creation day, YYYY-MM-DD',
+    )
+    parser.add_argument(
+        '--status', type=export.parse_statuses,
+        help='Comma-separated booking statuses',
+    )
+    parser.add_argument(
+        '--output', '-o',
+        help='File to write (default: standard output)',
+    )
+    parser.add_argument(
+        '--chunk-size', type=int, default=export.CHUNK_SIZE,
+        help='Rows fetched per round-trip (default: %d)' % export.CHUNK_SIZE,
+    )
+    return parser.parse_args(argv[1:])
+
+
+def main(argv=sys.argv):
+    args = parse_args(argv)
+    setup_logging(args.config_uri)
+    env = bootstrap(args.config_uri)
+
+    output = open(args.output, 'wb') if args.output else sys.stdout.buffer
+    try:
+        stmt = export.build_export(args.kind, args.start, args.end, args.status)
+        for chunk in export.iter_export(env['registry']['dbsession_factory'], stmt,
+                                        args.fmt, chunk_size=args.chunk_size):
+            output.write(chunk)
+        output.flush()
+    except ValueError as e:
+        print('Invalid export: %s' % e, file=sys.stderr)
+        return 2
+    except OperationalError:
+        print('''
+Pyramid is having a problem using your SQL database.  The problem
+might be caused by one of the following things:
+
+1.  You may need to initialize your database tables with `alembic`.
+    Check your README.txt for description and try to run it.
+
+2.  Your database server may not be running.  Check that the
+    database server referred to by the "sqlalchemy.url" setting in
+    your "development.ini" file is running.
+            ''', file=sys.stderr)
+        return 1
+    finally:
+        if args.output:
+            output.close()
+        env['closer']()
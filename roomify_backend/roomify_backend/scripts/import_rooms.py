@@ -0,0 +1,73 @@
+import argparse
+import sys
+
+from pyramid.paster import bootstrap, setup_logging
+from sqlalchemy.exc import OperationalError
+
+from .. import room_import
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(
+        description='Create or update rooms from a CSV or NDJSON file. '
+                    'Running servers keep their cached room listings until '
+                    'restarted; use POST /api/admin/rooms/import on a live system.',
+    )
+    parser.add_argument(
+        'config_uri',
+        help='Configuration file, e.g., development.ini',
+    )
+    parser.add_argument(
+        'path',
+        help='File to import',
+    )
+    parser.add_argument(
+        '--format', dest='fmt', choices=room_import.FORMATS,
+        help='File format (default: from the file extension, else csv)',
+    )
+    parser.add_argument(
+        '--dry-run', action='store_true',
+        help='Only validate the file',
+    )
+    return parser.parse_args(argv[1:])
+
+
+def main(argv=sys.argv):
+    args = parse_args(argv)
+    setup_logging(args.config_uri)
+    env = bootstrap(args.config_uri)
+
+    fmt = args.fmt or ('ndjson' if args.path.endswith(('.ndjson', '.jsonl')) else 'csv')
+    try:
+        with open(args.path, encoding='utf-8-sig', newline='') as f:
+            text = f.read()
+        with env['request'].tm:
+            rows = room_import.read_rows(text, fmt)
+            result = room_import.import_rooms(env['request'].dbsession, rows,
+                                              dry_run=args.dry_run)
+        for error in result.errors:
+            print('line %d: %s' % (error['line'], error['message']))
+        print('%s %d rooms and %s %d, %d rows rejected' % (
+            'Would create' if args.dry_run else 'Created', result.created,
+            'update' if args.dry_run else 'updated', result.updated,
+            len(result.errors)))
+        if result.errors:
+            return 2
+    except ValueError as e:
+        print('Invalid room import: %s' % e, file=sys.stderr)
+        return 2
+    except OperationalError:
+        print('''
+Pyramid is having a problem using your SQL database.  The problem
+might be caused by one of the following things:
+
+1.  You may need to initialize your database tables with `alembic`.
+    Check your README.txt for description and try to run it.
+
+2.  Your database server may not be running.  Check that the
+    database server referred to by the "sqlalchemy.url" setting in
+    your "development.ini" file is running.
+            ''')
+        return 1
+    finally:
+        env['closer']()
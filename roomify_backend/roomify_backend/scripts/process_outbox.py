@@ -0,0 +1,63 @@
+import argparse
+import sys
+import time
+
+from pyramid.paster import bootstrap, setup_logging
+from sqlalchemy.exc import OperationalError
+
+from .. import outbox
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(
+        description='Deliver due notification outbox messages.',
+    )
+    parser.add_argument(
+        'config_uri',
+        help='Configuration file, e.g., development.ini',
+    )
+    parser.add_argument(
+        '--batch-size', type=int, default=None,
+        help='Messages claimed per transaction (default: outbox.batch_size)',
+    )
+    parser.add_argument(
+        '--watch', type=float, default=0, metavar='SECONDS',
+        help='Keep running, draining the outbox every SECONDS',
+    )
+    return parser.parse_args(argv[1:])
+
+
+def main(argv=sys.argv):
+    args = parse_args(argv)
+    setup_logging(args.config_uri)
+    env = bootstrap(args.config_uri)
+
+    try:
+        worker = outbox.worker_from_settings(env['registry'].settings,
+                                             env['registry']['dbsession_factory'])
+        if args.batch_size:
+            worker.batch_size = args.batch_size
+        while True:
+            result = worker.drain()
+            if not args.watch or result.done or result.retried or result.failed:
+                print('Delivered %d messages, %d retried, %d failed in %.3fs' % result)
+            if not args.watch:
+                break
+            time.sleep(args.watch)
+    except KeyboardInterrupt:
+        pass
+    except OperationalError:
+        print('''
+Pyramid is having a problem using your SQL database.  The problem
+might be caused by one of the following things:
+
+1.  You may need to initialize your database tables with `alembic`.
+    Check your README.txt for description and try to run it.
+
+2.  Your database server may not be running.  Check that the
+    database server referred to by the "sqlalchemy.url" setting in
+    your "development.ini" file is running.
+            ''')
+        return 1
+    finally:
+        env['closer']()
@@ -0,0 +1,60 @@
+import argparse
+import sys
+
+from pyramid.paster import bootstrap, setup_logging
+from sqlalchemy.exc import OperationalError
+
+from .. import stats
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(
+        description='Rebuild the dashboard stats tables and repair user '
+                    'unread counts, or check them.',
+    )
+    parser.add_argument(
+        'config_uri',
+        help='Configuration file, e.g., development.ini',
+    )
+    parser.add_argument(
+        '--verify-only', action='store_true',
+        help='Only compare the tables with a full recomputation',
+    )
+    return parser.parse_args(argv[1:])
+
+
+def main(argv=sys.argv):
+    args = parse_args(argv)
+    setup_logging(args.config_uri)
+    env = bootstrap(args.config_uri)
+
+    try:
+        with env['request'].tm:
+            dbsession = env['request'].dbsession
+            if not args.verify_only:
+                totals = stats.rebuild(dbsession)
+                print('Rebuilt dashboard stats: %d users, %d rooms, %d bookings, %.2f revenue' % totals)
+                print('Repaired unread_notifications of %d users' % stats.repair_unread_counts(dbsession))
+                dbsession.flush()
+            problems = stats.verify(dbsession)
+        for problem in problems:
+            print(problem)
+        if problems:
+            print('%d mismatches found' % len(problems))
+            return 2
+        print('Dashboard stats match the base tables')
+    except OperationalError:
+        print('''
+Pyramid is having a problem using your SQL database.  The problem
+might be caused by one of the following things:
+
+1.  You may need to initialize your database tables with `alembic`.
+    Check your README.txt for description and try to run it.
+
+2.  Your database server may not be running.  Check that the
+    database server referred to by the "sqlalchemy.url" setting in
+    your "development.ini" file is running.
+            ''')
+        return 1
+    finally:
+        env['closer']()
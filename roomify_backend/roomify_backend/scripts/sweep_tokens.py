@@ -0,0 +1,55 @@
+import argparse
+import sys
+
+from pyramid.paster import bootstrap, setup_logging
+from sqlalchemy.exc import OperationalError
+
+from .. import tasks
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(
+        description='Delete expired access tokens and revocations.',
+    )
+    parser.add_argument(
+        'config_uri',
+        help='Configuration file, e.g., development.ini',
+    )
+    parser.add_argument(
+        '--batch-size', type=int, default=1000,
+        help='Rows deleted per transaction (default: 1000)',
+    )
+    parser.add_argument(
+        '--vacuum', action='store_true',
+        help='Reclaim disk space after sweeping',
+    )
+    return parser.parse_args(argv[1:])
+
+
+def main(argv=sys.argv):
+    args = parse_args(argv)
+    setup_logging(args.config_uri)
+    env = bootstrap(args.config_uri)
+
+    try:
+        session_factory = env['registry']['dbsession_factory']
+        result = tasks.sweep_expired_tokens(session_factory, batch_size=args.batch_size)
+        print('Removed %d expired tokens and %d expired revocations in %.3fs' % (
+            result.tokens, result.revoked_tokens, result.elapsed))
+        if args.vacuum:
+            tasks.vacuum(session_factory.kw['bind'])
+    except OperationalError:
+        print('''
+Pyramid is having a problem using your SQL database.  The problem
+might be caused by one of the following things:
+
+1.  You may need to initialize your database tables with `alembic`.
+    Check your README.txt for description and try to run it.
+
+2.  Your database server may not be running.  Check that the
+    database server referred to by the "sqlalchemy.url" setting in
+    your "development.ini" file is running.
+            ''')
+        return 1
+    finally:
+        env['closer']()
@@ -0,0 +1,193 @@
+"""Server-side room search for ``GET /api/rooms``.
+
+Filters map onto the composite indexes declared in ``models/room.py`` so
+the database only visits matching rooms.  Amenity filters are answered
+from an in-memory inverted index (amenity -> bitmap of room ids) because
+``Room.amenities`` is free text.
+"""
+from functools import reduce
+import json
+import threading
+
+from . import models
+from .availability import is_free, parse_stay
+from .cache import on_commit
+
+SEARCH_PARAMS = ('min_price', 'max_price', 'capacity', 'room_type',
+                 'available', 'amenities', 'check_in', 'check_out', 'sort', 'limit')
+
+SORTS = {
+    'price_asc': (models.Room.price_per_night.asc(), models.Room.id.asc()),
+    'price_desc': (models.Room.price_per_night.desc(), models.Room.id.asc()),
+    'capacity_asc': (models.Room.capacity.asc(), models.Room.id.asc()),
+    'capacity_desc': (models.Room.capacity.desc(), models.Room.id.asc()),
+    'newest': (models.Room.created_at.desc(), models.Room.id.desc()),
+}
+
+MAX_LIMIT = 500
+
+
+def parse_amenities(value):
+    """Normalize an amenities value (JSON list or comma-separated text)
+    into a set of lower-case names.  Other JSON values count as a single
+    amenity, ``null`` as none."""
+    if not value:
+        return set()
+    if isinstance(value, str):
+        try:
+            value = json.loads(value)
+        except ValueError:
+            value = value.split(',')
+    if value is None:
+        return set()
+    if not isinstance(value, (list, tuple)):
+        value = [value]
+    return {str(item).strip().lower() for item in value
+            if item is not None and str(item).strip()}
+
+
+def _bits(bitmap):
+    """Yield the positions of the set bits of ``bitmap``."""
+    while bitmap:
+        lowest = bitmap & -bitmap
+        yield lowest.bit_length() - 1
+        bitmap ^= lowest
+
+
+class AmenityIndex(object):
+    """Inverted index from amenity to a bitmap (Python int) of room ids.
+
+    Committed room changes mark ids as stale; only those rooms are
+    re-read on the next lookup.
+    """
+
+    def __init__(self):
+        self.bitmaps = {}
+        self.loaded = False
+        self.refreshes = 0
+        self._stale = set()
+        self._lock = threading.Lock()
+
+    def invalidate(self, room_ids):
+        with self._lock:
+            self._stale.update(room_ids)
+
+    def _refresh(self, dbsession):
+        with self._lock:
+            if self.loaded and not self._stale:
+                return
+            Room = models.Room
+            query = dbsession.query(Room.id, Room.amenities)
+            bitmaps = self.bitmaps
+            if self.loaded:
+                query = query.filter(Room.id.in_(self._stale))
+                mask = reduce(lambda acc, room_id: acc | (1 << room_id), self._stale, 0)
+                bitmaps = {name: bitmap & ~mask for name, bitmap in bitmaps.items()}
+            else:
+                bitmaps = {}
+            for room_id, amenities in query:
+                for name in parse_amenities(amenities):
+                    bitmaps[name] = bitmaps.get(name, 0) | (1 << room_id)
+            # Only replace the index once every stale room has been read
+            self.bitmaps = {name: bitmap for name, bitmap in bitmaps.items() if bitmap}
+            self._stale = set()
+            self.loaded = True
+            self.refreshes += 1
+
+    def room_ids(self, dbsession, amenities):
+        """Return the ids of the rooms that have every amenity listed."""
+        self._refresh(dbsession)
+        bitmaps = self.bitmaps
+        matches = reduce(lambda acc, name: acc & bitmaps.get(name, 0), amenities, -1)
+        return set(_bits(matches)) if amenities else set()
+
+    def stats(self):
+        return {
+            'amenities': len(self.bitmaps),
+            'refreshes': self.refreshes,
+            'stale_rooms': len(self._stale),
+        }
+
+
+def is_search(params):
+    """True if the request carries any search parameter."""
+    return any(name in params for name in SEARCH_PARAMS)
+
+
+def parse_search(params):
+    """Validate search parameters into a criteria dict.
+
+    Raises ValueError with a client-facing message on bad input.
+    """
+    criteria = {}
+    for name in ('min_price', 'max_price'):
+        if params.get(name):
+            criteria[name] = float(params[name])
+    if params.get('capacity'):
+        criteria['capacity'] = int(params['capacity'])
+    if params.get('room_type'):
+        criteria['room_type'] = params['room_type']
+    if params.get('amenities'):
+        criteria['amenities'] = parse_amenities(params['amenities'].split(','))
+
+    if params.get('check_in') or params.get('check_out'):
+        criteria['stay'] = parse_stay(params.get('check_in'), params.get('check_out'))
+
+    available = params.get('available', 'true').lower()
+    if available not in ('true', 'false', 'all'):
+        raise ValueError('available must be true, false or all')
+    criteria['available'] = available
+
+    sort = params.get('sort', 'price_asc')
+    if sort not in SORTS:
+        raise ValueError('sort must be one of: %s' % ', '.join(sorted(SORTS)))
+    criteria['sort'] = sort
+
+    if params.get('limit'):
+        limit = int(params['limit'])
+        if limit < 1:
+            raise ValueError('limit must be positive')
+        criteria['limit'] = min(limit, MAX_LIMIT)
+    return criteria
+
+
+def search_rooms(dbsession, criteria, amenity_index=None):
+    """Return the rooms matching ``criteria`` from ``parse_search``."""
+    Room = models.Room
+    query = dbsession.query(Room)
+    if criteria.get('amenities'):
+        if amenity_index is None:
+            amenity_index = AmenityIndex()
+        room_ids = amenity_index.room_ids(dbsession, criteria['amenities'])
+        if not room_ids:
+            return []
+        query = query.filter(Room.id.in_(room_ids))
+    if criteria['available'] != 'all':
+        query = query.filter(Room.is_available == (criteria['available'] == 'true'))
+    if 'room_type' in criteria:
+        query = query.filter(Room.room_type == criteria['room_type'])
+    if 'capacity' in criteria:
+        query = query.filter(Room.capacity >= criteria['capacity'])
+    if 'min_price' in criteria:
+        query = query.filter(Room.price_per_night >= criteria['min_price'])
+    if 'max_price' in criteria:
+        query = query.filter(Room.price_per_night <= criteria['max_price'])
+    if 'stay' in criteria:
+        query = query.filter(is_free(*criteria['stay']))
+    query = query.order_by(*SORTS[criteria['sort']])
+    if 'limit' in criteria:
+        query = query.limit(criteria['limit'])
+    return query.all()
+
+
+def includeme(config):
+    """
+    Set up the amenity index used by room search.
+
+    Activate this setup using ``config.include('roomify_backend.search')``.
+
+    """
+    index = AmenityIndex()
+    on_commit(config.registry['dbsession_factory'], models.Room, index.invalidate)
+    config.registry['amenity_index'] = index
+    config.registry.setdefault('caches', {})['amenity_index'] = index
@@ -0,0 +1,341 @@
+"""Bearer token handling and the Pyramid security policy.
+
+Two token formats are accepted:
+
+- opaque database tokens (``Token`` rows), the default;
+- stateless HMAC-signed tokens, issued when ``auth.token_mode = signed``.
+  They carry user id, admin flag and expiry, so validating them needs no
+  database round-trip.  Revocations are kept in an in-memory set that is
+  reloaded from the ``revoked_tokens`` table every
+  ``auth.revocation_reload_interval`` seconds.
+"""
+import base64
+from collections import namedtuple
+from datetime import datetime, timedelta
+import hashlib
+import hmac
+import json
+import secrets
+import threading
+import time
+
+from pyramid.exceptions import ConfigurationError
+from pyramid.security import Allowed, Denied
+
+from . import models
+from .cache import TTLCache, on_commit, touched
+
+
+class CachedToken(namedtuple('CachedToken', 'id user_id token is_admin expires_at jti',
+                             defaults=(None,))):
+    """Detached, read-only copy of a ``Token`` row (or of the claims of a
+    signed token) safe to share across requests and threads."""
+    __slots__ = ()
+
+    @classmethod
+    def from_model(cls, token):
+        return cls(token.id, token.user_id, token.token, bool(token.is_admin),
+                   token.expires_at)
+
+    def is_valid(self):
+        """Check if the token is still valid (not expired)."""
+        return datetime.now() < self.expires_at
+
+
+def _b64encode(data):
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode('ascii')
+
+
+def _b64decode(text):
+    return base64.urlsafe_b64decode(text + '=' * (-len(text) % 4))
+
+
+class TokenSigner(object):
+    """Issue and verify ``v1.<claims>.<signature>`` access tokens."""
+
+    prefix = 'v1.'
+
+    def __init__(self, secret):
+        self.key = secret.encode('utf-8')
+
+    def _sign(self, payload):
+        return hmac.new(self.key, payload.encode('ascii'), hashlib.sha256).digest()
+
+    def issue(self, user_id, is_admin=False, expiry_days=1):
+        """Return a signed ``CachedToken`` for the user."""
+        expires_at = (datetime.now() + timedelta(days=expiry_days)).replace(microsecond=0)
+        jti = secrets.token_hex(16)
+        claims = {
+            'uid': user_id,
+            'adm': bool(is_admin),
+            'exp': int(expires_at.timestamp()),
+            'jti': jti,
+        }
+        payload = _b64encode(json.dumps(claims, separators=(',', ':')).encode('utf-8'))
+        token_str = '%s%s.%s' % (self.prefix, payload, _b64encode(self._sign(payload)))
+        return CachedToken(None, user_id, token_str, bool(is_admin), expires_at, jti)
+
+    def verify(self, token_str):
+        """Return the ``CachedToken`` for a well-signed token, or None.
+
+        Expiry is not checked here; callers use ``CachedToken.is_valid``.
+        """
+        if not token_str.startswith(self.prefix):
+            return None
+        try:
+            payload, signature = token_str[len(self.prefix):].split('.')
+            if not hmac.compare_digest(self._sign(payload), _b64decode(signature)):
+                return None
+            claims = json.loads(_b64decode(payload))
+            return CachedToken(None, int(claims['uid']), token_str, bool(claims['adm']),
+                               datetime.fromtimestamp(claims['exp']), str(claims['jti']))
+        except (ValueError, KeyError, TypeError):
+            return None
+
+
+class RevocationList(object):
+    """In-memory set of revoked signed-token ids.
+
+    The set is refreshed from ``revoked_tokens`` at most once per
+    ``reload_interval`` seconds using its own short-lived session, so
+    checking a token costs a set lookup on the hot path.
+    """
+
+    def __init__(self, session_factory, reload_interval=30, clock=time.time):
+        self.session_factory = session_factory
+        self.reload_interval = reload_interval
+        self.clock = clock
+        self._jtis = frozenset()
+        self._loaded_at = None
+        self._lock = threading.Lock()
+
+    def reload(self):
+        session = self.session_factory()
+        try:
+            rows = session.query(models.RevokedToken.jti).filter(
+                models.RevokedToken.expires_at > datetime.now()
+            ).all()
+        finally:
+            session.close()
+        with self._lock:
+            self._jtis = frozenset(row.jti for row in rows)
+            self._loaded_at = self.clock()
+
+    def _maybe_reload(self):
+        loaded_at = self._loaded_at
+        if loaded_at is None or self.clock() - loaded_at >= self.reload_interval:
+            self.reload()
+
+    def add(self, jti):
+        with self._lock:
+            self._jtis = self._jtis | {jti}
+
+    def __contains__(self, jti):
+        self._maybe_reload()
+        return jti in self._jtis
+
+
+def get_bearer_token(request):
+    """Return the raw token from the ``Authorization`` header, or None."""
+    auth_header = request.headers.get('Authorization', '')
+    if not auth_header.startswith('Bearer '):
+        return None
+    parts = auth_header.split(' ')
+    return parts[1] if len(parts) > 1 and parts[1] else None
+
+
+def _lookup_token(request, token_str):
+    """Return ``(CachedToken, User or None)`` for a valid token, else
+    ``(None, None)``.
+
+    Validated tokens are kept in the registry's ``token_cache`` so repeated
+    requests with the same bearer token skip the ``tokens`` lookup.  Cache
+    entries never outlive ``Token.expires_at``; revocations made in another
+    process are picked up once the cache TTL elapses.  On a cache miss the
+    token and its user are loaded with a single joined query.
+    """
+    signer = request.registry.get('token_signer')
+    if signer is not None and token_str.startswith(signer.prefix):
+        token = signer.verify(token_str)
+        if token is None or not token.is_valid():
+            return None, None
+        if token.jti in request.registry['revoked_tokens']:
+            return None, None
+        return token, None
+
+    cache = request.registry.get('token_cache')
+    token = cache.get(token_str) if cache is not None else None
+    if token is not None:
+        if token.is_valid():
+            return token, None
+        cache.invalidate(token_str)
+        return None, None
+
+    row = request.dbsession.query(models.Token, models.User).join(
+        models.User, models.User.id == models.Token.user_id
+    ).filter(
+        models.Token.token == token_str
+    ).first()
+    if row is None or not row.Token.is_valid():
+        return None, None
+    token = CachedToken.from_model(row.Token)
+    if cache is not None:
+        cache.set(token_str, token, expires=token.expires_at.timestamp())
+    return token, row.User
+
+
+def resolve_token(request, token_str=None, admin=False):
+    """Return a valid ``CachedToken`` for the request, or None."""
+    if token_str is None:
+        token_str = get_bearer_token(request)
+    if not token_str:
+        return None
+    token, _ = _lookup_token(request, token_str)
+    if token is None or (admin and not token.is_admin):
+        return None
+    return token
+
+
+def issue_token(request, user, is_admin=None):
+    """Issue an access token for ``user`` and return the token string.
+
+    In signed mode nothing is written; otherwise a ``Token`` row is added
+    to the request's session.
+    """
+    if is_admin is None:
+        is_admin = user.is_admin
+    signer = request.registry.get('token_signer')
+    if signer is not None:
+        return signer.issue(user.id, is_admin=is_admin).token
+    token = models.Token.create_token(user.id, is_admin=is_admin)
+    request.dbsession.add(token)
+    return token.token
+
+
+def revoke_token(request, token_str):
+    """Revoke a token and drop it from the cache. Returns True if it was
+    a known, unexpired token."""
+    signer = request.registry.get('token_signer')
+    if signer is not None and token_str.startswith(signer.prefix):
+        token = signer.verify(token_str)
+        if token is None or not token.is_valid():
+            return False
+        if token.jti not in request.registry['revoked_tokens']:
+            request.dbsession.add(models.RevokedToken(
+                jti=token.jti, expires_at=token.expires_at))
+            request.registry['revoked_tokens'].add(token.jti)
+        return True
+
+    # Dropped now and again once the DELETE commits: a request reading the
+    # still committed row in between may have cached it again
+    cache = request.registry.get('token_cache')
+    if cache is not None:
+        cache.invalidate(token_str)
+    deleted = request.dbsession.query(models.Token).filter(
+        models.Token.token == token_str
+    ).delete(synchronize_session=False)
+    touched(request.dbsession, models.Token, [token_str])
+    return deleted > 0
+
+
+class Identity(object):
+    """The authenticated caller, available as ``request.identity``."""
+
+    def __init__(self, request, token, user=None):
+        self.request = request
+        self.token = token
+        self.user_id = token.user_id
+        self.is_admin = token.is_admin
+        self._user = user
+
+    @property
+    def user(self):
+        """The ``User`` row, loaded on first access unless the token lookup
+        already fetched it."""
+        if self._user is None:
+            self._user = self.request.dbsession.get(models.User, self.user_id)
+        return self._user
+
+
+def load_identity(request):
+    """Build the ``Identity`` for a request, or None for anonymous and
+    preflight requests (which never touch the database)."""
+    if request.method == 'OPTIONS':
+        return None
+    token_str = get_bearer_token(request)
+    if not token_str:
+        return None
+    token, user = _lookup_token(request, token_str)
+    if token is None:
+        return None
+    return Identity(request, token, user)
+
+
+class SecurityPolicy(object):
+    """Bearer-token security policy.
+
+    Views protect themselves with ``permission='authenticated'`` or
+    ``permission='is_admin'``; the denial message is rendered by the
+    forbidden view.
+    """
+
+    def identity(self, request):
+        return request.auth_identity
+
+    def authenticated_userid(self, request):
+        identity = request.identity
+        return identity.user_id if identity is not None else None
+
+    def permits(self, request, context, permission):
+        identity = request.identity
+        if permission == 'is_admin':
+            if identity is None or not identity.is_admin:
+                return Denied('Admin authentication required')
+            return Allowed('Admin token')
+        if permission == 'authenticated':
+            if identity is not None:
+                return Allowed('Valid token')
+            if get_bearer_token(request) is None:
+                return Denied('Authentication required')
+            return Denied('Invalid or expired token')
+        return Denied('Unknown permission %r', permission)
+
+    def remember(self, request, userid, **kw):
+        return []
+
+    def forget(self, request, **kw):
+        return []
+
+
+def includeme(config):
+    """
+    Set up the shared token cache and the security policy.
+
+    Activate this setup using ``config.include('roomify_backend.security')``.
+
+    """
+    settings = config.get_settings()
+    cache = TTLCache(
+        max_size=int(settings.get('auth.token_cache.max_size', 1024)),
+        ttl=float(settings.get('auth.token_cache.ttl', 60)),
+    )
+    config.registry['token_cache'] = cache
+    config.registry.setdefault('caches', {})['tokens'] = cache
+    on_commit(config.registry['dbsession_factory'], models.Token, cache.invalidate_many,
+              key=lambda token: token.token)
+
+    mode = settings.get('auth.token_mode', 'database')
+    if mode == 'signed':
+        secret = settings.get('auth.secret')
+        if not secret:
+            raise ConfigurationError('auth.token_mode = signed requires auth.secret')
+        config.registry['token_signer'] = TokenSigner(secret)
+        config.registry['revoked_tokens'] = RevocationList(
+            config.registry['dbsession_factory'],
+            reload_interval=float(settings.get('auth.revocation_reload_interval', 30)),
+        )
+    elif mode != 'database':
+        raise ConfigurationError('Unknown auth.token_mode: %r' % mode)
+
+    config.add_request_method(load_identity, 'auth_identity', reify=True)
+    config.set_security_policy(SecurityPolicy())
@@ -0,0 +1,591 @@
+"""Materialized dashboard statistics.
+
+``dashboard_stats`` (totals, sharded, see ``SHARDS``), ``room_stats`` (booking count
+and revenue per room), ``users.unread_notifications`` and ``booking_rollups`` (bookings, nights
+and revenue per creation day, room and status) are kept current by
+``after_flush`` listeners on the application's session factory.  Every
+flush that inserts, updates or deletes ``User``, ``Room``, ``Booking`` or
+``Notification`` rows applies the difference with
+relative ``UPDATE ... SET n = n + :delta`` statements (upserts for
+``booking_rollups``, whose keys appear daily) in the same transaction,
+so concurrent writers never lose an increment and a rolled back
+transaction leaves the tables untouched.  Rollups only ever receive
+deltas: days with bookings made before the table existed need
+``backfill_roomify_backend_rollups``.
+
+Bulk ``query(...).update()`` / ``.delete()`` statements bypass the
+listeners; run ``rebuild_roomify_backend_stats`` and
+``backfill_roomify_backend_rollups`` after such maintenance.  The views
+mark notifications read, one or in bulk, through ``mark_read`` and change
+booking statuses through ``set_booking_status``: their conditional
+``UPDATE`` statements adjust the counters by the rows they really
+changed, so concurrent changes never count twice.
+"""
+from collections import defaultdict, namedtuple
+from datetime import datetime, timedelta
+import random
+import time
+
+from sqlalchemy import case, delete, event, func, insert, inspect, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+
+from . import models
+
+# dashboard_stats holds the totals as of the last rebuild in row
+# TOTALS_ID and the changes since then spread over SHARDS delta rows.  Each
+# flush adds to a random shard, so concurrent transactions rarely wait on
+# the same row lock; readers sum the rows.
+TOTALS_ID = 1
+SHARDS = 16
+
+Totals = namedtuple('Totals', 'users rooms bookings revenue')
+
+
+def _committed(obj, attr):
+    """Value of ``attr`` as it is in the database before this flush."""
+    history = inspect(obj).attrs[attr].history
+    if history.deleted:
+        return history.deleted[0]
+    if history.unchanged:
+        return history.unchanged[0]
+    return getattr(obj, attr)
+
+
+def _preload(session, flush_context, instances):
+    # Deleted bookings may have been expired by an earlier commit; load
+    # what after_flush needs while their rows still exist.
+    for obj in session.deleted:
+        if isinstance(obj, models.Booking):
+            obj.room_id, obj.total_price, obj.status, obj.created_at
+            obj.check_in_date, obj.check_out_date
+        elif isinstance(obj, models.Notification):
+            obj.user_id, obj.is_read
+
+
+def _add_totals(conn, users=0, rooms=0, bookings=0, revenue=0.0):
+    _add(conn, models.DashboardStats, {'id': TOTALS_ID + random.randint(1, SHARDS)}, {
+        'total_users': users,
+        'total_rooms': rooms,
+        'total_bookings': bookings,
+        'total_revenue': revenue,
+    }, updated_at=datetime.now())
+
+
+def _apply(session, flush_context):
+    users = rooms = 0
+    per_room = defaultdict(lambda: [0, 0.0])
+    new_rooms, gone_rooms = set(), set()
+
+    def book(room_id, count, amount):
+        per_room[room_id][0] += count
+        per_room[room_id][1] += amount or 0.0
+
+    for obj in session.new:
+        if isinstance(obj, models.Booking):
+            book(obj.room_id, 1, obj.total_price)
+        elif isinstance(obj, models.Room):
+            rooms += 1
+            new_rooms.add(obj.id)
+        elif isinstance(obj, models.User):
+            users += 1
+    for obj in session.deleted:
+        if isinstance(obj, models.Booking):
+            book(_committed(obj, 'room_id'), -1, -(_committed(obj, 'total_price') or 0.0))
+        elif isinstance(obj, models.Room):
+            rooms -= 1
+            gone_rooms.add(obj.id)
+        elif isinstance(obj, models.User):
+            users -= 1
+    for obj in session.dirty:
+        if isinstance(obj, models.Booking) and session.is_modified(obj):
+            old = (_committed(obj, 'room_id'), _committed(obj, 'total_price') or 0.0)
+            if old != (obj.room_id, obj.total_price or 0.0):
+                book(old[0], -1, -old[1])
+                book(obj.room_id, 1, obj.total_price)
+
+    bookings = sum(count for count, _ in per_room.values())
+    revenue = sum(amount for _, amount in per_room.values())
+    if not (users or rooms or bookings or revenue or new_rooms or gone_rooms):
+        return
+
+    conn = session.connection()
+    RoomStats = models.RoomStats
+    if users or rooms or bookings or revenue:
+        _add_totals(conn, users, rooms, bookings, revenue)
+    for room_id in new_rooms - gone_rooms:
+        count, amount = per_room.pop(room_id, (0, 0.0))
+        conn.execute(insert(RoomStats).values(room_id=room_id, bookings=count, revenue=amount))
+    for room_id, (count, amount) in per_room.items():
+        if room_id in gone_rooms or (not count and not amount):
+            continue
+        result = conn.execute(update(RoomStats).where(
+            RoomStats.room_id == room_id
+        ).values(
+            bookings=RoomStats.bookings + count,
+            revenue=RoomStats.revenue + amount,
+        ))
+        if result.rowcount == 0:
+            count, amount = compute_room_stats(session, room_id).get(room_id, (0, 0.0))
+            conn.execute(insert(RoomStats).values(room_id=room_id, bookings=count, revenue=amount))
+    if gone_rooms:
+        conn.execute(delete(RoomStats).where(RoomStats.room_id.in_(gone_rooms)))
+
+
+def _apply_unread(session, flush_context):
+    unread = defaultdict(int)
+    for obj in session.new:
+        if isinstance(obj, models.Notification) and not obj.is_read:
+            unread[obj.user_id] += 1
+    for obj in session.deleted:
+        if isinstance(obj, models.Notification) and not _committed(obj, 'is_read'):
+            unread[_committed(obj, 'user_id')] -= 1
+    for obj in session.dirty:
+        if isinstance(obj, models.Notification) and session.is_modified(obj):
+            if not _committed(obj, 'is_read'):
+                unread[_committed(obj, 'user_id')] -= 1
+            if not obj.is_read:
+                unread[obj.user_id] += 1
+
+    unread = {user_id: delta for user_id, delta in unread.items() if delta}
+    if unread:
+        conn = session.connection()
+        for user_id, delta in unread.items():
+            _add_unread(conn, user_id, delta)
+
+
+def _add_unread(conn, user_id, delta):
+    # Keep updated_at: a notification is not a change to the account
+    conn.execute(update(models.User).where(
+        models.User.id == user_id
+    ).values(
+        unread_notifications=models.User.unread_notifications + delta,
+        updated_at=models.User.updated_at,
+    ))
+
+
+def mark_read(dbsession, user_id, ids=None):
+    """Mark ``user_id``'s unread notifications (only those in ``ids`` if
+    given) as read with one ``UPDATE`` and adjust the unread counter.
+    Returns the number of notifications that changed."""
+    Notification = models.Notification
+    stmt = update(Notification).where(
+        Notification.user_id == user_id,
+        Notification.is_read == False,
+    )
+    if ids is not None:
+        if not ids:
+            return 0
+        stmt = stmt.where(Notification.id.in_(ids))
+    dbsession.flush()
+    count = dbsession.execute(
+        stmt.values(is_read=True).execution_options(synchronize_session='fetch')
+    ).rowcount
+    if count:
+        _add_unread(dbsession.connection(), user_id, -count)
+        user = dbsession.identity_map.get(dbsession.identity_key(models.User, user_id))
+        if user is not None:
+            dbsession.expire(user, ['unread_notifications'])
+    return count
+
+
+def unread_count(dbsession, user_id):
+    """The user's unread notification count, read from ``users``."""
+    return dbsession.query(models.User.unread_notifications).filter(
+        models.User.id == user_id
+    ).scalar() or 0
+
+
+_UPSERTS = {
+    'postgresql': postgresql.insert,
+    'sqlite': sqlite.insert,
+}
+
+
+def _add(conn, model, key, deltas, **values):
+    """Add ``deltas`` (column name -> amount) to the row of ``model``
+    whose primary key is ``key`` (column name -> value), creating the row
+    from the deltas if there is none, and set ``values``.
+
+    One ``INSERT ... ON CONFLICT DO UPDATE`` statement, so concurrent
+    transactions adding to a new key never collide on its primary key.
+    """
+    table = model.__table__
+    upsert = _UPSERTS.get(conn.dialect.name)
+    if upsert is None:
+        result = conn.execute(update(table).where(
+            *[table.c[name] == value for name, value in key.items()]
+        ).values(
+            {name: table.c[name] + amount for name, amount in deltas.items()}, **values
+        ))
+        if result.rowcount == 0:
+            conn.execute(insert(table).values(**key, **deltas, **values))
+        return
+    stmt = upsert(table).values(**key, **deltas, **values)
+    set_ = {name: table.c[name] + stmt.excluded[name] for name in deltas}
+    set_.update((name, stmt.excluded[name]) for name in values)
+    conn.execute(stmt.on_conflict_do_update(index_elements=list(key), set_=set_))
+
+
+ROLLUP_FIELDS = ('created_at', 'room_id', 'status', 'check_in_date',
+                 'check_out_date', 'total_price')
+
+
+def _rollup_entry(created_at, room_id, status, check_in, check_out, total_price):
+    """The ``(key, (bookings, nights, revenue))`` one booking adds to the
+    rollups."""
+    return ((created_at.date(), room_id, status),
+            (1, (check_out - check_in).days, total_price or 0.0))
+
+
+def _aggregate(rows):
+    """Sum booking rows (in ``ROLLUP_FIELDS`` order) into
+    ``{(day, room_id, status): [bookings, nights, revenue]}``."""
+    totals = defaultdict(lambda: [0, 0, 0.0])
+    for row in rows:
+        key, values = _rollup_entry(*row)
+        for i, value in enumerate(values):
+            totals[key][i] += value
+    return totals
+
+
+def _rollup_query(dbsession):
+    Booking = models.Booking
+    return dbsession.query(*(getattr(Booking, field) for field in ROLLUP_FIELDS))
+
+
+def _apply_rollups(session, flush_context):
+    deltas = defaultdict(lambda: [0, 0, 0.0])
+
+    def add(sign, row):
+        key, values = _rollup_entry(*row)
+        for i, value in enumerate(values):
+            deltas[key][i] += sign * value
+
+    for obj in session.new:
+        if isinstance(obj, models.Booking):
+            add(1, [getattr(obj, field) for field in ROLLUP_FIELDS])
+    for obj in session.deleted:
+        if isinstance(obj, models.Booking):
+            add(-1, [_committed(obj, field) for field in ROLLUP_FIELDS])
+    for obj in session.dirty:
+        if isinstance(obj, models.Booking) and session.is_modified(obj):
+            old = [_committed(obj, field) for field in ROLLUP_FIELDS]
+            new = [getattr(obj, field) for field in ROLLUP_FIELDS]
+            if old != new:
+                add(-1, old)
+                add(1, new)
+
+    conn = session.connection()
+    for (day, room_id, status), (count, nights, revenue) in deltas.items():
+        if count or nights or revenue:
+            _add(conn, models.BookingRollup,
+                 {'day': day, 'room_id': room_id, 'status': status},
+                 {'bookings': count, 'nights': nights, 'revenue': revenue})
+
+
+def set_booking_status(dbsession, booking, status):
+    """Move ``booking`` from the status it was loaded with to ``status``
+    with one conditional ``UPDATE`` and adjust the rollups.
+
+    Returns False, changing nothing, when a concurrent transaction changed
+    the status first; the flush listeners would otherwise take both
+    bookings out of the same old bucket.
+    """
+    Booking = models.Booking
+    dbsession.flush()
+    old = [getattr(booking, field) for field in ROLLUP_FIELDS]
+    changed = dbsession.execute(update(Booking).where(
+        Booking.id == booking.id,
+        Booking.status == booking.status,
+    ).values(
+        status=status,
+        updated_at=datetime.now(),
+    ).execution_options(synchronize_session='fetch')).rowcount
+    if not changed:
+        dbsession.refresh(booking)
+        return False
+    new = list(old)
+    new[ROLLUP_FIELDS.index('status')] = status
+    if new != old:
+        conn = dbsession.connection()
+        for sign, row in ((-1, old), (1, new)):
+            (day, room_id, key_status), values = _rollup_entry(*row)
+            _add(conn, models.BookingRollup,
+                 {'day': day, 'room_id': room_id, 'status': key_status},
+                 dict(zip(('bookings', 'nights', 'revenue'), (sign * v for v in values))))
+    return True
+
+
+def track(session_factory):
+    """Maintain the stats tables from flushes of ``session_factory``'s
+    sessions.  Safe to call more than once."""
+    if not event.contains(session_factory, 'after_flush', _apply):
+        event.listen(session_factory, 'before_flush', _preload)
+        event.listen(session_factory, 'after_flush', _apply)
+        event.listen(session_factory, 'after_flush', _apply_rollups)
+        event.listen(session_factory, 'after_flush', _apply_unread)
+
+
+BackfillResult = namedtuple('BackfillResult', 'days rows elapsed')
+
+
+def backfill_rollups(session_factory, start=None, end=None, chunk_days=31):
+    """Recompute ``booking_rollups`` for the creation days in
+    ``[start, end)`` (every day with bookings or rollups by default), one
+    transaction per ``chunk_days`` days so the bookings table is never
+    read in one go.
+
+    Returns a ``BackfillResult``.
+    """
+    started = time.monotonic()
+    Booking, BookingRollup = models.Booking, models.BookingRollup
+    session = session_factory()
+    try:
+        if start is None or end is None:
+            # Cover stale rollup rows as well as every booking
+            first, last = session.query(
+                func.min(Booking.created_at), func.max(Booking.created_at)).one()
+            days = [value.date() for value in (first, last) if value is not None]
+            days += [value for value in session.query(
+                func.min(BookingRollup.day), func.max(BookingRollup.day)).one()
+                if value is not None]
+            if not days:
+                return BackfillResult(0, 0, time.monotonic() - started)
+            start = start or min(days)
+            end = end or max(days) + timedelta(days=1)
+    finally:
+        session.close()
+
+    rows = 0
+    day = start
+    while day < end:
+        chunk_end = min(day + timedelta(days=chunk_days), end)
+        session = session_factory()
+        try:
+            totals = _aggregate(_rollup_query(session).filter(
+                Booking.created_at >= datetime.combine(day, datetime.min.time()),
+                Booking.created_at < datetime.combine(chunk_end, datetime.min.time()),
+            ).yield_per(1000))
+            session.execute(delete(BookingRollup).where(
+                BookingRollup.day >= day, BookingRollup.day < chunk_end))
+            if totals:
+                session.execute(insert(BookingRollup), [
+                    {'day': key[0], 'room_id': key[1], 'status': key[2],
+                     'bookings': count, 'nights': nights, 'revenue': revenue}
+                    for key, (count, nights, revenue) in sorted(totals.items())
+                ])
+            session.commit()
+            rows += len(totals)
+        finally:
+            session.close()
+        day = chunk_end
+    return BackfillResult((end - start).days, rows, time.monotonic() - started)
+
+
+BUCKETS = ('day', 'week', 'month')
+
+
+def bucket_start(day, bucket):
+    """First day of the ``bucket`` (day, week from Monday, month) holding
+    ``day``."""
+    if bucket == 'week':
+        return day - timedelta(days=day.weekday())
+    if bucket == 'month':
+        return day.replace(day=1)
+    return day
+
+
+def next_bucket(day, bucket):
+    if bucket == 'week':
+        return day + timedelta(days=7)
+    if bucket == 'month':
+        return (day + timedelta(days=32)).replace(day=1)
+    return day + timedelta(days=1)
+
+
+def timeseries(dbsession, start, end, bucket='day', room_id=None, status=None):
+    """Bookings, nights and revenue per ``bucket`` for the bookings created
+    in ``[start, end)``, read from the rollups.  Empty buckets are
+    included so the series has no gaps."""
+    BookingRollup = models.BookingRollup
+    query = dbsession.query(
+        BookingRollup.day,
+        func.sum(BookingRollup.bookings),
+        func.sum(BookingRollup.nights),
+        func.sum(BookingRollup.revenue),
+    ).filter(
+        BookingRollup.day >= start,
+        BookingRollup.day < end,
+    ).group_by(BookingRollup.day)
+    if room_id is not None:
+        query = query.filter(BookingRollup.room_id == room_id)
+    if status is not None:
+        query = query.filter(BookingRollup.status == status)
+
+    series = {}
+    period = bucket_start(start, bucket)
+    while period < end:
+        series[period] = [0, 0, 0.0]
+        period = next_bucket(period, bucket)
+    for day, count, nights, revenue in query:
+        values = series[bucket_start(day, bucket)]
+        values[0] += count or 0
+        values[1] += nights or 0
+        values[2] += revenue or 0.0
+    return [{'period': period.isoformat(), 'bookings': count, 'nights': nights,
+             'revenue': round(revenue, 2)}
+            for period, (count, nights, revenue) in series.items()]
+
+
+def compute_totals(dbsession):
+    """Recompute the totals from the base tables, in one statement."""
+    Booking = models.Booking
+    return Totals(*dbsession.execute(select(
+        select(func.count(models.User.id)).scalar_subquery(),
+        select(func.count(models.Room.id)).scalar_subquery(),
+        select(func.count(Booking.id)).scalar_subquery(),
+        select(func.coalesce(func.sum(Booking.total_price), 0.0)).scalar_subquery(),
+    )).one())
+
+
+def compute_room_stats(dbsession, room_id=None):
+    """Recompute ``{room_id: (bookings, revenue)}`` for rooms with bookings,
+    or only for ``room_id``."""
+    Booking = models.Booking
+    query = dbsession.query(
+        Booking.room_id, func.count(Booking.id), func.sum(Booking.total_price)
+    ).group_by(Booking.room_id)
+    if room_id is not None:
+        query = query.filter(Booking.room_id == room_id)
+    return {row_id: (count, revenue or 0.0) for row_id, count, revenue in query}
+
+
+def _totals_values(totals):
+    return {
+        'total_users': totals.users,
+        'total_rooms': totals.rooms,
+        'total_bookings': totals.bookings,
+        'total_revenue': totals.revenue,
+    }
+
+
+def rooms_inserted(dbsession, room_ids):
+    """Account for rooms inserted with bulk statements, which bypass the
+    flush listeners."""
+    room_ids = list(room_ids)
+    if not room_ids:
+        return
+    _add_totals(dbsession.connection(), rooms=len(room_ids))
+    dbsession.execute(insert(models.RoomStats), [
+        {'room_id': room_id, 'bookings': 0, 'revenue': 0.0} for room_id in room_ids
+    ])
+
+
+def _counted_unread():
+    return select(func.count(models.Notification.id)).where(
+        models.Notification.user_id == models.User.id,
+        models.Notification.is_read == False,
+    ).scalar_subquery()
+
+
+def repair_unread_counts(dbsession):
+    """Recompute ``users.unread_notifications``; returns the number of
+    users that were wrong."""
+    counted = _counted_unread()
+    result = dbsession.execute(update(models.User).where(
+        models.User.unread_notifications != counted
+    ).values(
+        unread_notifications=counted,
+        updated_at=models.User.updated_at,
+    ).execution_options(synchronize_session=False))
+    return result.rowcount
+
+
+def _stored_totals(dbsession):
+    """The ``Totals`` summed over the ``dashboard_stats`` rows, or None
+    until the table has been built."""
+    DashboardStats = models.DashboardStats
+    row = dbsession.query(
+        func.sum(DashboardStats.total_users),
+        func.sum(DashboardStats.total_rooms),
+        func.sum(DashboardStats.total_bookings),
+        func.sum(DashboardStats.total_revenue),
+        func.max(case((DashboardStats.id == TOTALS_ID, 1), else_=0)),
+    ).one()
+    if not row[4]:
+        return None
+    return Totals(*row[:4])
+
+
+def read_totals(dbsession):
+    """Return the dashboard ``Totals``; computed on the fly until the
+    stats table has been built."""
+    totals = _stored_totals(dbsession)
+    if totals is None:
+        return compute_totals(dbsession)
+    return totals
+
+
+def rebuild(dbsession):
+    """Replace the stats tables with a full recomputation."""
+    totals = compute_totals(dbsession)
+    per_room = compute_room_stats(dbsession)
+    room_ids = {room_id for room_id, in dbsession.query(models.Room.id)}
+    dbsession.execute(delete(models.RoomStats))
+    dbsession.execute(delete(models.DashboardStats))
+    dbsession.execute(insert(models.DashboardStats).values(id=TOTALS_ID, **_totals_values(totals)))
+    if room_ids:
+        dbsession.execute(insert(models.RoomStats), [
+            {'room_id': room_id, 'bookings': per_room.get(room_id, (0, 0.0))[0],
+             'revenue': per_room.get(room_id, (0, 0.0))[1]}
+            for room_id in sorted(room_ids)
+        ])
+    return totals
+
+
+def verify(dbsession):
+    """Compare the stats tables with a full recomputation and return a
+    list of human-readable mismatches (empty when they agree)."""
+    problems = []
+    stored = _stored_totals(dbsession)
+    expected = compute_totals(dbsession)
+    if stored is None:
+        problems.append('dashboard_stats row is missing')
+    else:
+        stored = _totals_values(stored)
+        for field, value in _totals_values(expected).items():
+            if round(stored[field], 2) != round(value, 2):
+                problems.append('%s: stored %s, expected %s' % (
+                    field, stored[field], value))
+
+    for user_id, stored_count, count in dbsession.query(
+        models.User.id, models.User.unread_notifications, _counted_unread()
+    ).filter(models.User.unread_notifications != _counted_unread()).order_by(models.User.id):
+        problems.append('user %d: unread_notifications is %d, expected %d' % (
+            user_id, stored_count, count))
+
+    per_room = compute_room_stats(dbsession)
+    stored_rooms = {row.room_id: (row.bookings, row.revenue)
+                    for row in dbsession.query(models.RoomStats)}
+    for room_id, in dbsession.query(models.Room.id).order_by(models.Room.id):
+        count, revenue = per_room.get(room_id, (0, 0.0))
+        if room_id not in stored_rooms:
+            problems.append('room %d: room_stats row is missing' % room_id)
+            continue
+        stored_count, stored_revenue = stored_rooms.pop(room_id)
+        if stored_count != count or round(stored_revenue, 2) != round(revenue, 2):
+            problems.append('room %d: stored %d bookings / %s revenue, expected %d / %s' % (
+                room_id, stored_count, stored_revenue, count, revenue))
+    for room_id in sorted(stored_rooms):
+        problems.append('room %d: room_stats row for a deleted room' % room_id)
+    return problems
+
+
+def includeme(config):
+    """
+    Maintain the dashboard stats tables from the application's sessions.
+
+    Activate this setup using ``config.include('roomify_backend.stats')``.
+
+    """
+    track(config.registry['dbsession_factory'])
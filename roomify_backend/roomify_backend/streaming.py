@@ -0,0 +1,63 @@
+"""Streaming responses for large list endpoints.
+
+A streamed list is written as the same JSON array the buffered view
+would render, but rows are fetched ``batch_size`` at a time with
+``yield_per`` and encoded as they arrive, so memory stays flat however
+many rows there are.
+
+The body is produced after the view has returned and ``pyramid_tm`` has
+finished with ``request.dbsession``, so the generator reads through a
+session of its own from the registry's ``dbsession_factory``.  Streamed
+responses are not buffered, so the body-hash ETag tween leaves them
+alone.
+"""
+import json
+import logging
+
+from pyramid.response import Response
+
+log = logging.getLogger(__name__)
+
+BATCH_SIZE = 500
+
+
+def wants_stream(request):
+    """True when the client asked for ``?stream=1``."""
+    return request.params.get('stream', '').lower() in ('1', 'true', 'yes')
+
+
+def iter_json_array(session_factory, build_query, serialize, batch_size=BATCH_SIZE):
+    """Yield the UTF-8 chunks of a JSON array of ``serialize(row)`` for
+    every row of ``build_query(session)``, one chunk per batch."""
+    session = session_factory()
+    try:
+        query = build_query(session).yield_per(batch_size)
+        yield b'['
+        chunk = []
+        first = True
+        for row in query:
+            chunk.append(('' if first else ',') + json.dumps(serialize(row)))
+            first = False
+            if len(chunk) >= batch_size:
+                yield ''.join(chunk).encode('utf-8')
+                chunk = []
+        if chunk:
+            yield ''.join(chunk).encode('utf-8')
+        yield b']'
+    except Exception:
+        # Headers are already sent; a truncated array is all we can signal
+        log.exception('Streaming response failed')
+        raise
+    finally:
+        session.close()
+
+
+def stream_json_array(request, build_query, serialize, batch_size=BATCH_SIZE):
+    """Return a streaming ``application/json`` response for the rows of
+    ``build_query(session)``."""
+    return Response(
+        app_iter=iter_json_array(request.registry['dbsession_factory'],
+                                 build_query, serialize, batch_size),
+        content_type='application/json',
+        charset='UTF-8',
+    )
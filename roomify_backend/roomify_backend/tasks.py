@@ -0,0 +1,136 @@
+"""Background maintenance jobs.
+
+Each job is a plain function taking a session factory so it can run from
+a console script or from a ``PeriodicTask`` thread inside the app.
+"""
+from collections import namedtuple
+from datetime import datetime
+import logging
+import threading
+import time
+
+from pyramid.events import NewRequest
+
+from . import models, outbox
+
+log = logging.getLogger(__name__)
+
+
+SweepResult = namedtuple('SweepResult', 'tokens revoked_tokens elapsed')
+
+
+def _delete_expired(session_factory, model, now, batch_size):
+    """Delete expired rows of ``model`` in batches, one transaction each."""
+    removed = 0
+    while True:
+        session = session_factory()
+        try:
+            ids = [row.id for row in session.query(model.id).filter(
+                model.expires_at <= now
+            ).order_by(model.expires_at).limit(batch_size)]
+            if ids:
+                session.query(model).filter(
+                    model.id.in_(ids)
+                ).delete(synchronize_session=False)
+                session.commit()
+        finally:
+            session.close()
+        removed += len(ids)
+        if len(ids) < batch_size:
+            return removed
+
+
+def sweep_expired_tokens(session_factory, batch_size=1000, now=None):
+    """Remove expired ``tokens`` and ``revoked_tokens`` rows.
+
+    Uses the ``expires_at`` indexes so each batch is a range scan; batches
+    are committed separately to keep locks short.
+    """
+    start = time.monotonic()
+    now = now or datetime.now()
+    tokens = _delete_expired(session_factory, models.Token, now, batch_size)
+    revoked = _delete_expired(session_factory, models.RevokedToken, now, batch_size)
+    return SweepResult(tokens, revoked, time.monotonic() - start)
+
+
+def vacuum(engine, tables=('tokens', 'revoked_tokens')):
+    """Give space freed by a sweep back to the operating system."""
+    with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+        if engine.dialect.name == 'sqlite':
+            conn.exec_driver_sql('VACUUM')
+        elif engine.dialect.name == 'postgresql':
+            for table in tables:
+                conn.exec_driver_sql('VACUUM ANALYZE %s' % table)
+
+
+class PeriodicTask(threading.Thread):
+    """Daemon thread calling ``func()`` every ``interval`` seconds."""
+
+    def __init__(self, name, func, interval):
+        super(PeriodicTask, self).__init__(name=name, daemon=True)
+        self.func = func
+        self.interval = interval
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            try:
+                self.func()
+            except Exception:
+                log.exception('Periodic task %s failed', self.name)
+
+    def stop(self):
+        self._stopped.set()
+
+
+def includeme(config):
+    """
+    Set up the optional in-process maintenance threads.
+
+    The threads start with the first request the app serves, so console
+    scripts loading the app with ``bootstrap`` never run them.
+
+    Activate this setup using ``config.include('roomify_backend.tasks')``.
+
+    """
+    settings = config.get_settings()
+    session_factory = config.registry['dbsession_factory']
+    tasks = []
+
+    interval = float(settings.get('auth.token_sweep_interval', 0))
+    if interval > 0:
+        batch_size = int(settings.get('auth.token_sweep_batch_size', 1000))
+
+        def sweep():
+            result = sweep_expired_tokens(session_factory, batch_size=batch_size)
+            log.info('Token sweep removed %d tokens and %d revocations in %.3fs',
+                     result.tokens, result.revoked_tokens, result.elapsed)
+
+        task = PeriodicTask('token-sweeper', sweep, interval)
+        tasks.append(task)
+        config.registry['token_sweeper'] = task
+
+    interval = float(settings.get('outbox.worker_interval', 0))
+    if interval > 0:
+        worker = outbox.worker_from_settings(settings, session_factory)
+
+        def deliver():
+            result = worker.drain()
+            if result.done or result.retried or result.failed:
+                log.info('Outbox delivered %d messages, %d retried, %d failed in %.3fs',
+                         result.done, result.retried, result.failed, result.elapsed)
+
+        task = PeriodicTask('outbox-worker', deliver, interval)
+        tasks.append(task)
+        config.registry['outbox_worker'] = task
+
+    if tasks:
+        lock = threading.Lock()
+
+        def start_tasks(event):
+            if tasks:
+                with lock:
+                    while tasks:
+                        tasks.pop().start()
+
+        config.add_subscriber(start_tasks, NewRequest)
@@ -1,3 +1,4 @@
+from contextlib import contextmanager
 import unittest
 import transaction
 
@@ -8,6 +9,23 @@ def dummy_request(dbsession):
     return testing.DummyRequest(dbsession=dbsession)
 
 
+@contextmanager
+def count_queries(engine):
+    """Collect the SQL statements ``engine`` executes inside the block."""
+    from sqlalchemy import event
+
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+
+
 class BaseTest(unittest.TestCase):
     def setUp(self):
         self.config = testing.setUp(settings={
@@ -63,3 +81,1417 @@ class TestMyViewFailureCondition(BaseTest):
         from .views.default import my_view
         info = my_view(dummy_request(self.session))
         self.assertEqual(info.status_int, 500)
+
+
+class TestTTLCache(unittest.TestCase):
+
+    def _makeOne(self, **kw):
+        from .cache import TTLCache
+        self.now = 1000.0
+        return TTLCache(clock=lambda: self.now, **kw)
+
+    def test_evicts_least_recently_used(self):
+        cache = self._makeOne(max_size=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), 1)
+        self.assertEqual(cache.stats()['evictions'], 1)
+
+    def test_entry_expires_at_earliest_deadline(self):
+        cache = self._makeOne(ttl=60)
+        cache.set('a', 1, expires=self.now + 5)
+        self.assertEqual(cache.get('a'), 1)
+        self.now += 6
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.stats()['hits'], 1)
+        self.assertEqual(cache.stats()['misses'], 1)
+
+
+class TestResolveToken(BaseTest):
+
+    def setUp(self):
+        super(TestResolveToken, self).setUp()
+        self.init_database()
+        from .models import get_session_factory
+        self.config.registry['dbsession_factory'] = get_session_factory(self.engine)
+        self.config.include('.security')
+
+        from .models import Token, User
+
+        user = User(username='guest', email='guest@example.com', password='x')
+        self.session.add(user)
+        self.session.flush()
+        token = Token.create_token(user.id)
+        self.session.add(token)
+        self.session.flush()
+        self.token_str = token.token
+
+    def _request(self, token_str):
+        request = dummy_request(self.session)
+        request.headers['Authorization'] = 'Bearer ' + token_str
+        return request
+
+    def test_second_lookup_is_served_from_cache(self):
+        from .security import resolve_token
+        first = resolve_token(self._request(self.token_str))
+        second = resolve_token(self._request(self.token_str))
+        self.assertEqual(first, second)
+        stats = self.config.registry['token_cache'].stats()
+        self.assertEqual((stats['hits'], stats['misses']), (1, 1))
+
+    def test_admin_required(self):
+        from .security import resolve_token
+        request = self._request(self.token_str)
+        self.assertIsNone(resolve_token(request, admin=True))
+
+    def test_revoked_token_is_rejected(self):
+        from .security import resolve_token, revoke_token
+        request = self._request(self.token_str)
+        self.assertIsNotNone(resolve_token(request))
+        self.assertTrue(revoke_token(request, self.token_str))
+        self.assertIsNone(resolve_token(request))
+
+    def test_revocation_clears_the_cache_again_on_commit(self):
+        from .security import resolve_token, revoke_token
+        self.session.flush()
+        transaction.commit()
+        session = self.config.registry['dbsession_factory']()
+        request = dummy_request(session)
+        cached = resolve_token(request, self.token_str)
+        self.assertTrue(revoke_token(request, self.token_str))
+        # A concurrent request still sees the committed row and caches it
+        cache = self.config.registry['token_cache']
+        cache.set(self.token_str, cached)
+        session.commit()
+        self.assertIsNone(cache.get(self.token_str))
+        self.assertIsNone(resolve_token(request, self.token_str))
+        session.close()
+
+
+class TestSecurityPolicy(TestResolveToken):
+
+    def test_identity_loads_user_with_token(self):
+        from .security import load_identity
+        identity = load_identity(self._request(self.token_str))
+        self.assertEqual(identity._user.username, 'guest')
+        self.assertFalse(identity.is_admin)
+
+    def test_anonymous_and_preflight_skip_database(self):
+        from .security import load_identity
+        request = testing.DummyRequest(dbsession=None)
+        self.assertIsNone(load_identity(request))
+        request = testing.DummyRequest(dbsession=None, method='OPTIONS')
+        request.headers['Authorization'] = 'Bearer ' + self.token_str
+        self.assertIsNone(load_identity(request))
+
+    def test_is_admin_permission(self):
+        from .security import SecurityPolicy, load_identity
+        request = self._request(self.token_str)
+        request.auth_identity = load_identity(request)
+        policy = SecurityPolicy()
+        self.assertTrue(policy.permits(request, None, 'authenticated'))
+        denied = policy.permits(request, None, 'is_admin')
+        self.assertFalse(denied)
+        self.assertEqual(denied.msg, 'Admin authentication required')
+
+
+class TestSignedTokens(BaseTest):
+
+    def setUp(self):
+        super(TestSignedTokens, self).setUp()
+        self.init_database()
+        from .models import get_session_factory
+        from .security import RevocationList, TokenSigner
+        self.signer = TokenSigner('s3cret')
+        self.config.registry['token_signer'] = self.signer
+        self.config.registry['revoked_tokens'] = RevocationList(
+            get_session_factory(self.engine))
+
+    def test_verify_without_database(self):
+        from .security import resolve_token
+        token = self.signer.issue(7, is_admin=True)
+        request = testing.DummyRequest(dbsession=None)
+        request.registry['revoked_tokens'].reload = lambda: None
+        resolved = resolve_token(request, token.token, admin=True)
+        self.assertEqual((resolved.user_id, resolved.jti), (7, token.jti))
+
+    def test_tampered_token_is_rejected(self):
+        token = self.signer.issue(7).token
+        payload, signature = token[3:].split('.')
+        self.assertIsNone(self.signer.verify('v1.%s.%s' % (payload, signature[::-1])))
+        self.assertIsNone(self.signer.verify(token.replace('v1.', 'v1.x')))
+
+    def test_revoked_token_is_rejected(self):
+        from .security import resolve_token, revoke_token
+        token = self.signer.issue(7).token
+        request = dummy_request(self.session)
+        self.assertTrue(revoke_token(request, token))
+        self.assertIsNone(resolve_token(request, token))
+
+
+class TestSweepExpiredTokens(BaseTest):
+
+    def test_removes_only_expired_tokens_in_batches(self):
+        from datetime import datetime, timedelta
+        from .models import Token, get_session_factory
+        from .tasks import sweep_expired_tokens
+
+        self.init_database()
+        session_factory = get_session_factory(self.engine)
+        session = session_factory()
+        past = datetime.now() - timedelta(days=1)
+        for i in range(3):
+            session.add(Token(user_id=1, token='old%d' % i, expires_at=past))
+        session.add(Token.create_token(1))
+        session.commit()
+
+        result = sweep_expired_tokens(session_factory, batch_size=2)
+        self.assertEqual((result.tokens, result.revoked_tokens), (3, 0))
+        self.assertEqual(session.query(Token).count(), 1)
+        session.close()
+
+
+class TestRoomCatalog(BaseTest):
+
+    def test_body_is_reused_until_a_room_commit(self):
+        import json
+        from .catalog import RoomCatalog
+        from .cache import on_commit
+        from .models import Room, get_session_factory
+
+        self.init_database()
+        catalog = RoomCatalog()
+        session_factory = get_session_factory(self.engine)
+        on_commit(session_factory, Room, catalog.bump)
+        session = session_factory()
+
+        first = catalog.get(session).body
+        self.assertEqual(catalog.get(session).body, first)
+        self.assertEqual(json.loads(first)['data'], [])
+
+        session.add(Room(name='Deluxe', description='d', price_per_night=10.0))
+        session.commit()
+        data = json.loads(catalog.get(session).body)['data']
+        self.assertEqual([room['name'] for room in data], ['Deluxe'])
+        self.assertEqual((catalog.hits, catalog.misses), (1, 2))
+        session.close()
+
+    def test_room_lists_are_not_validated_by_last_modified(self):
+        from datetime import datetime, timedelta
+        from pyramid.request import Request
+        from .catalog import RoomCatalog
+        from .cache import on_commit
+        from .models import Room, get_session_factory
+        from .views.admin import get_all_rooms_admin
+        from .views.api import get_rooms
+
+        self.init_database()
+        catalog = RoomCatalog()
+        session_factory = get_session_factory(self.engine)
+        on_commit(session_factory, Room, catalog.bump)
+        self.config.registry['room_catalog'] = catalog
+        session = session_factory()
+        now = datetime.now()
+        old = Room(name='Old', description='d', price_per_night=10.0,
+                   updated_at=now - timedelta(seconds=2))
+        new = Room(name='New', description='d', price_per_night=10.0, updated_at=now)
+        session.add_all([old, new])
+        session.commit()
+
+        def get(view, path):
+            request = Request.blank(path, headers={
+                'If-Modified-Since': 'Thu, 01 Jan 2037 00:00:00 GMT'})
+            request.registry = self.config.registry
+            request.dbsession = session
+            return view(request), request
+
+        # Hiding the newest room changes the listing even though no
+        # remaining room is newer than before
+        response, _ = get(get_rooms, '/api/rooms')
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(response.last_modified)
+        new.is_available = False
+        session.commit()
+        response, _ = get(get_rooms, '/api/rooms')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'"Old"', response.body)
+        self.assertNotIn(b'"New"', response.body)
+
+        session.delete(new)
+        session.commit()
+        result, request = get(get_all_rooms_admin, '/api/admin/rooms')
+        self.assertNotEqual(getattr(result, 'status_code', 200), 304)
+        self.assertIsNone(request.response.last_modified)
+        session.close()
+
+    def test_on_commit_is_scoped_to_its_factory_and_idempotent(self):
+        from .cache import on_commit
+        from .models import Room, get_session_factory
+
+        self.init_database()
+        committed = []
+        session_factory = get_session_factory(self.engine)
+        on_commit(session_factory, Room, committed.append)
+        on_commit(session_factory, Room, committed.append)
+        other = get_session_factory(self.engine)()
+        other.add(Room(name='Other', description='d', price_per_night=10.0))
+        other.commit()
+        other.close()
+        session = session_factory()
+        room = Room(name='Deluxe', description='d', price_per_night=10.0)
+        session.add(room)
+        session.commit()
+        self.assertEqual(committed, [{room.id}])
+        session.close()
+
+
+class TestNotModified(unittest.TestCase):
+
+    def setUp(self):
+        self.config = testing.setUp()
+
+    def tearDown(self):
+        testing.tearDown()
+
+    def test_matching_etag_returns_304(self):
+        from pyramid.request import Request
+        from .conditional import make_etag, not_modified
+        etag = make_etag(1, '2026-01-01T00:00:00')
+        request = Request.blank('/', headers={'If-None-Match': '"%s"' % etag})
+        request.registry = self.config.registry
+        self.assertEqual(not_modified(request, etag).status_int, 304)
+        self.assertIsNone(not_modified(request, make_etag(2)))
+        self.assertEqual(request.response.etag, make_etag(2))
+
+
+class TestKeysetPagination(BaseTest):
+
+    def test_pages_cover_all_rows_newest_first(self):
+        from datetime import datetime
+        from .models import Notification
+        from .pagination import decode_cursor, paginate
+
+        self.init_database()
+        created_at = datetime(2026, 1, 1)
+        for i in range(5):
+            self.session.add(Notification(user_id=1, title='t', message=str(i),
+                                          created_at=created_at))
+        self.session.flush()
+
+        query = self.session.query(Notification)
+        seen, cursor = [], None
+        while True:
+            rows, cursor = paginate(query, Notification, 2,
+                                    cursor and decode_cursor(cursor))
+            seen.extend(row.id for row in rows)
+            if cursor is None:
+                break
+        self.assertEqual(seen, [5, 4, 3, 2, 1])
+
+
+class TestRoomSearch(BaseTest):
+
+    def setUp(self):
+        super(TestRoomSearch, self).setUp()
+        self.init_database()
+        from .models import Room
+        self.session.add_all([
+            Room(name='Single', description='d', price_per_night=50.0, capacity=1,
+                 amenities='wifi'),
+            Room(name='Family', description='d', price_per_night=120.0, capacity=4,
+                 amenities='["WiFi", "Pool"]'),
+            Room(name='Suite', description='d', price_per_night=300.0, capacity=2,
+                 room_type='suite', amenities='wifi, pool, spa'),
+            Room(name='Closed', description='d', price_per_night=80.0, capacity=4,
+                 is_available=False),
+        ])
+        self.session.flush()
+
+    def _search(self, index=None, **params):
+        from .search import parse_search, search_rooms
+        criteria = parse_search(params)
+        return [room.name for room in search_rooms(self.session, criteria, index)]
+
+    def test_filters_and_sorting(self):
+        self.assertEqual(self._search(capacity='2', sort='price_desc'), ['Suite', 'Family'])
+        self.assertEqual(self._search(max_price='150'), ['Single', 'Family'])
+        self.assertEqual(self._search(room_type='suite'), ['Suite'])
+        self.assertEqual(self._search(available='false'), ['Closed'])
+
+    def test_amenities_are_intersected(self):
+        from .models import Room
+        from .search import AmenityIndex
+        index = AmenityIndex()
+        self.assertEqual(self._search(index, amenities='Pool,wifi'), ['Family', 'Suite'])
+        self.assertEqual(self._search(index, amenities='sauna'), [])
+
+        family = self.session.query(Room).filter(Room.name == 'Family').one()
+        family.amenities = 'wifi'
+        self.session.flush()
+        index.invalidate({family.id})
+        self.assertEqual(self._search(index, amenities='wifi,pool'), ['Suite'])
+        self.assertEqual(index.refreshes, 2)
+
+    def test_amenities_that_are_json_scalars(self):
+        from .search import parse_amenities
+        self.assertEqual(parse_amenities('5'), {'5'})
+        self.assertEqual(parse_amenities('true'), {'true'})
+        self.assertEqual(parse_amenities('null'), set())
+        self.assertEqual(parse_amenities('["Spa", null, 3]'), {'spa', '3'})
+
+    def test_import_rejects_amenities_that_are_not_names(self):
+        from .room_import import clean
+        self.assertEqual(clean({'name': 'A', 'amenities': ['Spa']})['amenities'], '["Spa"]')
+        self.assertRaises(ValueError, clean, {'name': 'A', 'amenities': 5})
+
+    def test_failed_refresh_keeps_rooms_stale(self):
+        from unittest import mock
+        from .models import Room
+        from .search import AmenityIndex
+        index = AmenityIndex()
+        self.assertEqual(self._search(index, amenities='spa'), ['Suite'])
+
+        suite = self.session.query(Room).filter(Room.name == 'Suite').one()
+        index.invalidate({suite.id})
+        with mock.patch('roomify_backend.search.parse_amenities', side_effect=RuntimeError):
+            self.assertRaises(RuntimeError, self._search, index, amenities='spa')
+        self.assertEqual(self._search(index, amenities='spa'), ['Suite'])
+
+    def test_rejects_unknown_sort(self):
+        self.assertRaises(ValueError, self._search, sort='name')
+
+
+class TestFreeRooms(BaseTest):
+
+    def test_overlapping_non_cancelled_bookings_block_a_room(self):
+        from datetime import date
+        from .availability import free_rooms
+        from .models import Booking, Room
+
+        self.init_database()
+        rooms = [Room(name=name, description='d', price_per_night=10.0 * (i + 1))
+                 for i, name in enumerate(['A', 'B', 'C'])]
+        self.session.add_all(rooms)
+        self.session.flush()
+        self.session.add_all([
+            Booking(user_id=1, room_id=rooms[0].id, check_in_date=date(2026, 5, 1),
+                    check_out_date=date(2026, 5, 4), total_price=30.0),
+            Booking(user_id=1, room_id=rooms[1].id, check_in_date=date(2026, 5, 2),
+                    check_out_date=date(2026, 5, 3), total_price=20.0, status='cancelled'),
+            Booking(user_id=1, room_id=rooms[2].id, check_in_date=date(2026, 4, 28),
+                    check_out_date=date(2026, 5, 3), total_price=50.0),
+        ])
+        self.session.flush()
+
+        def names(check_in, check_out):
+            return [room.name for room in free_rooms(self.session, check_in, check_out)]
+
+        self.assertEqual(names(date(2026, 5, 3), date(2026, 5, 5)), ['B', 'C'])
+        self.assertEqual(names(date(2026, 5, 4), date(2026, 5, 6)), ['A', 'B', 'C'])
+        self.assertEqual(names(date(2026, 4, 30), date(2026, 5, 1)), ['A', 'B'])
+
+    def test_occupancy_calendar_caches_month_bitmaps(self):
+        from datetime import date
+        from .availability import OccupancyCalendar, occupancy_runs
+        from .models import Booking, Room
+
+        self.init_database()
+        room = Room(name='A', description='d', price_per_night=10.0)
+        self.session.add(room)
+        self.session.flush()
+        self.session.add_all([
+            Booking(user_id=1, room_id=room.id, check_in_date=date(2026, 4, 29),
+                    check_out_date=date(2026, 5, 3), total_price=40.0),
+            Booking(user_id=1, room_id=room.id, check_in_date=date(2026, 5, 10),
+                    check_out_date=date(2026, 5, 12), total_price=20.0, status='cancelled'),
+            Booking(user_id=1, room_id=room.id, check_in_date=date(2026, 5, 30),
+                    check_out_date=date(2026, 6, 2), total_price=30.0),
+        ])
+        self.session.flush()
+
+        calendar = OccupancyCalendar()
+        may = calendar.month(self.session, room.id, date(2026, 5, 1))
+        self.assertEqual(occupancy_runs(may, 31), [[1, 2], [30, 2]])
+        self.assertEqual(calendar.month(self.session, room.id, date(2026, 5, 1)), may)
+        self.assertEqual(calendar.stats()['hits'], 1)
+
+        calendar.invalidate({room.id})
+        calendar.month(self.session, room.id, date(2026, 5, 1))
+        self.assertEqual(calendar.stats()['misses'], 2)
+
+    def test_moving_a_booking_invalidates_both_rooms(self):
+        from datetime import date
+        from .availability import OccupancyCalendar, _booking_room_id, occupancy_runs
+        from .cache import on_commit
+        from .models import Booking, Room, get_session_factory
+
+        self.init_database()
+        session_factory = get_session_factory(self.engine)
+        calendar = OccupancyCalendar()
+        on_commit(session_factory, Booking, calendar.invalidate, key=_booking_room_id)
+        session = session_factory()
+        rooms = [Room(name=name, description='d', price_per_night=10.0) for name in 'AB']
+        session.add_all(rooms)
+        session.flush()
+        booking = Booking(user_id=1, room_id=rooms[0].id, check_in_date=date(2026, 5, 2),
+                          check_out_date=date(2026, 5, 4), total_price=20.0)
+        session.add(booking)
+        session.commit()
+
+        may = date(2026, 5, 1)
+        self.assertEqual(occupancy_runs(calendar.month(session, rooms[0].id, may), 31), [[2, 2]])
+        self.assertEqual(calendar.month(session, rooms[1].id, may), 0)
+        booking.room_id = rooms[1].id
+        session.commit()
+        self.assertEqual(calendar.month(session, rooms[0].id, may), 0)
+        self.assertEqual(occupancy_runs(calendar.month(session, rooms[1].id, may), 31), [[2, 2]])
+        session.close()
+
+
+class TestConcurrentBookings(unittest.TestCase):
+    """Stress test: parallel booking requests against one room."""
+
+    def setUp(self):
+        import tempfile
+        from webtest import TestApp
+        from . import main
+        from .models import Room, Token, User
+        from .models.meta import Base
+
+        self.tmpdir = tempfile.mkdtemp()
+        app = main({}, **{
+            'sqlalchemy.url': 'sqlite:///%s/test.sqlite' % self.tmpdir,
+            'retry.attempts': '1',
+        })
+        session_factory = app.registry['dbsession_factory']
+        self.engine = session_factory.kw['bind']
+        Base.metadata.create_all(self.engine)
+
+        session = session_factory()
+        user = User(username='guest', email='guest@example.com', password='x')
+        room = Room(name='Deluxe', description='d', price_per_night=100.0)
+        session.add_all([user, room])
+        session.flush()
+        token = Token.create_token(user.id)
+        session.add(token)
+        session.commit()
+        self.room_id = room.id
+        self.headers = {'Authorization': 'Bearer ' + token.token}
+        session.close()
+
+        self.testapp = TestApp(app)
+
+    def tearDown(self):
+        import shutil
+        self.engine.dispose()
+        shutil.rmtree(self.tmpdir)
+
+    def _book_in_parallel(self, stays):
+        from concurrent.futures import ThreadPoolExecutor
+
+        def book(stay):
+            return self.testapp.post_json('/api/bookings', {
+                'room_id': self.room_id,
+                'check_in_date': stay[0],
+                'check_out_date': stay[1],
+            }, headers=self.headers, expect_errors=True).status_int
+
+        with ThreadPoolExecutor(max_workers=len(stays)) as pool:
+            return list(pool.map(book, stays))
+
+    def test_overlapping_requests_book_the_room_once(self):
+        statuses = self._book_in_parallel([('2026-06-01', '2026-06-05')] * 10)
+        self.assertEqual(sorted(statuses), [200] + [409] * 9)
+
+    def test_non_overlapping_requests_all_succeed(self):
+        stays = [('2026-07-%02d' % day, '2026-07-%02d' % (day + 1)) for day in range(1, 11)]
+        self.assertEqual(self._book_in_parallel(stays), [200] * 10)
+
+
+class TestPricingEngine(BaseTest):
+
+    def test_quotes_every_room_for_every_stay(self):
+        from datetime import date
+        from .models import Room
+        from .pricing import PricingEngine, parse_quote_request
+
+        self.init_database()
+        room = Room(name='Deluxe', description='d', price_per_night=99.5)
+        self.session.add(room)
+        self.session.flush()
+
+        room_ids, stays = parse_quote_request({
+            'room_ids': [room.id, 404],
+            'stays': [{'check_in': '2026-03-01', 'check_out': '2026-03-04'},
+                      {'check_in': '2026-03-10', 'check_out': '2026-03-11'}],
+        })
+        quotes, missing = PricingEngine().quote_many(self.session, room_ids, stays)
+        self.assertEqual([(q['nights'], q['total_price']) for q in quotes],
+                         [(3, 298.5), (1, 99.5)])
+        self.assertEqual(missing, [404])
+        self.assertEqual(stays[0], (date(2026, 3, 1), date(2026, 3, 4)))
+
+    def test_rate_calendar_applies_rules_and_overrides(self):
+        from datetime import date
+        from .models import RateRule, Room, RoomRate
+        from .pricing import PricingEngine, RateCalendar
+
+        self.init_database()
+        room = Room(name='Deluxe', description='d', price_per_night=100.0)
+        self.session.add(room)
+        self.session.flush()
+        # 2026-03-06 is a Friday
+        self.session.add_all([
+            RateRule(name='Weekend', weekdays='4,5', multiplier=1.5, priority=0),
+            RateRule(room_id=room.id, name='Spring', start_date=date(2026, 3, 7),
+                     end_date=date(2026, 3, 9), price=80.0, priority=1),
+            RoomRate(room_id=room.id, date=date(2026, 3, 8), price=300.0),
+        ])
+        self.session.flush()
+
+        calendar = RateCalendar(horizon_days=5, today=lambda: date(2026, 3, 5))
+        engine = PricingEngine(calendar)
+        # Thu 100, Fri 150, Sat 80 (Spring beats Weekend), Sun 300 (override)
+        self.assertEqual(engine.total(self.session, room, date(2026, 3, 5),
+                                      date(2026, 3, 9)), 630.0)
+        # Stays running past the horizon are priced night by night
+        self.assertEqual(engine.total(self.session, room, date(2026, 3, 8),
+                                      date(2026, 3, 14)), 300.0 + 100 * 4 + 150)
+        self.assertEqual(calendar.stats()['builds'], 1)
+
+        room.price_per_night = 120.0
+        calendar.invalidate({room.id})
+        self.assertEqual(engine.total(self.session, room, date(2026, 3, 5),
+                                      date(2026, 3, 6)), 120.0)
+        self.assertEqual(calendar.stats()['builds'], 2)
+
+    def test_deleting_a_room_removes_its_rates(self):
+        from datetime import date
+        from sqlalchemy import text
+        from .models import RateRule, Room, RoomRate
+        from .views.admin import delete_room
+
+        self.init_database()
+        self.session.execute(text('PRAGMA foreign_keys=ON'))
+        room = Room(name='Deluxe', description='d', price_per_night=100.0)
+        self.session.add(room)
+        self.session.flush()
+        self.session.add_all([
+            RateRule(name='Weekend', weekdays='4,5', multiplier=1.5, priority=0),
+            RateRule(room_id=room.id, name='Spring', price=80.0, priority=1),
+            RoomRate(room_id=room.id, date=date(2026, 3, 8), price=300.0),
+        ])
+        self.session.flush()
+
+        request = dummy_request(self.session)
+        request.matchdict = {'id': room.id}
+        self.assertTrue(delete_room(request)['success'])
+        self.session.flush()
+        self.assertEqual(self.session.query(Room).count(), 0)
+        self.assertEqual([rule.name for rule in self.session.query(RateRule)], ['Weekend'])
+        self.assertEqual(self.session.query(RoomRate).count(), 0)
+
+
+class TestAdminStats(BaseTest):
+
+    def test_dashboard_query_count_does_not_grow_with_rooms(self):
+        from datetime import date
+        from .models import Booking, Room, User
+        from .stats import rebuild
+        from .views.admin import get_admin_stats
+
+        self.init_database()
+        user = User(username='guest', email='g@x', password='p')
+        rooms = [Room(name='R%d' % i, description='d', price_per_night=50.0)
+                 for i in range(50)]
+        self.session.add(user)
+        self.session.add_all(rooms)
+        self.session.flush()
+        self.session.add_all([
+            Booking(user_id=user.id, room_id=room.id, check_in_date=date(2026, 5, 1),
+                    check_out_date=date(2026, 5, 3), total_price=100.0)
+            for room in rooms[:10] for _ in range(2)
+        ])
+        self.session.flush()
+        rebuild(self.session)
+        self.session.expire_all()
+
+        with count_queries(self.engine) as statements:
+            info = get_admin_stats(dummy_request(self.session))
+
+        self.assertEqual(len(statements), 3)
+        self.assertEqual(info['stats'], {'totalVisitors': 1, 'totalBookings': 20,
+                                         'totalRevenue': 2000.0, 'totalRooms': 50})
+        self.assertEqual(len(info['recentBookings']), 5)
+        self.assertEqual(info['recentBookings'][0]['user'], 'guest')
+        self.assertEqual([(r['bookings'], r['revenue']) for r in info['roomStats'][9:11]],
+                         [(2, 200.0), (0, 0)])
+
+    def test_stats_tables_follow_flushes(self):
+        from datetime import date
+        from .models import Booking, DashboardStats, Room, RoomStats, User, get_session_factory
+        from .stats import TOTALS_ID, read_totals, rebuild, track, verify
+
+        self.init_database()
+        session_factory = get_session_factory(self.engine)
+        track(session_factory)
+        session = session_factory()
+        rebuild(session)
+
+        user = User(username='guest', email='g@x', password='p')
+        rooms = [Room(name='A', description='d', price_per_night=50.0),
+                 Room(name='B', description='d', price_per_night=80.0)]
+        session.add(user)
+        session.add_all(rooms)
+        session.flush()
+        bookings = [Booking(user_id=user.id, room_id=rooms[0].id, check_in_date=date(2026, 5, 1),
+                            check_out_date=date(2026, 5, 3), total_price=100.0)
+                    for _ in range(3)]
+        session.add_all(bookings)
+        session.commit()
+        self.assertEqual(read_totals(session), (1, 2, 3, 300.0))
+
+        bookings[0].room_id = rooms[1].id
+        bookings[0].total_price = 160.0
+        session.delete(bookings[1])
+        session.commit()
+        self.assertEqual(read_totals(session), (1, 2, 2, 260.0))
+        # Changes since the rebuild live in shards next to the base row
+        self.assertEqual(session.query(DashboardStats).filter(
+            DashboardStats.id == TOTALS_ID).one().total_bookings, 0)
+        self.assertEqual([session.get(RoomStats, room.id).bookings for room in rooms], [1, 1])
+        self.assertEqual(verify(session), [])
+
+        session.get(RoomStats, rooms[0].id).bookings = 7
+        session.commit()
+        self.assertEqual(verify(session), ['room %d: stored 7 bookings / 100.0 revenue, expected 1 / 100.0'
+                                           % rooms[0].id])
+        rebuild(session)
+        self.assertEqual(verify(session), [])
+        session.close()
+
+    def test_admin_room_list_is_one_query(self):
+        from datetime import date
+        from pyramid.request import Request
+        from .models import Room, RoomStats
+        from .views.admin import get_all_rooms_admin
+
+        self.init_database()
+        rooms = [Room(name='R%d' % i, description='d', price_per_night=50.0)
+                 for i in range(30)]
+        self.session.add_all(rooms)
+        self.session.flush()
+        # A room without a room_stats row counts as unbooked
+        self.session.add_all([RoomStats(room_id=room.id, bookings=i % 3, revenue=0.0)
+                              for i, room in enumerate(rooms) if i != 3])
+        self.session.flush()
+        self.session.expire_all()
+
+        request = Request.blank('/api/admin/rooms')
+        request.registry = self.config.registry
+        request.dbsession = self.session
+        with count_queries(self.engine) as statements:
+            rooms_list = get_all_rooms_admin(request)
+
+        # One query for the cache validators, one for the rooms
+        self.assertEqual(len(statements), 2)
+        self.assertEqual([room['booking_count'] for room in rooms_list[:4]], [0, 1, 2, 0])
+
+    def test_add_upserts_new_keys(self):
+        from datetime import date
+        from .models import BookingRollup
+        from .stats import _add
+
+        self.init_database()
+        conn = self.session.connection()
+        key = {'day': date(2026, 5, 4), 'room_id': 1, 'status': 'pending'}
+        for _ in range(2):
+            _add(conn, BookingRollup, key, {'bookings': 1, 'nights': 2, 'revenue': 50.0})
+        row = self.session.query(BookingRollup).one()
+        self.assertEqual((row.bookings, row.nights, row.revenue), (2, 4, 100.0))
+
+    def test_concurrent_status_changes_move_the_rollups_once(self):
+        import json
+        from datetime import date, datetime
+        from pyramid.request import Request
+        from .models import Booking, BookingRollup, Room, User, get_session_factory
+        from .security import CachedToken, Identity
+        from .stats import set_booking_status, track
+        from .views.admin import update_booking_status
+
+        self.init_database()
+        self.config.include('.security')
+        session_factory = get_session_factory(self.engine)
+        track(session_factory)
+        session = session_factory()
+        user = User(username='guest', email='g@x', password='p')
+        room = Room(name='A', description='d', price_per_night=50.0)
+        session.add_all([user, room])
+        session.flush()
+        booking = Booking(user_id=user.id, room_id=room.id, check_in_date=date(2026, 6, 1),
+                          check_out_date=date(2026, 6, 3), total_price=100.0,
+                          created_at=datetime(2026, 5, 4, 12))
+        session.add(booking)
+        session.commit()
+        self.assertEqual(booking.status, 'pending')
+
+        # Another admin cancels the booking while it is loaded as pending
+        other = session_factory()
+        self.assertTrue(set_booking_status(other, other.get(Booking, booking.id), 'cancelled'))
+        other.commit()
+        other.close()
+
+        request = Request.blank('/api/admin/bookings/%d/status' % booking.id, method='PUT',
+                                body=json.dumps({'status': 'completed'}).encode('utf-8'))
+        request.registry = self.config.registry
+        request.dbsession = session
+        request.matchdict = {'id': booking.id}
+        request.auth_identity = Identity(request, CachedToken(1, user.id, 't', True, None))
+        self.assertEqual(update_booking_status(request).status_code, 409)
+        session.commit()
+        self.assertEqual(sorted((r.status, r.bookings, r.nights, r.revenue)
+                                for r in session.query(BookingRollup)),
+                         [('cancelled', 1, 2, 100.0), ('pending', 0, 0, 0.0)])
+        session.close()
+
+    def test_rollups_follow_flushes_and_match_backfill(self):
+        from datetime import date, datetime
+        from .models import Booking, BookingRollup, Room, get_session_factory
+        from .stats import backfill_rollups, timeseries, track
+
+        self.init_database()
+        session_factory = get_session_factory(self.engine)
+        track(session_factory)
+        session = session_factory()
+        room = Room(name='A', description='d', price_per_night=50.0)
+        session.add(room)
+        session.flush()
+        bookings = [Booking(user_id=1, room_id=room.id, check_in_date=date(2026, 6, 1),
+                            check_out_date=date(2026, 6, 1 + nights), total_price=50.0 * nights,
+                            created_at=datetime(2026, 5, day, 12))
+                    for day, nights in [(4, 2), (4, 1), (11, 3), (12, 1)]]
+        session.add_all(bookings)
+        session.commit()
+        bookings[0].status = 'confirmed'
+        session.delete(bookings[3])
+        session.commit()
+
+        def rollups():
+            return sorted((r.day, r.status, r.bookings, r.nights, r.revenue)
+                          for r in session.query(BookingRollup))
+
+        live = rollups()
+        self.assertEqual(live, [(date(2026, 5, 4), 'confirmed', 1, 2, 100.0),
+                                (date(2026, 5, 4), 'pending', 1, 1, 50.0),
+                                (date(2026, 5, 11), 'pending', 1, 3, 150.0),
+                                (date(2026, 5, 12), 'pending', 0, 0, 0.0)])
+        session.close()
+
+        result = backfill_rollups(session_factory, chunk_days=3)
+        session = session_factory()
+        self.assertEqual([row for row in live if row[2]], rollups())
+        self.assertEqual(result.days, 9)
+
+        series = timeseries(session, date(2026, 5, 1), date(2026, 5, 15), 'week')
+        self.assertEqual([(p['period'], p['bookings'], p['revenue']) for p in series],
+                         [('2026-04-27', 0, 0.0), ('2026-05-04', 2, 150.0),
+                          ('2026-05-11', 1, 150.0)])
+        session.close()
+
+
+class TestBookingSerialization(BaseTest):
+
+    def setUp(self):
+        super(TestBookingSerialization, self).setUp()
+        self.init_database()
+        self.config.include('.security')
+
+    def _seed(self, count):
+        from datetime import date
+        from .models import Booking, Room, User
+
+        if not hasattr(self, 'users'):
+            self.users = [User(username='u%d' % i, email='u%d@x' % i, password='p')
+                          for i in range(5)]
+            self.rooms = [Room(name='R%d' % i, description='d', price_per_night=50.0)
+                          for i in range(5)]
+            self.session.add_all(self.users + self.rooms)
+            self.session.flush()
+        self.session.add_all([
+            Booking(user_id=self.users[0 if i % 2 else i % 5].id, room_id=self.rooms[i % 5].id,
+                    check_in_date=date(2026, 5, 1), check_out_date=date(2026, 5, 3),
+                    total_price=100.0)
+            for i in range(count)
+        ])
+        self.session.flush()
+        return self.users[0].id
+
+    def _count(self, view, user_id):
+        from pyramid.request import Request
+        from .security import CachedToken, Identity
+
+        request = Request.blank('/')
+        request.registry = self.config.registry
+        request.dbsession = self.session
+        request.auth_identity = Identity(request, CachedToken(1, user_id, 't', True, None))
+        self.session.expire_all()
+        with count_queries(self.engine) as statements:
+            result = view(request)
+        return len(statements), result
+
+    def test_listing_cost_does_not_depend_on_booking_count(self):
+        from .views.admin import get_all_bookings
+        from .views.user import get_user_bookings
+
+        user_id = self._seed(1)
+        admin_one, bookings = self._count(get_all_bookings, user_id)
+        user_one, _ = self._count(get_user_bookings, user_id)
+        self.assertEqual(bookings[0]['room_name'], 'R0')
+
+        self._seed(999)
+        admin_many, bookings = self._count(get_all_bookings, user_id)
+        user_many, result = self._count(get_user_bookings, user_id)
+
+        self.assertEqual(len(bookings), 1000)
+        self.assertEqual(len(result['bookings']), 600)
+        self.assertEqual((admin_one, user_one), (1, 2))
+        self.assertEqual((admin_many, user_many), (admin_one, user_one))
+        self.assertEqual({b['user_name'] for b in result['bookings']}, {'u0'})
+
+    def test_user_listing_etag_covers_the_users_fields(self):
+        from pyramid.request import Request
+        from .security import CachedToken, Identity
+        from .views.user import get_user_bookings
+
+        user_id = self._seed(1)
+
+        def get(etag=None):
+            request = Request.blank('/', headers={'If-None-Match': etag} if etag else {})
+            request.registry = self.config.registry
+            request.dbsession = self.session
+            request.auth_identity = Identity(request, CachedToken(1, user_id, 't', True, None))
+            return get_user_bookings(request), request
+
+        _, request = get()
+        etag = '"%s"' % request.response.etag
+        self.assertEqual(get(etag)[0].status_code, 304)
+        self.users[0].email = 'new@x'
+        self.session.flush()
+        result, _ = get(etag)
+        self.assertEqual(result['bookings'][0]['user']['email'], 'new@x')
+
+    def test_streamed_listing_matches_buffered_one(self):
+        import json
+        from pyramid.request import Request
+        from .models import get_session_factory
+        from .views.admin import get_all_bookings, get_all_users
+
+        self._seed(1201)
+        self.session.flush()
+        transaction.commit()
+        self.config.registry['dbsession_factory'] = get_session_factory(self.engine)
+
+        chunk_counts = []
+        for view in (get_all_bookings, get_all_users):
+            request = Request.blank('/')
+            request.registry = self.config.registry
+            request.dbsession = self.session
+            buffered = view(request)
+
+            request = Request.blank('/?stream=1')
+            request.registry = self.config.registry
+            response = view(request)
+            self.assertFalse(isinstance(response.app_iter, list))
+            chunks = list(response.app_iter)
+            self.assertEqual(json.loads(b''.join(chunks)), json.loads(json.dumps(buffered)))
+            chunk_counts.append(len(chunks))
+        # Rows in batches of 500, plus the brackets
+        self.assertEqual(chunk_counts, [5, 3])
+
+
+class TestExport(BaseTest):
+
+    def test_exports_filtered_rows_in_chunks(self):
+        import csv
+        import json
+        from datetime import date, datetime
+        from .export import build_export, iter_export
+        from .models import Booking, Room, User, get_session_factory
+
+        self.init_database()
+        user = User(username='guest', email='g@x', password='secret', full_name='Guest, Jr.')
+        room = Room(name='Deluxe', description='d', price_per_night=50.0)
+        self.session.add_all([user, room])
+        self.session.flush()
+        self.session.add_all([
+            Booking(user_id=user.id, room_id=room.id, check_in_date=date(2026, 6, 1),
+                    check_out_date=date(2026, 6, 3), total_price=100.0, status=status,
+                    created_at=datetime(2026, 5, day))
+            for day, status in [(1, 'paid'), (2, 'cancelled'), (3, 'paid'), (9, 'paid')]
+        ])
+        transaction.commit()
+        session_factory = get_session_factory(self.engine)
+
+        stmt = build_export('bookings', date(2026, 5, 1), date(2026, 5, 9), ['paid'])
+        chunks = list(iter_export(session_factory, stmt, 'csv', chunk_size=1))
+        rows = list(csv.reader(b''.join(chunks).decode('utf-8').splitlines()))
+        self.assertEqual(len(chunks), 2)
+        self.assertEqual(rows[0][:6], ['id', 'user_id', 'username', 'user_full_name',
+                                       'room_id', 'room_name'])
+        self.assertEqual([(row[3], row[5], row[10]) for row in rows[1:]],
+                         [('Guest, Jr.', 'Deluxe', 'paid')] * 2)
+
+        lines = b''.join(iter_export(session_factory, build_export('users'), 'ndjson')).splitlines()
+        self.assertEqual(len(lines), 1)
+        self.assertEqual(json.loads(lines[0])['username'], 'guest')
+        self.assertNotIn('password', json.loads(lines[0]))
+
+        with self.assertRaises(ValueError):
+            build_export('users', statuses=['paid'])
+        with self.assertRaises(ValueError):
+            iter_export(session_factory, stmt, 'xml')
+
+
+class TestRoomImport(BaseTest):
+
+    def test_upserts_valid_rows_and_reports_the_rest(self):
+        from .cache import on_commit
+        from .models import Room, get_session_factory
+        from .room_import import import_rooms, read_rows
+
+        self.init_database()
+        session_factory = get_session_factory(self.engine)
+        session = session_factory()
+        session.add_all([Room(name='Garden', description='d', price_per_night=80.0),
+                         Room(name='Twin', description='d', price_per_night=60.0),
+                         Room(name='Twin', description='d', price_per_night=65.0)])
+        session.commit()
+
+        committed = []
+        on_commit(session_factory, Room, committed.append)
+        text = (
+            'external_id,name,price_per_night,capacity,is_available,amenities\n'
+            'A-1,Ocean,120,2,yes,"wifi, pool"\n'
+            ',Garden,95,,,\n'
+            ',Twin,70,,,\n'
+            'A-2,Loft,,3,,\n'
+            'A-3,Bad,-1,,,\n'
+            'A-1,Ocean again,130,,,\n'
+        )
+        result = import_rooms(session, read_rows(text, 'csv'))
+        session.commit()
+
+        self.assertEqual((result.created, result.updated), (1, 1))
+        self.assertEqual([(error['line'], error['message']) for error in result.errors], [
+            (4, "2 rooms are named 'Twin'; use external_id"),
+            (5, 'price_per_night is required for new rooms'),
+            (6, 'price_per_night must not be negative'),
+            (7, 'duplicate external_id of line 2'),
+        ])
+        ocean = session.query(Room).filter(Room.external_id == 'A-1').one()
+        self.assertEqual((ocean.price_per_night, ocean.amenities, ocean.room_type),
+                         (120.0, 'wifi, pool', 'standard'))
+        garden = session.query(Room).filter(Room.name == 'Garden').one()
+        self.assertEqual((garden.price_per_night, garden.capacity), (95.0, 2))
+        self.assertEqual(committed, [set(result.room_ids)])
+
+        again = import_rooms(session, read_rows('{"external_id": "A-1", "name": "Ocean", "price_per_night": 150}\n', 'ndjson'))
+        self.assertEqual((again.created, again.updated), (0, 1))
+        session.close()
+
+    def test_new_external_id_claims_the_room_of_the_same_name(self):
+        from .models import Room, get_session_factory
+        from .room_import import import_rooms, read_rows
+
+        self.init_database()
+        session = get_session_factory(self.engine)()
+        session.add_all([Room(name='Garden', description='d', price_per_night=80.0),
+                         Room(name='Loft', description='d', price_per_night=60.0, external_id='L-1')])
+        session.commit()
+
+        result = import_rooms(session, read_rows(
+            'external_id,name,price_per_night\n'
+            'G-1,Garden,90\n'
+            'G-2,Garden,91\n'
+            'L-2,Loft,70\n', 'csv'))
+        session.commit()
+        self.assertEqual((result.created, result.updated), (1, 1))
+        garden = session.query(Room).filter(Room.name == 'Garden').one()
+        self.assertEqual(result.errors, [
+            {'line': 3, 'message': 'room %d is already updated by line 2' % garden.id}])
+        self.assertEqual((garden.external_id, garden.price_per_night), ('G-1', 90.0))
+        # The Loft with an external_id is not claimed; L-2 is a new room
+        self.assertEqual(sorted(room.external_id for room in session.query(Room).filter(
+            Room.name == 'Loft')), ['L-1', 'L-2'])
+
+        again = import_rooms(session, read_rows('name,price_per_night\nGarden,95\n', 'csv'))
+        self.assertEqual((again.created, again.updated, again.errors), (0, 1, []))
+        session.close()
+
+
+class TestUnreadNotifications(BaseTest):
+
+    def test_counter_follows_flushes_and_bulk_reads(self):
+        from pyramid.request import Request
+        from sqlalchemy import insert
+        from .models import Notification, User, get_session_factory
+        from .security import CachedToken, Identity
+        from .stats import mark_read, rebuild, repair_unread_counts, track, unread_count, verify
+        from .views.user import get_unread_count, mark_notifications_read
+
+        self.init_database()
+        self.config.include('.security')
+        session_factory = get_session_factory(self.engine)
+        track(session_factory)
+        session = session_factory()
+        rebuild(session)
+        users = [User(username='a', email='a@x', password='p'),
+                 User(username='b', email='b@x', password='p')]
+        session.add_all(users)
+        session.flush()
+        notes = [Notification(user_id=user.id, title='t', message='m')
+                 for user in users for _ in range(4)]
+        session.add_all(notes)
+        session.commit()
+        self.assertEqual([unread_count(session, user.id) for user in users], [4, 4])
+
+        notes[0].is_read = True
+        notes[5].user_id = users[0].id
+        session.delete(notes[1])
+        session.commit()
+        self.assertEqual([unread_count(session, user.id) for user in users], [3, 3])
+
+        self.assertEqual(mark_read(session, users[0].id, [notes[2].id, notes[6].id]), 1)
+        self.assertTrue(notes[2].is_read)
+        session.commit()
+        self.assertEqual([unread_count(session, user.id) for user in users], [2, 3])
+        self.assertEqual(verify(session), [])
+
+        request = Request.blank('/api/user/notifications/read', method='PUT')
+        request.registry = self.config.registry
+        request.dbsession = session
+        request.auth_identity = Identity(request, CachedToken(1, users[0].id, 't', False, None))
+        with count_queries(self.engine) as statements:
+            info = mark_notifications_read(request)
+        self.assertEqual((info['marked'], info['unread_count']), (2, 0))
+        # One UPDATE of the notifications, one of the counter, one read
+        self.assertEqual(len([s for s in statements if s.startswith('UPDATE notifications')]), 1)
+        session.commit()
+
+        with count_queries(self.engine) as statements:
+            self.assertEqual(get_unread_count(request), {'unread_count': 0})
+        self.assertEqual(len(statements), 1)
+
+        users[1].unread_notifications = 9
+        session.commit()
+        self.assertEqual(verify(session), ['user %d: unread_notifications is 9, expected 3' % users[1].id])
+        self.assertEqual(repair_unread_counts(session), 1)
+        self.assertEqual(verify(session), [])
+
+        # Rows written without is_read are unread, never NULL
+        session.execute(insert(Notification).values(user_id=users[1].id, title='t', message='m'))
+        self.assertEqual(session.query(Notification).filter(Notification.is_read.is_(None)).count(), 0)
+        self.assertEqual(repair_unread_counts(session), 1)
+        self.assertEqual(unread_count(session, users[1].id), 4)
+        session.close()
+
+    def test_single_mark_after_a_concurrent_mark_all(self):
+        from pyramid.request import Request
+        from .models import Notification, User, get_session_factory
+        from .security import CachedToken, Identity
+        from .stats import mark_read, rebuild, track, unread_count, verify
+        from .views.user import mark_notification_read
+
+        self.init_database()
+        self.config.include('.security')
+        session_factory = get_session_factory(self.engine)
+        track(session_factory)
+        session = session_factory()
+        rebuild(session)
+        user = User(username='a', email='a@x', password='p')
+        session.add(user)
+        session.flush()
+        note = Notification(user_id=user.id, title='t', message='m')
+        session.add(note)
+        session.commit()
+        self.assertFalse(note.is_read)
+
+        # Mark-all commits while the notification is loaded as unread
+        other = session_factory()
+        self.assertEqual(mark_read(other, user.id), 1)
+        other.commit()
+        other.close()
+
+        request = Request.blank('/api/user/notifications/%d/read' % note.id, method='PUT')
+        request.registry = self.config.registry
+        request.dbsession = session
+        request.matchdict = {'id': str(note.id)}
+        request.auth_identity = Identity(request, CachedToken(1, user.id, 't', False, None))
+        self.assertEqual(mark_notification_read(request)['unread_count'], 0)
+        session.commit()
+        self.assertEqual(unread_count(session, user.id), 0)
+        self.assertEqual(verify(session), [])
+
+        request.matchdict = {'id': str(note.id + 1)}
+        self.assertEqual(mark_notification_read(request).status_code, 404)
+        session.close()
+
+
+class TestNotificationStream(BaseTest):
+
+    def test_resumes_pushes_commits_and_idles_without_queries(self):
+        from pyramid.request import Request
+        from .models import Notification, Token, User, get_session_factory
+        from .views.user import stream_notifications
+
+        self.init_database()
+        self.config.get_settings()['notifications.stream.heartbeat'] = '0.01'
+        self.config.include('.security')
+        session_factory = get_session_factory(self.engine)
+        self.config.registry['dbsession_factory'] = session_factory
+        self.config.include('.notifications')
+        hub = self.config.registry['notification_hub']
+        session = session_factory()
+        user = User(username='a', email='a@x', password='p')
+        session.add(user)
+        session.flush()
+        token = Token.create_token(user.id)
+        notes = [Notification(user_id=user.id, title='t%d' % i, message='m') for i in range(3)]
+        session.add(token)
+        session.add_all(notes)
+        session.commit()
+
+        request = Request.blank('/api/user/notifications/stream?token=nope')
+        request.registry = self.config.registry
+        request.dbsession = session
+        self.assertEqual(stream_notifications(request).status_code, 401)
+
+        request = Request.blank('/api/user/notifications/stream?token=' + token.token,
+                                headers={'Last-Event-ID': str(notes[0].id)})
+        request.registry = self.config.registry
+        request.dbsession = session
+        response = stream_notifications(request)
+        self.assertEqual(response.content_type, 'text/event-stream')
+        events = iter(response.app_iter)
+        self.assertEqual(next(events), b'retry: 3000\n\n')
+        self.assertTrue(next(events).startswith(b'id: %d\nevent: notification\n' % notes[1].id))
+        self.assertTrue(next(events).startswith(b'id: %d\n' % notes[2].id))
+        self.assertEqual(hub.stats()['subscribers'], 1)
+
+        with count_queries(self.engine) as statements:
+            self.assertEqual(next(events), b': keepalive\n\n')
+        self.assertEqual(statements, [])
+
+        # Marking read wakes the stream but sends nothing new
+        notes[1].is_read = True
+        session.commit()
+        with count_queries(self.engine) as statements:
+            self.assertEqual(next(events), b': keepalive\n\n')
+        self.assertEqual(statements, [])
+
+        other = session_factory()
+        other.add(Notification(user_id=user.id, title='Booking Completed', message='m'))
+        other.commit()
+        other.close()
+        frame = next(events).decode('utf-8')
+        self.assertIn('"title": "Booking Completed"', frame)
+
+        response.app_iter.close()
+        self.assertEqual(hub.stats()['subscribers'], 0)
+        self.assertEqual(hub.stats()['streams'], 0)
+        session.close()
+
+    def test_sends_notifications_committed_around_the_subscription(self):
+        from .models import Notification, User, get_session_factory
+        from .notifications import iter_events
+
+        self.init_database()
+        session_factory = get_session_factory(self.engine)
+        self.config.registry['dbsession_factory'] = session_factory
+        self.config.include('.notifications')
+        hub = self.config.registry['notification_hub']
+        hub.heartbeat = 0.01
+        session = session_factory()
+        user = User(username='a', email='a@x', password='p')
+        session.add(user)
+        session.commit()
+        session.add(Notification(id=100, user_id=user.id, title='old', message='m'))
+        session.commit()
+
+        # Committed after the latest id was read but before subscribing
+        subscribe = hub.subscribe
+        def late_subscribe(user_id):
+            session.add(Notification(id=101, user_id=user_id, title='gap', message='m'))
+            session.commit()
+            return subscribe(user_id)
+        hub.subscribe = late_subscribe
+        events = iter_events(session_factory, hub, user.id)
+        next(events)
+        self.assertTrue(next(events).startswith(b'id: 101\n'))
+
+        # A transaction holding a lower id that commits after a higher one
+        session.add(Notification(id=103, user_id=user.id, title='b', message='m'))
+        session.commit()
+        self.assertTrue(next(events).startswith(b'id: 103\n'))
+        session.add(Notification(id=102, user_id=user.id, title='a', message='m'))
+        session.commit()
+        self.assertTrue(next(events).startswith(b'id: 102\n'))
+        self.assertEqual(next(events), b': keepalive\n\n')
+        events.close()
+        session.close()
+
+    def test_rejects_streams_over_the_limit(self):
+        from pyramid.request import Request
+        from .models import Token, User, get_session_factory
+        from .views.user import stream_notifications
+
+        self.init_database()
+        self.config.get_settings()['notifications.stream.max_streams'] = '1'
+        self.config.include('.security')
+        session_factory = get_session_factory(self.engine)
+        self.config.registry['dbsession_factory'] = session_factory
+        self.config.include('.notifications')
+        session = session_factory()
+        user = User(username='a', email='a@x', password='p')
+        session.add(user)
+        session.flush()
+        token = Token.create_token(user.id)
+        session.add(token)
+        session.commit()
+
+        def open_stream():
+            request = Request.blank('/api/user/notifications/stream?token=' + token.token)
+            request.registry = self.config.registry
+            request.dbsession = session
+            return stream_notifications(request)
+
+        first = open_stream()
+        rejected = open_stream()
+        self.assertEqual(rejected.status_code, 503)
+        self.assertEqual(rejected.headers['Retry-After'], '3')
+        # The slot is released even if the body was never read
+        first.app_iter.close()
+        second = open_stream()
+        self.assertEqual(second.status_code, 200)
+        second.app_iter.close()
+        session.close()
+
+
+class TestOutbox(BaseTest):
+
+    def test_status_change_is_queued_and_delivered_with_retries(self):
+        import json
+        from datetime import date, datetime, timedelta
+        from pyramid.request import Request
+        from .models import Booking, Notification, OutboxMessage, Room, User, get_session_factory
+        from .outbox import MemorySink, OutboxWorker, deliver_in_app
+        from .security import CachedToken, Identity
+        from .stats import track, unread_count
+        from .views.admin import update_booking_status
+
+        self.init_database()
+        self.config.include('.security')
+        self.config.get_settings()['outbox.channels'] = 'in_app email'
+        session_factory = get_session_factory(self.engine)
+        track(session_factory)
+        session = session_factory()
+        user = User(username='guest', email='g@x', password='p')
+        room = Room(name='Deluxe', description='d', price_per_night=50.0)
+        session.add_all([user, room])
+        session.flush()
+        booking = Booking(user_id=user.id, room_id=room.id, check_in_date=date(2026, 5, 1),
+                          check_out_date=date(2026, 5, 3), total_price=100.0)
+        session.add(booking)
+        session.commit()
+
+        request = Request.blank('/api/admin/bookings/%d/status' % booking.id, method='PUT',
+                                body=json.dumps({'status': 'completed'}).encode('utf-8'))
+        request.registry = self.config.registry
+        request.dbsession = session
+        request.matchdict = {'id': booking.id}
+        request.auth_identity = Identity(request, CachedToken(1, user.id, 't', True, None))
+        self.assertTrue(update_booking_status(request)['success'])
+        session.commit()
+        self.assertEqual(session.query(Notification).count(), 0)
+        self.assertEqual(sorted(m.channel for m in session.query(OutboxMessage)), ['email', 'in_app'])
+
+        now = [datetime.now()]
+        email = MemorySink(fail_times=1)
+        worker = OutboxWorker(session_factory, {'in_app': deliver_in_app, 'email': email},
+                              batch_size=1, backoff=30, clock=lambda: now[0])
+        self.assertEqual(worker.drain()[:3], (1, 1, 0))
+        self.assertEqual(session.query(Notification.title).all(), [('Booking Completed',)])
+        self.assertEqual(unread_count(session, user.id), 1)
+        self.assertEqual(email.sent, [])
+        self.assertEqual(worker.drain()[:3], (0, 0, 0))
+
+        now[0] += timedelta(seconds=31)
+        self.assertEqual(worker.drain()[:3], (1, 0, 0))
+        self.assertEqual(email.sent, [('booking.completed', {
+            'user_id': user.id, 'booking_id': booking.id, 'title': 'Booking Completed',
+            'message': 'Your booking for Deluxe has been marked as completed. '
+                       'Thank you for choosing Roomify!'})])
+        session.expire_all()
+        self.assertEqual(sorted((m.channel, m.status, m.attempts) for m in session.query(OutboxMessage)),
+                         [('email', 'done', 2), ('in_app', 'done', 1)])
+
+        # Unknown channels fail for good after max_attempts
+        session.add(OutboxMessage(event='x', channel='sms', payload='{}', available_at=now[0]))
+        session.commit()
+        worker.max_attempts = 2
+        self.assertEqual(worker.drain()[:3], (0, 1, 0))
+        now[0] += timedelta(minutes=5)
+        self.assertEqual(worker.drain()[:3], (0, 0, 1))
+        failed = session.query(OutboxMessage).filter(OutboxMessage.channel == 'sms').one()
+        self.assertEqual((failed.status, failed.last_error), ('failed', "LookupError: No delivery channel 'sms'"))
+        session.close()
+
+    def test_claimed_messages_are_delivered_once(self):
+        from datetime import datetime, timedelta
+        from .models import OutboxMessage, get_session_factory
+        from .outbox import MemorySink, OutboxWorker
+
+        self.init_database()
+        session_factory = get_session_factory(self.engine)
+        session = session_factory()
+        now = [datetime.now()]
+        session.add(OutboxMessage(event='x', channel='email', payload='{}', available_at=now[0]))
+        session.commit()
+
+        first, second = MemorySink(), MemorySink()
+        claimer = OutboxWorker(session_factory, {'email': first}, claim_timeout=60,
+                               clock=lambda: now[0])
+        other = OutboxWorker(session_factory, {'email': second}, clock=lambda: now[0])
+        claim = session_factory()
+        self.assertEqual(len(claimer._claim(claim, now[0])), 1)
+        claim.close()
+        self.assertEqual(other.run_batch(), (0, 0, 0, 0))
+        self.assertEqual(second.sent, [])
+
+        # The claimer died; its claim is taken over after claim_timeout
+        now[0] += timedelta(seconds=61)
+        self.assertEqual(other.run_batch(), (1, 1, 0, 0))
+        self.assertEqual(second.sent, [('x', {})])
+        message = session.query(OutboxMessage).one()
+        session.refresh(message)
+        self.assertEqual((message.status, message.attempts), ('done', 2))
+        session.close()
+
+    def test_periodic_tasks_start_with_the_first_request(self):
+        from pyramid.events import NewRequest
+        from pyramid.request import Request
+        from .models import get_session_factory
+
+        self.config.get_settings()['outbox.worker_interval'] = '60'
+        self.config.registry['dbsession_factory'] = get_session_factory(self.engine)
+        self.config.include('.tasks')
+        task = self.config.registry['outbox_worker']
+        self.assertFalse(task.is_alive())
+        self.config.registry.notify(NewRequest(Request.blank('/')))
+        self.assertTrue(task.is_alive())
+        self.config.registry.notify(NewRequest(Request.blank('/')))
+        task.stop()
+        task.join()
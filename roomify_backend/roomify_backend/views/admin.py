@@ -1,10 +1,20 @@
 from pyramid.view import view_config
 from pyramid.response import Response
+import csv
 import json
-from datetime import datetime
-from sqlalchemy import desc
+from datetime import date, datetime, timedelta
+from sqlalchemy import desc, func
+from sqlalchemy.orm import with_expression
 
-from .. import models
+from .. import models, outbox, room_import
+from ..availability import parse_date
+from ..conditional import make_etag, not_modified
+from ..pagination import page_params, paginate
+from ..security import issue_token
+from ..stats import BUCKETS, read_totals, set_booking_status, timeseries
+from ..streaming import stream_json_array, wants_stream
+
+MAX_TIMESERIES_DAYS = 1100
 
 
 @view_config(route_name='api_admin_login', request_method='OPTIONS')
@@ -19,24 +29,6 @@ def admin_login_options(request):
     return response
 
 
-def get_token_from_request(request):
-    """Helper function to extract and validate admin token from request."""
-    auth_header = request.headers.get('Authorization', '')
-    if not auth_header.startswith('Bearer '):
-        return None
-    
-    token_str = auth_header.split(' ')[1]
-    token = request.dbsession.query(models.Token).filter(
-        models.Token.token == token_str,
-        models.Token.is_admin == True
-    ).first()
-    
-    if not token or not token.is_valid():
-        return None
-    
-    return token
-
-
 @view_config(route_name='api_admin_login', renderer='json', request_method='POST')
 def admin_login(request):
     """API endpoint for admin login."""
@@ -87,12 +79,11 @@ def admin_login(request):
                            status=401)
         
         # Generate token
-        token = models.Token.create_token(user.id, is_admin=True)
-        request.dbsession.add(token)
+        token = issue_token(request, user, is_admin=True)
         
         return {
             'success': True, 
-            'token': token.token, 
+            'token': token, 
             'user': {
                 'id': user.id,
                 'username': user.username,
@@ -109,72 +100,46 @@ def admin_login(request):
                        status=500)
 
 
-@view_config(route_name='api_admin_stats', renderer='json', request_method='GET')
+@view_config(route_name='api_admin_stats', renderer='json', request_method='GET',
+             permission='is_admin')
 def get_admin_stats(request):
     """API endpoint to get admin dashboard statistics."""
     try:
-        # Validate admin token
-        token = get_token_from_request(request)
-        if not token:
-            return Response(json.dumps({'message': 'Admin authentication required'}), 
-                           content_type='application/json', 
-                           status=401)
-        
-        # Get statistics from database
-        # 1. Total users
-        total_users = request.dbsession.query(models.User).count()
+        # Dashboard statistics from the materialized stats tables
+        Booking = models.Booking
         
-        # 2. Total rooms
-        total_rooms = request.dbsession.query(models.Room).count()
+        # 1. Totals, a single-row lookup
+        total_users, total_rooms, total_bookings, total_revenue = read_totals(request.dbsession)
         
-        # 3. Total bookings
-        total_bookings = request.dbsession.query(models.Booking).count()
-        
-        # 4. Total revenue (sum of booking amounts)
-        from sqlalchemy import func
-        total_revenue_result = request.dbsession.query(func.sum(models.Booking.total_price)).scalar()
-        total_revenue = total_revenue_result if total_revenue_result else 0
-        
-        # 5. Recent bookings (last 5)
-        recent_bookings = request.dbsession.query(models.Booking).order_by(desc(models.Booking.created_at)).limit(5).all()
+        # 2. Recent bookings (last 5) with their user and room joined in
+        recent_bookings = request.dbsession.query(Booking).options(
+            *Booking.eager_options()
+        ).order_by(desc(Booking.created_at)).limit(5).all()
         recent_bookings_list = []
         
         for booking in recent_bookings:
-            # Get user and room details
-            user = request.dbsession.query(models.User).filter(models.User.id == booking.user_id).first()
-            room = request.dbsession.query(models.Room).filter(models.Room.id == booking.room_id).first()
-            
             booking_dict = booking.to_dict()
-            booking_dict['user'] = user.username if user else 'Unknown'
-            booking_dict['room'] = room.name if room else 'Unknown'
+            booking_dict['user'] = booking.user.username if booking.user else 'Unknown'
+            booking_dict['room'] = booking.room.name if booking.room else 'Unknown'
             
             recent_bookings_list.append(booking_dict)
         
-        # 6. Room statistics
-        rooms = request.dbsession.query(models.Room).all()
-        room_stats = []
-        
-        for room in rooms:
-            # Count bookings for this room
-            room_bookings_count = request.dbsession.query(models.Booking).filter(
-                models.Booking.room_id == room.id
-            ).count()
-            
-            # Calculate revenue for this room
-            room_revenue_result = request.dbsession.query(func.sum(models.Booking.total_price)).filter(
-                models.Booking.room_id == room.id
-            ).scalar()
-            room_revenue = room_revenue_result if room_revenue_result else 0
-            
-            room_stats.append({
-                'id': room.id,
-                'name': room.name,
-                'type': room.room_type,
-                'price': room.price_per_night,
-                'status': 'active' if room.is_available else 'inactive',
-                'bookings': room_bookings_count,
-                'revenue': room_revenue
-            })
+        # 3. Room statistics, joined to their stats row by primary key
+        rows = request.dbsession.query(
+            models.Room,
+            func.coalesce(models.RoomStats.bookings, 0),
+            func.coalesce(models.RoomStats.revenue, 0)
+        ).outerjoin(models.RoomStats, models.RoomStats.room_id == models.Room.id).order_by(models.Room.id).all()
+        
+        room_stats = [{
+            'id': room.id,
+            'name': room.name,
+            'type': room.room_type,
+            'price': room.price_per_night,
+            'status': 'active' if room.is_available else 'inactive',
+            'bookings': room_bookings_count,
+            'revenue': room_revenue
+        } for room, room_bookings_count, room_revenue in rows]
         
         return {
             'success': True,
@@ -196,36 +161,89 @@ def get_admin_stats(request):
                        status=500)
 
 
-@view_config(route_name='api_admin_bookings', renderer='json', request_method='GET')
+@view_config(route_name='api_admin_stats_timeseries', renderer='json', request_method='GET',
+             permission='is_admin')
+def get_stats_timeseries(request):
+    """API endpoint to get bookings, nights and revenue per day, week or
+    month of booking creation (admin only)."""
+    try:
+        try:
+            bucket = request.params.get('bucket', 'day')
+            if bucket not in BUCKETS:
+                raise ValueError('bucket must be one of: %s' % ', '.join(BUCKETS))
+            end = parse_date(request.params['to']) if request.params.get('to') else date.today() + timedelta(days=1)
+            start = parse_date(request.params['from']) if request.params.get('from') else end - timedelta(days=30)
+            if end <= start:
+                raise ValueError('to must be after from')
+            if (end - start).days > MAX_TIMESERIES_DAYS:
+                raise ValueError('at most %d days per request' % MAX_TIMESERIES_DAYS)
+            room_id = int(request.params['room_id']) if request.params.get('room_id') else None
+        except ValueError as e:
+            return Response(json.dumps({'message': f'Invalid time-series parameters: {str(e)}'}), 
+                           content_type='application/json; charset=UTF-8', 
+                           status=400)
+        
+        series = timeseries(request.dbsession, start, end, bucket,
+                            room_id=room_id, status=request.params.get('status') or None)
+        
+        return {
+            'success': True,
+            'bucket': bucket,
+            'from': start.isoformat(),
+            'to': end.isoformat(),
+            'series': series
+        }
+    except Exception as e:
+        return Response(json.dumps({'message': str(e)}), 
+                       content_type='application/json; charset=UTF-8', 
+                       status=500)
+
+
+@view_config(route_name='api_admin_cache_stats', renderer='json', request_method='GET',
+             permission='is_admin')
+def get_cache_stats(request):
+    """API endpoint to get hit/miss counters of the in-process caches (admin only)."""
+    caches = request.registry.get('caches', {})
+    return {
+        'success': True,
+        'caches': {name: cache.stats() for name, cache in caches.items()}
+    }
+
+
+@view_config(route_name='api_admin_bookings', renderer='json', request_method='GET',
+             permission='is_admin')
 def get_all_bookings(request):
-    """API endpoint to get all bookings (admin only)."""
+    """API endpoint to get all bookings (admin only).
+
+    ``?stream=1`` streams the same array row by row for large exports.
+    """
     try:
-        # Validate admin token
-        token = get_token_from_request(request)
-        if not token:
-            return Response(json.dumps({'message': 'Admin authentication required'}), 
+        try:
+            page = page_params(request)
+        except ValueError as e:
+            return Response(json.dumps({'message': f'Invalid pagination parameters: {str(e)}'}), 
                            content_type='application/json; charset=UTF-8', 
-                           status=401)
+                           status=400)
+        
+        if wants_stream(request) and not page:
+            return stream_json_array(
+                request,
+                lambda dbsession: dbsession.query(models.Booking).options(
+                    *models.Booking.eager_options()
+                ).order_by(desc(models.Booking.created_at), desc(models.Booking.id)),
+                lambda booking: booking.to_dict(details=True))
         
         # Get all bookings with related user and room info
-        bookings = request.dbsession.query(models.Booking).order_by(
-            desc(models.Booking.created_at)
-        ).all()
+        query = request.dbsession.query(models.Booking).options(*models.Booking.eager_options())
+        if page:
+            bookings, next_cursor = paginate(query, models.Booking, *page)
+            if next_cursor:
+                request.response.headers['X-Next-Cursor'] = next_cursor
+        else:
+            bookings = query.order_by(desc(models.Booking.created_at), desc(models.Booking.id)).all()
         
         # Prepare enhanced booking data with user and room details
-        enhanced_bookings = []
-        for booking in bookings:
-            booking_data = booking.to_dict()
-            
-            # Add user name if available
-            if booking.user:
-                booking_data['user_name'] = booking.user.full_name or booking.user.username
-            
-            # Add room name if available
-            if booking.room:
-                booking_data['room_name'] = booking.room.name
-            
-            enhanced_bookings.append(booking_data)
+        enhanced_bookings = [booking.to_dict(details=True) for booking in bookings]
         
         # Return directly as list for frontend compatibility
         return enhanced_bookings
@@ -242,19 +260,35 @@ def get_all_bookings(request):
                        status=500)
 
 
-@view_config(route_name='api_admin_users', renderer='json', request_method='GET')
+@view_config(route_name='api_admin_users', renderer='json', request_method='GET',
+             permission='is_admin')
 def get_all_users(request):
-    """API endpoint to get all users (admin only)."""
+    """API endpoint to get all users (admin only).
+
+    ``?stream=1`` streams the same array row by row for large exports.
+    """
     try:
-        # Validate admin token
-        token = get_token_from_request(request)
-        if not token:
-            return Response(json.dumps({'message': 'Admin authentication required'}), 
-                           content_type='application/json', 
-                           status=401)
+        try:
+            page = page_params(request)
+        except ValueError as e:
+            return Response(json.dumps({'message': f'Invalid pagination parameters: {str(e)}'}), 
+                           content_type='application/json; charset=UTF-8', 
+                           status=400)
+        
+        if wants_stream(request) and not page:
+            return stream_json_array(
+                request,
+                lambda dbsession: dbsession.query(models.User).order_by(models.User.id),
+                lambda user: user.to_dict())
         
         # Get all users
-        users = request.dbsession.query(models.User).all()
+        query = request.dbsession.query(models.User)
+        if page:
+            users, next_cursor = paginate(query, models.User, *page)
+            if next_cursor:
+                request.response.headers['X-Next-Cursor'] = next_cursor
+        else:
+            users = query.all()
         
         # Convert to dict for JSON serialization
         users_list = [user.to_dict() for user in users]
@@ -266,31 +300,50 @@ def get_all_users(request):
                        status=500)
 
 
-@view_config(route_name='api_admin_rooms', renderer='json', request_method='GET')
+@view_config(route_name='api_admin_rooms', renderer='json', request_method='GET',
+             permission='is_admin')
 def get_all_rooms_admin(request):
     """API endpoint to get all rooms with booking stats (admin only)."""
     try:
-        # Validate admin token
-        token = get_token_from_request(request)
-        if not token:
-            return Response(json.dumps({'message': 'Admin authentication required'}), 
-                           content_type='application/json', 
-                           status=401)
+        try:
+            page = page_params(request)
+        except ValueError as e:
+            return Response(json.dumps({'message': f'Invalid pagination parameters: {str(e)}'}), 
+                           content_type='application/json; charset=UTF-8', 
+                           status=400)
         
-        # Get all rooms
-        rooms = request.dbsession.query(models.Room).all()
+        # ETag from the room count and newest change, plus booking count and
+        # newest booking.  No Last-Modified: deleting the newest room would
+        # move it backwards
+        room_count, rooms_changed, booking_count, last_booked = request.dbsession.query(
+            request.dbsession.query(func.count(models.Room.id)).scalar_subquery(),
+            request.dbsession.query(func.max(models.Room.updated_at)).scalar_subquery(),
+            request.dbsession.query(func.count(models.Booking.id)).scalar_subquery(),
+            request.dbsession.query(func.max(models.Booking.created_at)).scalar_subquery()
+        ).one()
+        cached = not_modified(request, make_etag(room_count, rooms_changed, booking_count,
+                                                 last_booked))
+        if cached is not None:
+            return cached
+        
+        # Get all rooms with their booking count from room_stats
+        query = request.dbsession.query(models.Room).outerjoin(
+            models.RoomStats, models.RoomStats.room_id == models.Room.id
+        ).options(
+            with_expression(models.Room.booking_count, func.coalesce(models.RoomStats.bookings, 0))
+        ).populate_existing()
+        if page:
+            rooms, next_cursor = paginate(query, models.Room, *page)
+            if next_cursor:
+                request.response.headers['X-Next-Cursor'] = next_cursor
+        else:
+            rooms = query.all()
         
         # Convert to dict and add booking stats
         rooms_list = []
         for room in rooms:
             room_dict = room.to_dict()
-            
-            # Count bookings for this room
-            booking_count = request.dbsession.query(models.Booking).filter(
-                models.Booking.room_id == room.id
-            ).count()
-            
-            room_dict['booking_count'] = booking_count
+            room_dict['booking_count'] = room.booking_count
             rooms_list.append(room_dict)
         
         return rooms_list
@@ -300,17 +353,11 @@ def get_all_rooms_admin(request):
                        status=500)
 
 
-@view_config(route_name='api_admin_rooms', renderer='json', request_method='POST')
+@view_config(route_name='api_admin_rooms', renderer='json', request_method='POST',
+             permission='is_admin')
 def create_room(request):
     """API endpoint to create a new room (admin only)."""
     try:
-        # Validate admin token
-        token = get_token_from_request(request)
-        if not token:
-            return Response(json.dumps({'message': 'Admin authentication required'}), 
-                           content_type='application/json', 
-                           status=401)
-        
         # Get JSON data from request body
         json_body = request.json_body
         
@@ -336,17 +383,47 @@ def create_room(request):
                        status=500)
 
 
-@view_config(route_name='api_admin_room_detail', renderer='json', request_method='PUT')
+@view_config(route_name='api_admin_rooms_import', renderer='json', request_method='POST',
+             permission='is_admin')
+def import_rooms(request):
+    """API endpoint to create or update many rooms from a CSV or NDJSON
+    body (admin only).
+
+    Rows are matched by ``external_id``, else by ``name``; invalid rows are
+    skipped and reported with their line number.  ``?dry_run=1`` only
+    validates.
+    """
+    try:
+        fmt = request.params.get('format')
+        if fmt is None:
+            fmt = 'ndjson' if 'json' in (request.content_type or '') else 'csv'
+        dry_run = request.params.get('dry_run', '').lower() in ('1', 'true', 'yes')
+        try:
+            rows = room_import.read_rows(request.body.decode('utf-8-sig'), fmt)
+            result = room_import.import_rooms(request.dbsession, rows, dry_run=dry_run)
+        except (ValueError, UnicodeDecodeError, csv.Error) as e:
+            return Response(json.dumps({'message': f'Invalid room import: {str(e)}'}), 
+                           content_type='application/json; charset=UTF-8', 
+                           status=400)
+        
+        return {
+            'success': not result.errors,
+            'dry_run': dry_run,
+            'created': result.created,
+            'updated': result.updated,
+            'errors': result.errors
+        }
+    except Exception as e:
+        return Response(json.dumps({'message': str(e)}), 
+                       content_type='application/json; charset=UTF-8', 
+                       status=500)
+
+
+@view_config(route_name='api_admin_room_detail', renderer='json', request_method='PUT',
+             permission='is_admin')
 def update_room(request):
     """API endpoint to update a room (admin only)."""
     try:
-        # Validate admin token
-        token = get_token_from_request(request)
-        if not token:
-            return Response(json.dumps({'message': 'Admin authentication required'}), 
-                           content_type='application/json', 
-                           status=401)
-        
         # Get room ID from URL
         room_id = request.matchdict['id']
         
@@ -390,17 +467,11 @@ def update_room(request):
                        status=500)
 
 
-@view_config(route_name='api_admin_room_detail', renderer='json', request_method='DELETE')
+@view_config(route_name='api_admin_room_detail', renderer='json', request_method='DELETE',
+             permission='is_admin')
 def delete_room(request):
     """API endpoint to delete a room (admin only)."""
     try:
-        # Validate admin token
-        token = get_token_from_request(request)
-        if not token:
-            return Response(json.dumps({'message': 'Admin authentication required'}), 
-                           content_type='application/json', 
-                           status=401)
-        
         # Get room ID from URL
         room_id = request.matchdict.get('id')
         if not room_id:
@@ -416,8 +487,10 @@ def delete_room(request):
                            status=404)
         
         # Check if room has bookings
-        bookings = request.dbsession.query(models.Booking).filter(models.Booking.room_id == room_id).count()
-        if bookings > 0:
+        has_bookings = request.dbsession.query(models.Booking.id).filter(
+            models.Booking.room_id == room.id
+        ).first() is not None
+        if has_bookings:
             # If room has bookings, just mark it as unavailable instead of deleting
             room.is_available = False
             room.updated_at = datetime.now()
@@ -427,7 +500,12 @@ def delete_room(request):
                 'room': room.to_dict()
             }
         else:
-            # If no bookings, delete the room
+            # If no bookings, delete the room with its rate rules and
+            # overrides (also cascaded by the database where FKs are enforced)
+            for model in (models.RateRule, models.RoomRate):
+                request.dbsession.query(model).filter(
+                    model.room_id == room.id
+                ).delete(synchronize_session=False)
             request.dbsession.delete(room)
             return {
                 'success': True,
@@ -439,22 +517,18 @@ def delete_room(request):
                        status=500)
 
 
-@view_config(route_name='api_admin_booking_update', renderer='json', request_method='PUT')
+@view_config(route_name='api_admin_booking_update', renderer='json', request_method='PUT',
+             permission='is_admin')
 def update_booking_status(request):
     """API endpoint to update a booking status (admin only)."""
     try:
-        # Validate admin token
-        token = get_token_from_request(request)
-        if not token:
-            return Response(json.dumps({'message': 'Admin authentication required'}), 
-                           content_type='application/json; charset=UTF-8', 
-                           status=401)
-        
         # Get booking ID from URL
         booking_id = request.matchdict['id']
         
         # Get booking from database with related user and room
-        booking = request.dbsession.query(models.Booking).filter(
+        booking = request.dbsession.query(models.Booking).options(
+            *models.Booking.eager_options()
+        ).filter(
             models.Booking.id == booking_id
         ).first()
         
@@ -483,41 +557,36 @@ def update_booking_status(request):
                     'message': f'Invalid status. Must be one of: {", ".join(valid_statuses)}'
                 }), content_type='application/json; charset=UTF-8', status=400)
                 
-            booking.status = new_status
-            
-        booking.updated_at = datetime.now()
+            # Only one of two concurrent changes of the status wins
+            if not set_booking_status(request.dbsession, booking, new_status):
+                return Response(json.dumps({
+                    'message': f'Booking status was changed to {booking.status} meanwhile; reload and retry'
+                }), content_type='application/json; charset=UTF-8', status=409)
+        else:
+            booking.updated_at = datetime.now()
         
         # Prepare enhanced booking data with user and room details
-        booking_data = booking.to_dict()
-        
-        # Add user name if available
-        if booking.user:
-            booking_data['user_name'] = booking.user.full_name or booking.user.username
-        
-        # Add room name if available
-        if booking.room:
-            booking_data['room_name'] = booking.room.name
+        booking_data = booking.to_dict(details=True)
             
         # Create notification if status changed to 'completed'
         if 'status' in json_body and json_body['status'] == 'completed' and old_status != 'completed':
-            # Create notification for the user
+            # Queue the user's notification; the outbox worker delivers it
+            # once this transaction has committed
             room_name = booking.room.name if booking.room else 'Room'
-            notification = models.Notification(
-                user_id=booking.user_id,
-                booking_id=booking.id,
-                title='Booking Completed',
-                message=f'Your booking for {room_name} has been marked as completed. Thank you for choosing Roomify!',
-                is_read=False
-            )
-            request.dbsession.add(notification)
+            outbox.enqueue(request.dbsession, 'booking.completed', {
+                'user_id': booking.user_id,
+                'booking_id': booking.id,
+                'title': 'Booking Completed',
+                'message': f'Your booking for {room_name} has been marked as completed. Thank you for choosing Roomify!',
+            }, outbox.channels_from_settings(request.registry.settings))
             
         # Log the status change
         try:
-            request.registry.logger.info(f"Booking #{booking.id} status changed from '{old_status}' to '{booking.status}' by admin {token.user_id}")
+            request.registry.logger.info(f"Booking #{booking.id} status changed from '{old_status}' to '{booking.status}' by admin {request.identity.user_id}")
         except AttributeError:
             import logging
             log = logging.getLogger(__name__)
-            log.info(f"Booking #{booking.id} status changed from '{old_status}' to '{booking.status}' by admin {token.user_id}")
+            log.info(f"Booking #{booking.id} status changed from '{old_status}' to '{booking.status}' by admin {request.identity.user_id}")
         
         return {
             'success': True,
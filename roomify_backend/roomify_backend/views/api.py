@@ -2,25 +2,112 @@ from pyramid.view import view_config
 from pyramid.response import Response
 import json
 from .. import models
+from datetime import date, timedelta
+from ..availability import free_rooms, month_days, occupancy_runs, parse_month, parse_stay
+from ..conditional import make_etag, not_modified, set_validators
+from ..search import is_search, parse_search, search_rooms
 
 @view_config(route_name='api_rooms', renderer='json', request_method='GET')
 def get_rooms(request):
-    """API endpoint to get all available rooms"""
+    """API endpoint to get all available rooms, or search them when filter
+    parameters are given"""
     try:
-        # Query all available rooms
-        rooms = request.dbsession.query(models.Room).filter(
-            models.Room.is_available == True
-        ).all()
+        if is_search(request.params):
+            try:
+                criteria = parse_search(request.params)
+            except ValueError as e:
+                return Response(json.dumps({'success': False, 'message': f'Invalid search parameters: {str(e)}'}), 
+                               content_type='application/json; charset=UTF-8', 
+                               status=400)
+            
+            rooms = search_rooms(request.dbsession, criteria,
+                                 request.registry.get('amenity_index'))
+            return {'success': True, 'data': [room.to_dict() for room in rooms]}
         
-        # Convert to dict for JSON serialization
-        rooms_list = [room.to_dict() for room in rooms]
+        # Served from the pre-serialized catalog, rebuilt after room changes
+        entry = request.registry['room_catalog'].get(request.dbsession)
         
-        return {'success': True, 'data': rooms_list}
+        cached = not_modified(request, entry.etag)
+        if cached is not None:
+            return cached
+        
+        response = Response(body=entry.body, content_type='application/json', charset='UTF-8')
+        return set_validators(response, entry.etag)
     except Exception as e:
         return Response(json.dumps({'success': False, 'message': str(e)}), 
                        content_type='application/json', 
                        status=500)
 
+@view_config(route_name='api_rooms_availability', renderer='json', request_method='GET')
+def get_available_rooms(request):
+    """API endpoint to get the rooms free for every night of a stay"""
+    try:
+        try:
+            check_in, check_out = parse_stay(request.params.get('check_in'),
+                                             request.params.get('check_out'))
+        except ValueError as e:
+            return Response(json.dumps({'success': False, 'message': f'Invalid dates (use YYYY-MM-DD): {str(e)}'}), 
+                           content_type='application/json; charset=UTF-8', 
+                           status=400)
+        
+        rooms = free_rooms(request.dbsession, check_in, check_out)
+        
+        return {
+            'success': True,
+            'check_in': check_in.isoformat(),
+            'check_out': check_out.isoformat(),
+            'data': [room.to_dict() for room in rooms]
+        }
+    except Exception as e:
+        return Response(json.dumps({'success': False, 'message': str(e)}), 
+                       content_type='application/json; charset=UTF-8', 
+                       status=500)
+
+@view_config(route_name='api_room_calendar', renderer='json', request_method='GET')
+def get_room_calendar(request):
+    """API endpoint to get the booked days of a room, month by month.
+
+    Each month carries ``occupancy``, one character per day ('1' when the
+    night is booked), and ``booked``, the same days run-length encoded as
+    ``[first_day, length]`` pairs.
+    """
+    try:
+        try:
+            room_id = int(request.matchdict['id'])
+            month = request.params.get('month')
+            first = parse_month(month) if month else date.today().replace(day=1)
+            count = int(request.params.get('months', 1))
+            if not 1 <= count <= 12:
+                raise ValueError('months must be between 1 and 12')
+        except ValueError as e:
+            return Response(json.dumps({'success': False, 'message': f'Invalid calendar request (month is YYYY-MM): {str(e)}'}), 
+                           content_type='application/json; charset=UTF-8', 
+                           status=400)
+        
+        if request.dbsession.get(models.Room, room_id) is None:
+            return Response(json.dumps({'success': False, 'message': 'Room not found'}), 
+                           content_type='application/json; charset=UTF-8', 
+                           status=404)
+        
+        occupancy = request.registry['occupancy']
+        months = []
+        for _ in range(count):
+            days = month_days(first)
+            bits = occupancy.month(request.dbsession, room_id, first)
+            months.append({
+                'month': first.strftime('%Y-%m'),
+                'days': days,
+                'occupancy': format(bits, '0%db' % days)[::-1],
+                'booked': occupancy_runs(bits, days)
+            })
+            first += timedelta(days=days)
+        
+        return {'success': True, 'room_id': room_id, 'months': months}
+    except Exception as e:
+        return Response(json.dumps({'success': False, 'message': str(e)}), 
+                       content_type='application/json; charset=UTF-8', 
+                       status=500)
+
 @view_config(route_name='api_room', renderer='json', request_method='GET')
 def get_room(request):
     """API endpoint to get a room by ID"""
@@ -37,36 +124,21 @@ def get_room(request):
                            content_type='application/json', 
                            status=404)
         
+        cached = not_modified(request, make_etag(room.id, room.updated_at), room.updated_at)
+        if cached is not None:
+            return cached
+        
         return {'success': True, 'data': room.to_dict()}
     except Exception as e:
         return Response(json.dumps({'success': False, 'message': str(e)}), 
                        content_type='application/json', 
                        status=500)
 
-@view_config(route_name='api_room_create', renderer='json', request_method='POST')
+@view_config(route_name='api_room_create', renderer='json', request_method='POST',
+             permission='is_admin')
 def create_room(request):
     """API endpoint to create a new room (admin only)"""
     try:
-        # Validate admin token
-        auth_header = request.headers.get('Authorization', '')
-        if not auth_header.startswith('Bearer '):
-            return Response(json.dumps({'message': 'Admin authentication required'}), 
-                           content_type='application/json', 
-                           status=401)
-        
-        token_str = auth_header.split(' ')[1]
-        
-        # Validate token is admin
-        token = request.dbsession.query(models.Token).filter(
-            models.Token.token == token_str,
-            models.Token.is_admin == True
-        ).first()
-        
-        if not token or not token.is_valid():
-            return Response(json.dumps({'message': 'Admin authentication required'}), 
-                           content_type='application/json', 
-                           status=401)
-        
         # Get JSON data from request body
         json_body = request.json_body
         name = json_body.get('name')
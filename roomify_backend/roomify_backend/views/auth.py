@@ -3,6 +3,7 @@ from pyramid.response import Response
 import json
 from datetime import datetime
 from .. import models
+from ..security import get_bearer_token, issue_token, revoke_token
 
 @view_config(route_name='api_register', renderer='json', request_method='POST')
 def register(request):
@@ -86,12 +87,11 @@ def login(request):
                            status=401)
         
         # Generate token
-        token = models.Token.create_token(user.id, is_admin=user.is_admin)
-        request.dbsession.add(token)
+        token = issue_token(request, user)
         
         return {
             'success': True, 
-            'token': token.token, 
+            'token': token, 
             'user': {
                 'id': user.id,
                 'username': user.username,
@@ -104,33 +104,13 @@ def login(request):
                        content_type='application/json; charset=UTF-8', 
                        status=500)
 
-@view_config(route_name='api_profile', renderer='json', request_method='GET')
+@view_config(route_name='api_profile', renderer='json', request_method='GET',
+             permission='authenticated')
 def profile(request):
     """API endpoint to get user profile"""
     try:
-        # Get token from Authorization header
-        auth_header = request.headers.get('Authorization', '')
-        if not auth_header.startswith('Bearer '):
-            return Response(json.dumps({'message': 'Invalid authorization header'}), 
-                           content_type='application/json; charset=UTF-8', 
-                           status=401)
-        
-        token_str = auth_header.split(' ')[1]
-        
-        # Validate token
-        token = request.dbsession.query(models.Token).filter(
-            models.Token.token == token_str
-        ).first()
-        
-        if not token or not token.is_valid():
-            return Response(json.dumps({'message': 'Invalid or expired token'}), 
-                           content_type='application/json; charset=UTF-8', 
-                           status=401)
-        
-        # Get user from token
-        user = request.dbsession.query(models.User).filter(
-            models.User.id == token.user_id
-        ).first()
+        # User was loaded together with the token by the security policy
+        user = request.identity.user
         
         if not user:
             return Response(json.dumps({'message': 'User not found'}), 
@@ -144,36 +124,37 @@ def profile(request):
                        content_type='application/json; charset=UTF-8', 
                        status=500)
 
-# Admin login endpoint is now in admin.py
-# This was removed to avoid route conflicts
-
-@view_config(route_name='api_update_profile', renderer='json', request_method='PUT')
-def update_profile(request):
-    """API endpoint to update user profile"""
+@view_config(route_name='api_logout', renderer='json', request_method='POST')
+def logout(request):
+    """API endpoint to revoke the current token"""
     try:
-        # Get token from Authorization header
-        auth_header = request.headers.get('Authorization', '')
-        if not auth_header.startswith('Bearer '):
+        token_str = get_bearer_token(request)
+        if not token_str:
             return Response(json.dumps({'message': 'Invalid authorization header'}), 
                            content_type='application/json; charset=UTF-8', 
                            status=401)
         
-        token_str = auth_header.split(' ')[1]
-        
-        # Validate token
-        token = request.dbsession.query(models.Token).filter(
-            models.Token.token == token_str
-        ).first()
-        
-        if not token or not token.is_valid():
+        if not revoke_token(request, token_str):
             return Response(json.dumps({'message': 'Invalid or expired token'}), 
                            content_type='application/json; charset=UTF-8', 
                            status=401)
         
-        # Get user from token
-        user = request.dbsession.query(models.User).filter(
-            models.User.id == token.user_id
-        ).first()
+        return {'success': True, 'message': 'Logged out successfully'}
+    except Exception as e:
+        return Response(json.dumps({'message': str(e)}), 
+                       content_type='application/json; charset=UTF-8', 
+                       status=500)
+
+# Admin login endpoint is now in admin.py
+# This was removed to avoid route conflicts
+
+@view_config(route_name='api_update_profile', renderer='json', request_method='PUT',
+             permission='authenticated')
+def update_profile(request):
+    """API endpoint to update user profile"""
+    try:
+        # User was loaded together with the token by the security policy
+        user = request.identity.user
         
         if not user:
             return Response(json.dumps({'message': 'User not found'}), 
@@ -3,30 +3,13 @@ from pyramid.response import Response
 import json
 from datetime import datetime
 from .. import models
+from ..availability import find_conflict, lock_room
 
-@view_config(route_name='api_bookings', renderer='json', request_method='POST')
+@view_config(route_name='api_bookings', renderer='json', request_method='POST',
+             permission='authenticated')
 def create_booking(request):
     """API endpoint to create a new booking"""
     try:
-        # Get token from Authorization header
-        auth_header = request.headers.get('Authorization', '')
-        if not auth_header.startswith('Bearer '):
-            return Response(json.dumps({'message': 'Authentication required'}), 
-                           content_type='application/json; charset=UTF-8', 
-                           status=401)
-        
-        token_str = auth_header.split(' ')[1]
-        
-        # Validate token
-        token = request.dbsession.query(models.Token).filter(
-            models.Token.token == token_str
-        ).first()
-        
-        if not token or not token.is_valid():
-            return Response(json.dumps({'message': 'Invalid or expired token'}), 
-                           content_type='application/json; charset=UTF-8', 
-                           status=401)
-            
         # Get JSON data from request body
         json_body = request.json_body
         room_id = json_body.get('room_id')
@@ -72,14 +55,33 @@ def create_booking(request):
                            content_type='application/json; charset=UTF-8',
                            status=400)
         
-        # Create booking
+        if check_out_date <= check_in_date:
+            return Response(json.dumps({'message': 'Check-out date must be after check-in date'}),
+                           content_type='application/json; charset=UTF-8',
+                           status=400)
+        
+        # Serialize bookings for this room until our transaction ends, then
+        # check for overlapping bookings under the lock
+        room = lock_room(request, room.id)
+        if room is None:
+            return Response(json.dumps({'message': 'Room is busy, please try again'}),
+                           content_type='application/json; charset=UTF-8',
+                           status=409)
+        
+        if find_conflict(request.dbsession, room.id, check_in_date, check_out_date):
+            return Response(json.dumps({'message': 'Room is already booked for the selected dates'}),
+                           content_type='application/json; charset=UTF-8',
+                           status=409)
+        
+        # Create booking, priced by the server rather than trusting the client
         new_booking = models.Booking(
-            user_id=token.user_id,
+            user_id=request.identity.user_id,
             room_id=room_id,
             check_in_date=check_in_date,
             check_out_date=check_out_date,
             guests=guests,
-            total_price=json_body.get('total_price', room.price_per_night),
+            total_price=request.registry['pricing'].total(
+                request.dbsession, room, check_in_date, check_out_date),
             status='pending',
             special_requests=json_body.get('special_requests', '')
         )
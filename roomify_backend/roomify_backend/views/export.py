@@ -0,0 +1,36 @@
+from pyramid.view import view_config
+from pyramid.response import Response
+import json
+from ..availability import parse_date
+from ..export import FORMATS, build_export, iter_export, parse_statuses
+
+@view_config(route_name='api_admin_export', request_method='GET', permission='is_admin')
+def export_data(request):
+    """API endpoint to download bookings or users as CSV or NDJSON (admin only).
+
+    Filters: ``from`` / ``to`` (creation dates, ``to`` exclusive) and, for
+    bookings, ``status`` (comma-separated).
+    """
+    try:
+        try:
+            kind = request.matchdict['kind']
+            fmt = request.params.get('format', 'csv')
+            start = parse_date(request.params['from']) if request.params.get('from') else None
+            end = parse_date(request.params['to']) if request.params.get('to') else None
+            stmt = build_export(kind, start, end, parse_statuses(request.params.get('status')))
+            chunks = iter_export(request.registry['dbsession_factory'], stmt, fmt)
+        except ValueError as e:
+            return Response(json.dumps({'success': False, 'message': f'Invalid export request: {str(e)}'}), 
+                           content_type='application/json; charset=UTF-8', 
+                           status=400)
+        
+        return Response(
+            app_iter=chunks,
+            content_type=FORMATS[fmt],
+            charset='UTF-8',
+            content_disposition=f'attachment; filename="{kind}.{fmt}"'
+        )
+    except Exception as e:
+        return Response(json.dumps({'success': False, 'message': str(e)}), 
+                       content_type='application/json; charset=UTF-8', 
+                       status=500)
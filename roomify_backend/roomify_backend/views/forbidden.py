@@ -0,0 +1,13 @@
+from pyramid.response import Response
+from pyramid.view import forbidden_view_config
+import json
+
+
+@forbidden_view_config()
+def forbidden_view(request):
+    """Render failed permission checks as JSON 401 responses."""
+    result = getattr(request.exception, 'result', None)
+    message = getattr(result, 'msg', None) or 'Authentication required'
+    return Response(json.dumps({'message': message}), 
+                   content_type='application/json; charset=UTF-8', 
+                   status=401)
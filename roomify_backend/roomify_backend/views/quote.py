@@ -0,0 +1,28 @@
+from pyramid.view import view_config
+from pyramid.response import Response
+import json
+from ..pricing import parse_quote_request
+
+@view_config(route_name='api_quotes', renderer='json', request_method='POST')
+def get_quotes(request):
+    """API endpoint to price many rooms for many stays in one call"""
+    try:
+        try:
+            room_ids, stays = parse_quote_request(request.json_body)
+        except (ValueError, TypeError, AttributeError) as e:
+            return Response(json.dumps({'success': False, 'message': f'Invalid quote request: {str(e)}'}),
+                           content_type='application/json; charset=UTF-8',
+                           status=400)
+        
+        quotes, missing = request.registry['pricing'].quote_many(
+            request.dbsession, room_ids, stays)
+        
+        return {
+            'success': True,
+            'quotes': quotes,
+            'missing_room_ids': missing
+        }
+    except Exception as e:
+        return Response(json.dumps({'success': False, 'message': str(e)}),
+                       content_type='application/json; charset=UTF-8',
+                       status=500)
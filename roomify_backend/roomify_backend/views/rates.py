@@ -0,0 +1,215 @@
+from pyramid.view import view_config
+from pyramid.response import Response
+import json
+from datetime import timedelta
+
+from .. import models
+from ..availability import parse_date, parse_stay
+from ..pricing import apply_rate_rule
+
+MAX_CALENDAR_DAYS = 366
+
+
+@view_config(route_name='api_admin_rate_rules', renderer='json', request_method='GET',
+             permission='is_admin')
+def get_rate_rules(request):
+    """API endpoint to list rate rules, optionally for one room (admin only)"""
+    try:
+        query = request.dbsession.query(models.RateRule)
+        room_id = request.params.get('room_id')
+        if room_id:
+            query = query.filter(models.RateRule.room_id == int(room_id))
+        rules = query.order_by(models.RateRule.priority.desc(), models.RateRule.id).all()
+        return [rule.to_dict() for rule in rules]
+    except ValueError:
+        return Response(json.dumps({'success': False, 'message': 'room_id must be an integer'}),
+                        content_type='application/json; charset=UTF-8',
+                        status=400)
+    except Exception as e:
+        return Response(json.dumps({'success': False, 'message': str(e)}),
+                        content_type='application/json; charset=UTF-8',
+                        status=500)
+
+
+@view_config(route_name='api_admin_rate_rules', renderer='json', request_method='POST',
+             permission='is_admin')
+def create_rate_rule(request):
+    """API endpoint to create a rate rule (admin only)"""
+    try:
+        rule = models.RateRule(priority=0)
+        try:
+            apply_rate_rule(rule, request.json_body)
+        except (ValueError, TypeError, AttributeError) as e:
+            return Response(json.dumps({'success': False, 'message': f'Invalid rate rule: {str(e)}'}),
+                            content_type='application/json; charset=UTF-8',
+                            status=400)
+        
+        if rule.room_id is not None and request.dbsession.get(models.Room, rule.room_id) is None:
+            return Response(json.dumps({'success': False, 'message': 'Room not found'}),
+                            content_type='application/json; charset=UTF-8',
+                            status=404)
+        
+        request.dbsession.add(rule)
+        request.dbsession.flush()
+        
+        request.response.status = 201
+        return rule.to_dict()
+    except Exception as e:
+        return Response(json.dumps({'success': False, 'message': str(e)}),
+                        content_type='application/json; charset=UTF-8',
+                        status=500)
+
+
+@view_config(route_name='api_admin_rate_rule_detail', renderer='json', request_method='PUT',
+             permission='is_admin')
+def update_rate_rule(request):
+    """API endpoint to update a rate rule (admin only)"""
+    try:
+        rule = request.dbsession.get(models.RateRule, int(request.matchdict['id']))
+        if rule is None:
+            return Response(json.dumps({'success': False, 'message': 'Rate rule not found'}),
+                            content_type='application/json; charset=UTF-8',
+                            status=404)
+        
+        try:
+            apply_rate_rule(rule, request.json_body)
+        except (ValueError, TypeError, AttributeError) as e:
+            return Response(json.dumps({'success': False, 'message': f'Invalid rate rule: {str(e)}'}),
+                            content_type='application/json; charset=UTF-8',
+                            status=400)
+        
+        if rule.room_id is not None and request.dbsession.get(models.Room, rule.room_id) is None:
+            return Response(json.dumps({'success': False, 'message': 'Room not found'}),
+                            content_type='application/json; charset=UTF-8',
+                            status=404)
+        
+        request.dbsession.flush()
+        return rule.to_dict()
+    except Exception as e:
+        return Response(json.dumps({'success': False, 'message': str(e)}),
+                        content_type='application/json; charset=UTF-8',
+                        status=500)
+
+
+@view_config(route_name='api_admin_rate_rule_detail', renderer='json', request_method='DELETE',
+             permission='is_admin')
+def delete_rate_rule(request):
+    """API endpoint to delete a rate rule (admin only)"""
+    try:
+        rule = request.dbsession.get(models.RateRule, int(request.matchdict['id']))
+        if rule is None:
+            return Response(json.dumps({'success': False, 'message': 'Rate rule not found'}),
+                            content_type='application/json; charset=UTF-8',
+                            status=404)
+        
+        request.dbsession.delete(rule)
+        return {'success': True, 'message': 'Rate rule deleted successfully'}
+    except Exception as e:
+        return Response(json.dumps({'success': False, 'message': str(e)}),
+                        content_type='application/json; charset=UTF-8',
+                        status=500)
+
+
+@view_config(route_name='api_admin_room_rates', renderer='json', request_method='GET',
+             permission='is_admin')
+def get_room_rates(request):
+    """API endpoint to show a room's effective nightly rates and its
+    per-date overrides between ``from`` and ``to`` (admin only)"""
+    try:
+        room = request.dbsession.get(models.Room, int(request.matchdict['id']))
+        if room is None:
+            return Response(json.dumps({'success': False, 'message': 'Room not found'}),
+                            content_type='application/json; charset=UTF-8',
+                            status=404)
+        
+        try:
+            first = parse_date(request.params.get('from')) if request.params.get('from') else None
+            first = first or request.registry['pricing'].calendar.today()
+            last = request.params.get('to') or (first + timedelta(days=30)).isoformat()
+            first, last = parse_stay(first, last)
+        except ValueError as e:
+            return Response(json.dumps({'success': False, 'message': f'Invalid date range: {str(e)}'}),
+                            content_type='application/json; charset=UTF-8',
+                            status=400)
+        if (last - first).days > MAX_CALENDAR_DAYS:
+            return Response(json.dumps({'success': False, 'message': 'at most %d days per request' % MAX_CALENDAR_DAYS}),
+                            content_type='application/json; charset=UTF-8',
+                            status=400)
+        
+        rates = request.registry['pricing'].calendar.rates(request.dbsession, room, first, last)
+        overrides = request.dbsession.query(models.RoomRate).filter(
+            models.RoomRate.room_id == room.id,
+            models.RoomRate.date >= first,
+            models.RoomRate.date < last,
+        ).order_by(models.RoomRate.date).all()
+        
+        return {
+            'room_id': room.id,
+            'base_price': room.price_per_night,
+            'from': first.isoformat(),
+            'to': last.isoformat(),
+            'rates': [{'date': (first + timedelta(days=i)).isoformat(), 'price': rate}
+                      for i, rate in enumerate(rates)],
+            'overrides': [rate.to_dict() for rate in overrides]
+        }
+    except Exception as e:
+        return Response(json.dumps({'success': False, 'message': str(e)}),
+                        content_type='application/json; charset=UTF-8',
+                        status=500)
+
+
+@view_config(route_name='api_admin_room_rates', renderer='json', request_method='PUT',
+             permission='is_admin')
+def set_room_rates(request):
+    """API endpoint to set or clear per-date price overrides of a room
+    (admin only).  Body: ``{"rates": [{"date": "YYYY-MM-DD", "price": 120}]}``;
+    a null price removes the override."""
+    try:
+        room = request.dbsession.get(models.Room, int(request.matchdict['id']))
+        if room is None:
+            return Response(json.dumps({'success': False, 'message': 'Room not found'}),
+                            content_type='application/json; charset=UTF-8',
+                            status=404)
+        
+        try:
+            prices = {}
+            for item in request.json_body['rates']:
+                price = item.get('price')
+                if price is not None:
+                    price = float(price)
+                    if price < 0:
+                        raise ValueError('price must not be negative')
+                prices[parse_date(item['date'])] = price
+        except (ValueError, TypeError, KeyError, AttributeError) as e:
+            return Response(json.dumps({'success': False, 'message': f'Invalid rates: {str(e)}'}),
+                            content_type='application/json; charset=UTF-8',
+                            status=400)
+        if len(prices) > MAX_CALENDAR_DAYS:
+            return Response(json.dumps({'success': False, 'message': 'at most %d dates per request' % MAX_CALENDAR_DAYS}),
+                            content_type='application/json; charset=UTF-8',
+                            status=400)
+        
+        existing = {rate.date: rate for rate in request.dbsession.query(models.RoomRate).filter(
+            models.RoomRate.room_id == room.id,
+            models.RoomRate.date.in_(list(prices)),
+        )}
+        for night, price in prices.items():
+            rate = existing.get(night)
+            if price is None:
+                if rate is not None:
+                    request.dbsession.delete(rate)
+            elif rate is None:
+                request.dbsession.add(models.RoomRate(room_id=room.id, date=night, price=price))
+            else:
+                rate.price = price
+        
+        return {
+            'success': True,
+            'updated': sum(1 for price in prices.values() if price is not None),
+            'removed': sum(1 for night, price in prices.items()
+                           if price is None and night in existing)
+        }
+    except Exception as e:
+        return Response(json.dumps({'success': False, 'message': str(e)}),
+                        content_type='application/json; charset=UTF-8',
+                        status=500)
@@ -5,11 +5,11 @@ import os
 import uuid
 import shutil
 import logging
-from .. import models
 
 log = logging.getLogger(__name__)
 
-@view_config(route_name='api_upload_image', renderer='json', request_method='POST')
+@view_config(route_name='api_upload_image', renderer='json', request_method='POST',
+             permission='authenticated')
 def upload_image(request):
     """API endpoint to upload an image"""
     # Jika ini adalah preflight OPTIONS request, tangani dengan benar
@@ -26,35 +26,7 @@ def upload_image(request):
     try:
         log.info("Upload image request received")
         
-        # Validate admin token
-        auth_header = request.headers.get('Authorization', '')
-        if not auth_header.startswith('Bearer '):
-            log.warning("Authentication required - no Bearer token")
-            return Response(json.dumps({'message': 'Authentication required'}), 
-                          content_type='application/json; charset=UTF-8', 
-                          status=401)
-        
-        token_str = auth_header.split(' ')[1]
-        log.info(f"Token received: {token_str[:5]}...")
-        
-        # Validate token
-        token = request.dbsession.query(models.Token).filter(
-            models.Token.token == token_str
-        ).first()
-        
-        if not token:
-            log.warning(f"Token not found in database")
-            return Response(json.dumps({'message': 'Invalid or expired token'}), 
-                          content_type='application/json; charset=UTF-8', 
-                          status=401)
-        
-        if not token.is_valid():
-            log.warning(f"Token expired for user_id {token.user_id}")
-            return Response(json.dumps({'message': 'Invalid or expired token'}), 
-                          content_type='application/json; charset=UTF-8', 
-                          status=401)
-        
-        log.info(f"Token valid for user_id {token.user_id}")
+        log.info(f"Token valid for user_id {request.identity.user_id}")
         
         # Get file from request
         if 'file' not in request.POST:
@@ -1,58 +1,69 @@
 from pyramid.view import view_config
 from pyramid.response import Response
 import json
-from sqlalchemy import desc
-from .. import models
+from sqlalchemy import case, desc, func
+from .. import models, stats
+from ..notifications import RETRY_MS, EventStream, iter_events, parse_last_event_id
+from ..security import resolve_token
+from ..conditional import make_etag, not_modified
+from ..pagination import page_params, paginate
 
-@view_config(route_name='api_user_bookings', renderer='json', request_method='GET')
+@view_config(route_name='api_user_bookings', renderer='json', request_method='GET',
+             permission='authenticated')
 def get_user_bookings(request):
     """API endpoint to get user bookings"""
     try:
-        # Get token from Authorization header
-        auth_header = request.headers.get('Authorization', '')
-        if not auth_header.startswith('Bearer '):
-            return Response(json.dumps({'message': 'Authentication required'}), 
-                           content_type='application/json; charset=UTF-8', 
-                           status=401)
-        
-        token_str = auth_header.split(' ')[1]
-        
-        # Validate token
-        token = request.dbsession.query(models.Token).filter(
-            models.Token.token == token_str
-        ).first()
+        try:
+            page = page_params(request)
+        except ValueError as e:
+            return Response(json.dumps({'message': f'Invalid pagination parameters: {str(e)}'}),
+                           content_type='application/json; charset=UTF-8',
+                           status=400)
         
-        if not token or not token.is_valid():
-            return Response(json.dumps({'message': 'Invalid or expired token'}), 
-                           content_type='application/json; charset=UTF-8', 
-                           status=401)
+        # ETag and statistics from one aggregate over the bookings and their
+        # rooms; each booking also embeds the user's own fields
+        count, completed_count, bookings_changed, rooms_changed, user_changed = request.dbsession.query(
+            func.count(models.Booking.id),
+            func.sum(case((models.Booking.status == 'completed', 1), else_=0)),
+            func.max(models.Booking.updated_at),
+            func.max(models.Room.updated_at),
+            request.dbsession.query(models.User.updated_at).filter(
+                models.User.id == request.identity.user_id
+            ).scalar_subquery()
+        ).outerjoin(models.Room, models.Room.id == models.Booking.room_id).filter(
+            models.Booking.user_id == request.identity.user_id
+        ).one()
+        cached = not_modified(request,
+                              make_etag(request.identity.user_id, count, bookings_changed,
+                                        rooms_changed, user_changed))
+        if cached is not None:
+            return cached
         
         # Get bookings for this user
-        bookings = request.dbsession.query(models.Booking).filter(
-            models.Booking.user_id == token.user_id
-        ).order_by(desc(models.Booking.created_at)).all()
+        query = request.dbsession.query(models.Booking).options(
+            *models.Booking.eager_options()
+        ).filter(
+            models.Booking.user_id == request.identity.user_id
+        )
+        next_cursor = None
+        if page:
+            bookings, next_cursor = paginate(query, models.Booking, *page)
+        else:
+            bookings = query.order_by(desc(models.Booking.created_at)).all()
         
         # Prepare response with enhanced booking data
-        result = []
-        for booking in bookings:
-            booking_data = booking.to_dict()
-            # Add room name if available
-            if booking.room:
-                booking_data['room_name'] = booking.room.name
-                booking_data['room_image'] = booking.room.image_url
-            result.append(booking_data)
-        
-        # Get booking statistics
-        total_bookings = len(bookings)
-        completed_bookings = sum(1 for booking in bookings if booking.status == 'completed')
+        result = [booking.to_dict(details=True) for booking in bookings]
         
-        return {
+        response = {
             'bookings': result,
             'stats': {
-                'total_bookings': total_bookings,
-                'completed_bookings': completed_bookings
+                'total_bookings': count,
+                'completed_bookings': completed_count or 0
             }
         }
+        if page:
+            response['next_cursor'] = next_cursor
+        return response
     except Exception as e:
         # Log the error for server-side debugging
         try:
@@ -66,43 +77,40 @@ def get_user_bookings(request):
                        content_type='application/json; charset=UTF-8',
                        status=500)
 
-@view_config(route_name='api_user_notifications', renderer='json', request_method='GET')
+@view_config(route_name='api_user_notifications', renderer='json', request_method='GET',
+             permission='authenticated')
 def get_user_notifications(request):
     """API endpoint to get user notifications"""
     try:
-        # Get token from Authorization header
-        auth_header = request.headers.get('Authorization', '')
-        if not auth_header.startswith('Bearer '):
-            return Response(json.dumps({'message': 'Authentication required'}), 
-                           content_type='application/json; charset=UTF-8', 
-                           status=401)
-        
-        token_str = auth_header.split(' ')[1]
-        
-        # Validate token
-        token = request.dbsession.query(models.Token).filter(
-            models.Token.token == token_str
-        ).first()
-        
-        if not token or not token.is_valid():
-            return Response(json.dumps({'message': 'Invalid or expired token'}), 
-                           content_type='application/json; charset=UTF-8', 
-                           status=401)
+        try:
+            page = page_params(request)
+        except ValueError as e:
+            return Response(json.dumps({'message': f'Invalid pagination parameters: {str(e)}'}),
+                           content_type='application/json; charset=UTF-8',
+                           status=400)
         
         # Get notifications for this user
-        notifications = request.dbsession.query(models.Notification).filter(
-            models.Notification.user_id == token.user_id
-        ).order_by(desc(models.Notification.created_at)).all()
+        query = request.dbsession.query(models.Notification).filter(
+            models.Notification.user_id == request.identity.user_id
+        )
         
-        # Convert to dict for JSON response
-        result = [notification.to_dict() for notification in notifications]
+        if not page:
+            notifications = query.order_by(desc(models.Notification.created_at)).all()
+            
+            # Convert to dict for JSON response
+            result = [notification.to_dict() for notification in notifications]
+            
+            return {
+                'notifications': result,
+                'unread_count': stats.unread_count(request.dbsession, request.identity.user_id)
+            }
         
-        # Count unread notifications
-        unread_count = sum(1 for notification in notifications if not notification.is_read)
+        notifications, next_cursor = paginate(query, models.Notification, *page)
         
         return {
-            'notifications': result,
-            'unread_count': unread_count
+            'notifications': [notification.to_dict() for notification in notifications],
+            'unread_count': stats.unread_count(request.dbsession, request.identity.user_id),
+            'next_cursor': next_cursor
         }
     except Exception as e:
         # Log the error for server-side debugging
@@ -117,52 +125,29 @@ def get_user_notifications(request):
                        content_type='application/json; charset=UTF-8',
                        status=500)
 
-@view_config(route_name='api_user_notification_read', renderer='json', request_method='PUT')
+@view_config(route_name='api_user_notification_read', renderer='json', request_method='PUT',
+             permission='authenticated')
 def mark_notification_read(request):
     """API endpoint to mark a notification as read"""
     try:
         # Get notification ID from URL
         notification_id = request.matchdict.get('id')
         
-        # Get token from Authorization header
-        auth_header = request.headers.get('Authorization', '')
-        if not auth_header.startswith('Bearer '):
-            return Response(json.dumps({'message': 'Authentication required'}), 
-                           content_type='application/json; charset=UTF-8', 
-                           status=401)
-        
-        token_str = auth_header.split(' ')[1]
-        
-        # Validate token
-        token = request.dbsession.query(models.Token).filter(
-            models.Token.token == token_str
-        ).first()
-        
-        if not token or not token.is_valid():
-            return Response(json.dumps({'message': 'Invalid or expired token'}), 
-                           content_type='application/json; charset=UTF-8', 
-                           status=401)
-        
-        # Get notification and verify it belongs to this user
-        notification = request.dbsession.query(models.Notification).filter(
+        # Verify the notification exists and belongs to this user
+        notification_id = request.dbsession.query(models.Notification.id).filter(
             models.Notification.id == notification_id,
-            models.Notification.user_id == token.user_id
-        ).first()
+            models.Notification.user_id == request.identity.user_id
+        ).scalar()
         
-        if not notification:
+        if notification_id is None:
             return Response(json.dumps({'message': 'Notification not found or not authorized'}), 
                            content_type='application/json; charset=UTF-8', 
                            status=404)
         
-        # Mark as read
-        notification.is_read = True
-        request.dbsession.add(notification)
-        
-        # Get updated unread count
-        unread_count = request.dbsession.query(models.Notification).filter(
-            models.Notification.user_id == token.user_id,
-            models.Notification.is_read == False
-        ).count()
+        # Mark as read with the conditional UPDATE of mark-all, so a
+        # concurrent mark only lowers the counter once
+        stats.mark_read(request.dbsession, request.identity.user_id, [notification_id])
+        unread_count = stats.unread_count(request.dbsession, request.identity.user_id)
         
         return {
             'success': True,
@@ -181,3 +166,104 @@ def mark_notification_read(request):
         return Response(json.dumps({'message': f'An error occurred: {str(e)}'}),
                        content_type='application/json; charset=UTF-8',
                        status=500)
+
+@view_config(route_name='api_user_notifications_read', renderer='json', request_method='PUT',
+             permission='authenticated')
+def mark_notifications_read(request):
+    """API endpoint to mark all notifications, or those in ``ids``, as read"""
+    try:
+        try:
+            json_body = request.json_body if request.body else {}
+        except ValueError:
+            return Response(json.dumps({'message': 'Invalid JSON body'}),
+                           content_type='application/json; charset=UTF-8',
+                           status=400)
+        
+        ids = json_body.get('ids') if isinstance(json_body, dict) else None
+        if ids is not None:
+            if not isinstance(ids, list) or not all(
+                    isinstance(i, int) and not isinstance(i, bool) for i in ids):
+                return Response(json.dumps({'message': 'ids must be a list of notification ids'}),
+                               content_type='application/json; charset=UTF-8',
+                               status=400)
+        
+        # One UPDATE over the user's unread notifications; ids of other
+        # users' notifications simply match nothing
+        marked = stats.mark_read(request.dbsession, request.identity.user_id, ids)
+        
+        return {
+            'success': True,
+            'message': f'{marked} notifications marked as read',
+            'marked': marked,
+            'unread_count': stats.unread_count(request.dbsession, request.identity.user_id)
+        }
+    except Exception as e:
+        # Log the error for server-side debugging
+        try:
+            request.registry.logger.error(f"Error marking notifications as read: {str(e)}")
+        except AttributeError:
+            import logging
+            log = logging.getLogger(__name__)
+            log.error(f"Error marking notifications as read: {str(e)}")
+            
+        return Response(json.dumps({'message': f'An error occurred: {str(e)}'}),
+                       content_type='application/json; charset=UTF-8',
+                       status=500)
+
+@view_config(route_name='api_user_notifications_unread', renderer='json', request_method='GET',
+             permission='authenticated')
+def get_unread_count(request):
+    """API endpoint for the unread-notification badge"""
+    try:
+        return {
+            'unread_count': stats.unread_count(request.dbsession, request.identity.user_id)
+        }
+    except Exception as e:
+        # Log the error for server-side debugging
+        try:
+            request.registry.logger.error(f"Error getting unread count: {str(e)}")
+        except AttributeError:
+            import logging
+            log = logging.getLogger(__name__)
+            log.error(f"Error getting unread count: {str(e)}")
+            
+        return Response(json.dumps({'message': f'An error occurred: {str(e)}'}),
+                       content_type='application/json; charset=UTF-8',
+                       status=500)
+
+@view_config(route_name='api_user_notifications_stream', request_method='GET')
+def stream_notifications(request):
+    """Server-sent event stream of the user's new notifications.
+
+    ``EventSource`` cannot send an ``Authorization`` header, so the token
+    may be passed as ``?token=`` instead.
+    """
+    token = resolve_token(request, request.params.get('token') or None)
+    if token is None:
+        return Response(json.dumps({'message': 'Authentication required'}),
+                       content_type='application/json; charset=UTF-8',
+                       status=401)
+    try:
+        last_id = parse_last_event_id(request)
+    except ValueError:
+        return Response(json.dumps({'message': 'Invalid Last-Event-ID'}),
+                       content_type='application/json; charset=UTF-8',
+                       status=400)
+    hub = request.registry['notification_hub']
+    if not hub.open_stream():
+        response = Response(json.dumps({'message': 'Too many open notification streams',
+                                        'retry': RETRY_MS // 1000}),
+                            content_type='application/json; charset=UTF-8',
+                            status=503)
+        response.headers['Retry-After'] = str(RETRY_MS // 1000)
+        return response
+    response = Response(
+        app_iter=EventStream(hub, iter_events(request.registry['dbsession_factory'],
+                                              hub, token.user_id, last_id)),
+        content_type='text/event-stream',
+        charset='UTF-8',
+    )
+    response.cache_control = 'no-cache'
+    # Ask reverse proxies not to buffer the stream
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
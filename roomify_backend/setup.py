@@ -11,7 +11,7 @@ with open(os.path.join(here, 'CHANGES.txt')) as f:
 requires = [
     'alembic',
     'plaster_pastedeploy',
-    'pyramid >= 1.9',
+    'pyramid >= 2.0',
     'pyramid_debugtoolbar',
     'pyramid_jinja2',
     'pyramid_retry',
@@ -56,6 +56,12 @@ setup(
         ],
         'console_scripts': [
             'initialize_roomify_backend_db = roomify_backend.scripts.initialize_db:main',
+            'sweep_roomify_backend_tokens = roomify_backend.scripts.sweep_tokens:main',
+            'rebuild_roomify_backend_stats = roomify_backend.scripts.rebuild_stats:main',
+            'backfill_roomify_backend_rollups = roomify_backend.scripts.backfill_rollups:main',
+            'export_roomify_backend_data = roomify_backend.scripts.export_data:main',
+            'import_roomify_backend_rooms = roomify_backend.scripts.import_rooms:main',
+            'process_roomify_backend_outbox = roomify_backend.scripts.process_outbox:main',
         ],
     },
 )